@@ -73,12 +73,25 @@ def resume(args):
     resume_unit()
 
 
+def _list_param(name):
+    """Names listed in a space or comma separated action parameter.
+
+    :returns: The names or None if the parameter isn't set
+    :rtype: Optional[List[str]]
+    """
+    return (function_get(name) or "").replace(",", " ").split() or None
+
+
 def status(args):
     """Show hacluster status."""
     try:
+        summary = bool(function_get("summary"))
         health_status = pcmk.cluster_status(
             resources=bool(function_get("resources")),
-            history=bool(function_get("history")))
+            history=bool(function_get("history")) and not summary,
+            history_summary=summary,
+            only_nodes=_list_param("node"),
+            only_resources=_list_param("resource"))
         function_set({"result": json.dumps(health_status)})
     except subprocess.CalledProcessError as error:
         log("ERROR: Failed call to crm status. output: {}. return-code: {}"
@@ -98,7 +111,7 @@ def cleanup(args):
         cmd = ['crm', 'resource', 'cleanup', resource_name]
 
     try:
-        subprocess.check_call(cmd)
+        pcmk.check_call(cmd)
         action_set({'result': 'success'})
     except subprocess.CalledProcessError as e:
         log("ERROR: Failed call to crm resource cleanup for {}. "
@@ -202,6 +215,8 @@ def main(args):
             action(args)
         except Exception as e:
             action_fail(str(e))
+        finally:
+            pcmk.report_command_stats(action_name)
 
 
 if __name__ == "__main__":
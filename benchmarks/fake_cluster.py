@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stand-in for the Pacemaker and crmsh command line tools.
+
+The command to emulate is taken from the name the script is invoked as
+(crm, crm_mon, crm_resource, cibadmin, crm_attribute, crm_node or
+corosync-cfgtool), see install_stubs(). The cluster is backed by the XML CIB
+stored in $FAKE_CLUSTER_DIR/cib.xml: configuration commands update it and
+status commands are derived from it, every resource is reported as started
+unless it was stopped through `crm resource stop`.
+
+$FAKE_CLUSTER_CRM_LATENCY and $FAKE_CLUSTER_TOOL_LATENCY add a delay (in
+seconds) to each crm and native tool invocation respectively, to emulate the
+start up cost of crmsh compared to the Pacemaker C tools.
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+import xml.etree.ElementTree as etree
+
+CRM_VERSION = '4.3.1'
+PACEMAKER_VERSION = '2.1.2'
+# Defaults of the cluster properties the charm reads.
+PROPERTY_DEFAULTS = {
+    'maintenance-mode': 'false',
+    'stonith-enabled': 'true',
+}
+
+STUBS = ('crm', 'crm_mon', 'crm_resource', 'cibadmin', 'crm_attribute',
+         'crm_node', 'corosync-cfgtool')
+
+CONSTRAINT_TAGS = {
+    'order': 'rsc_order',
+    'colocation': 'rsc_colocation',
+    'location': 'rsc_location'}
+
+CONTAINER_TAGS = {
+    'group': 'group',
+    'clone': 'clone',
+    'ms': 'master'}
+
+
+class FakeCluster(object):
+    """CIB and resource state of the fake cluster."""
+
+    def __init__(self, root, stopped=None, state_dir=None):
+        self.root = root
+        self.stopped = set(stopped or [])
+        self.state_dir = state_dir
+
+    @classmethod
+    def load(cls, state_dir):
+        """Load the fake cluster stored in state_dir."""
+        root = etree.parse(os.path.join(state_dir, 'cib.xml')).getroot()
+        try:
+            with open(os.path.join(state_dir, 'stopped.json')) as f:
+                stopped = json.load(f)
+        except FileNotFoundError:
+            stopped = []
+        return cls(root, stopped, state_dir)
+
+    def save(self):
+        self.root.set('epoch', str(int(self.root.get('epoch', '0')) + 1))
+        cib_path = os.path.join(self.state_dir, 'cib.xml')
+        etree.ElementTree(self.root).write(cib_path + '.tmp')
+        os.rename(cib_path + '.tmp', cib_path)
+        with open(os.path.join(self.state_dir, 'stopped.json'), 'w') as f:
+            json.dump(sorted(self.stopped), f)
+
+    def section(self, name):
+        return self.root.find('configuration').find(name)
+
+    def find(self, obj_id):
+        for parent in self.root.find('configuration').iter():
+            for child in parent:
+                if child.get('id') == obj_id:
+                    return parent, child
+        return None, None
+
+    @property
+    def nodes(self):
+        return [n for n in self.section('nodes').findall('node')
+                if n.get('type') != 'remote']
+
+    @property
+    def remote_nodes(self):
+        return [n for n in self.section('nodes').findall('node')
+                if n.get('type') == 'remote']
+
+    def set_property(self, name, value):
+        _, props = self.find('cib-bootstrap-options')
+        for nvpair in props.findall('nvpair'):
+            if nvpair.get('name') == name:
+                nvpair.set('value', value)
+                return
+        etree.SubElement(props, 'nvpair', {
+            'id': 'cib-bootstrap-options-{}'.format(name),
+            'name': name,
+            'value': value})
+
+    def get_property(self, name):
+        _, props = self.find('cib-bootstrap-options')
+        for nvpair in props.findall('nvpair'):
+            if nvpair.get('name') == name:
+                return nvpair.get('value')
+        return None
+
+    def apply(self, directive):
+        """Apply a crm configure directive, replacing any existing object."""
+        args = directive.split()
+        obj_type, obj_id = args[0], args[1]
+        if obj_type == 'primitive':
+            element = etree.Element('primitive', {'id': obj_id})
+            agent = args[2].split(':')
+            element.set('type', agent[-1])
+            element.set('class', agent[0])
+            if len(agent) == 3:
+                element.set('provider', agent[1])
+            section = self.section('resources')
+        elif obj_type in CONTAINER_TAGS:
+            element = etree.Element(CONTAINER_TAGS[obj_type], {'id': obj_id})
+            members = [a for a in args[2:] if a != 'meta' and '=' not in a]
+            if obj_type != 'group':
+                members = members[:1]
+            for member in members:
+                parent, child = self.find(member)
+                if child is not None:
+                    parent.remove(child)
+                    element.append(child)
+            section = self.section('resources')
+        elif obj_type in CONSTRAINT_TAGS:
+            element = etree.Element(CONSTRAINT_TAGS[obj_type],
+                                    {'id': obj_id})
+            if obj_type == 'location':
+                element.set('rsc', args[2])
+                if len(args) == 5 and args[3].endswith(':'):
+                    element.set('score', args[3][:-1])
+                    element.set('node', args[4])
+            section = self.section('constraints')
+        else:
+            raise ValueError('unsupported directive: {}'.format(directive))
+
+        element.set('definition', ' '.join(args[2:]))
+        parent, existing = self.find(obj_id)
+        if existing is not None:
+            if obj_type == 'primitive':
+                # keep the primitive in its group/clone
+                section = parent
+            parent.remove(existing)
+        section.append(element)
+
+    def delete(self, obj_id):
+        parent, element = self.find(obj_id)
+        if element is None:
+            return False
+        parent.remove(element)
+        if element.tag in CONTAINER_TAGS.values():
+            for child in element:
+                self.section('resources').append(child)
+        return True
+
+    def status_xml(self):
+        """Render the cluster status as crm_mon does."""
+        dc = self.nodes[0].get('uname') if self.nodes else ''
+        result = etree.Element('pacemaker-result', {
+            'api-version': '2.0',
+            'request': 'crm_mon --output-as=xml --inactive'})
+        summary = etree.SubElement(result, 'summary')
+        etree.SubElement(summary, 'current_dc', {
+            'present': 'true' if dc else 'false',
+            'name': dc,
+            'with_quorum': 'true'})
+        etree.SubElement(summary, 'cluster_options', {
+            'maintenance-mode': self.get_property('maintenance-mode') or
+            'false'})
+        nodes = etree.SubElement(result, 'nodes')
+        for node in self.nodes + self.remote_nodes:
+            etree.SubElement(nodes, 'node', {
+                'name': node.get('uname'),
+                'id': node.get('id'),
+                'online': 'true',
+                'standby': 'false',
+                'maintenance': 'false',
+                'is_dc': str(node.get('uname') == dc).lower(),
+                'type': node.get('type', 'member')})
+
+        resources = etree.SubElement(result, 'resources')
+        names = [n.get('uname') for n in self.nodes]
+
+        def _resource(parent, primitive, node_names):
+            stopped = primitive.get('id') in self.stopped
+            resource = etree.SubElement(parent, 'resource', {
+                'id': primitive.get('id'),
+                'resource_agent': '{}::{}:{}'.format(
+                    primitive.get('class'), primitive.get('provider', ''),
+                    primitive.get('type')),
+                'role': 'Stopped' if stopped else 'Started',
+                'active': str(not stopped).lower(),
+                'failed': 'false',
+                'nodes_running_on': '0' if stopped else str(len(node_names))})
+            if not stopped:
+                for name in node_names:
+                    etree.SubElement(resource, 'node', {'name': name})
+
+        for element in self.section('resources'):
+            if element.tag == 'primitive':
+                _resource(resources, element, names[:1])
+            elif element.tag == 'group':
+                group = etree.SubElement(resources, 'group', {
+                    'id': element.get('id'),
+                    'number_resources': str(len(element))})
+                for primitive in element:
+                    _resource(group, primitive, names[:1])
+            else:
+                clone = etree.SubElement(resources, 'clone', {
+                    'id': element.get('id'),
+                    'multi_state': str(element.tag == 'master').lower()})
+                for primitive in element.iter('primitive'):
+                    for name in names:
+                        _resource(clone, primitive, [name])
+        return etree.tostring(result, encoding='unicode')
+
+
+def crm(cluster, args):
+    if '--version' in args:
+        print('crm {}'.format(CRM_VERSION))
+        return 0
+
+    # only the global options (e.g. -w -F) precede the level.
+    while args and args[0].startswith('-'):
+        args = args[1:]
+    if not args:
+        return 1
+    level, args = args[0], args[1:]
+    if level == 'configure':
+        if args == ['show', 'xml']:
+            print(etree.tostring(cluster.root, encoding='unicode'))
+            return 0
+        if args[0] == 'property':
+            for arg in args[1:]:
+                name, value = arg.split('=', 1)
+                cluster.set_property(name, value)
+            cluster.save()
+            return 0
+        if args[0] in ('get_property', 'get-property', 'show-property'):
+            # crmsh >= 2.2.0 shows the default of a property that isn't set.
+            value = cluster.get_property(args[1])
+            if value is None:
+                value = PROPERTY_DEFAULTS.get(args[1])
+            if value is None:
+                return 1
+            print(value)
+            return 0
+        if args[0] == 'delete':
+            for obj_id in args[1:]:
+                if not cluster.delete(obj_id):
+                    return 1
+            cluster.save()
+            return 0
+        if args[0] == 'rsc_defaults':
+            defaults = cluster.section('rsc_defaults')
+            if defaults is None:
+                defaults = etree.SubElement(cluster.root.find('configuration'),
+                                            'rsc_defaults')
+            meta = defaults.find('meta_attributes')
+            if meta is None:
+                meta = etree.SubElement(defaults, 'meta_attributes',
+                                        {'id': 'rsc-options'})
+            for arg in args[1:]:
+                if '=' in arg and not arg.startswith('$'):
+                    name, value = arg.split('=', 1)
+                    for nvpair in meta.findall('nvpair'):
+                        if nvpair.get('name') == name:
+                            meta.remove(nvpair)
+                    etree.SubElement(meta, 'nvpair', {
+                        'id': 'rsc-options-{}'.format(name),
+                        'name': name, 'value': value.strip('"')})
+            cluster.save()
+            return 0
+        if args[:2] == ['load', 'update']:
+            with open(args[2]) as f:
+                script = f.read().replace('\\\n', ' ')
+            for line in script.splitlines():
+                if line.strip():
+                    cluster.apply(line.strip())
+            cluster.save()
+            return 0
+        cluster.apply(' '.join(args))
+        cluster.save()
+        return 0
+    if level == 'resource':
+        if args[0] in ('stop', 'start'):
+            if args[0] == 'stop':
+                cluster.stopped.add(args[1])
+            else:
+                cluster.stopped.discard(args[1])
+            cluster.save()
+            return 0
+        if args[0] == 'status':
+            nodes = [n.get('uname') for n in cluster.nodes]
+            if args[1] in cluster.stopped or not nodes:
+                print('resource {} is NOT running'.format(args[1]))
+            else:
+                print('resource {} is running on: {}'.format(args[1],
+                                                             nodes[0]))
+            return 0
+        return 0
+    if level == 'node':
+        if args and args[0] == 'status':
+            print(etree.tostring(cluster.section('nodes'),
+                                 encoding='unicode'))
+        elif args and args[0] == 'attribute':
+            print('scope=nodes  name={} value=off'.format(args[-1]))
+        elif not args or args[0] in ('show', 'list'):
+            for node in cluster.nodes:
+                print('{}({}): member'.format(node.get('uname'),
+                                              node.get('id')))
+        return 0
+    return 0
+
+
+def crm_mon(cluster, args):
+    if '--version' in args:
+        print('Pacemaker {}\nWritten by Andrew Beekhof'.format(
+            PACEMAKER_VERSION))
+        return 0
+    if set(args) & {'-X', '--as-xml', '--output-as=xml'}:
+        print(cluster.status_xml())
+        return 0
+    for node in cluster.nodes:
+        print('Node {}: online'.format(node.get('uname')))
+    return 0
+
+
+def crm_resource(cluster, args):
+    if '-L' in args or '--list' in args:
+        for primitive in cluster.section('resources').iter('primitive'):
+            print(' {}\t({}:{}):\tStarted'.format(
+                primitive.get('id'), primitive.get('class'),
+                primitive.get('type')))
+    return 0
+
+
+def cibadmin(cluster, args):
+    if '--xml-text' in args:
+        element = etree.fromstring(args[args.index('--xml-text') + 1])
+        parent, existing = cluster.find(element.get('id'))
+        if '--replace' in args or '-R' in args:
+            if existing is None:
+                return 105
+            parent.remove(existing)
+        elif existing is not None:
+            # CRM_EX_EXISTS
+            return 108
+        if parent is None:
+            parent = cluster.section(args[args.index('--scope') + 1])
+        parent.append(element)
+        cluster.save()
+        return 0
+    if '--scope' in args:
+        section = args[args.index('--scope') + 1]
+        print(etree.tostring(cluster.section(section), encoding='unicode'))
+    else:
+        print(etree.tostring(cluster.root, encoding='unicode'))
+    return 0
+
+
+def crm_attribute(cluster, args):
+    name = args[args.index('--name') + 1]
+    value = cluster.get_property(name)
+    if value is None:
+        # CRM_EX_NOSUCH, as returned by Pacemaker 2.x
+        return 105
+    print(value)
+    return 0
+
+
+def crm_node(cluster, args):
+    if '-n' in args or '--name' in args:
+        print(socket.gethostname())
+    else:
+        for node in cluster.nodes:
+            print('{} {} member'.format(node.get('id'), node.get('uname')))
+    return 0
+
+
+def corosync_cfgtool(cluster, args):
+    print('Local node ID 1, transport knet')
+    for node in cluster.nodes:
+        print('nodeid: {}: connected'.format(node.get('id')))
+    return 0
+
+
+COMMANDS = {
+    'crm': crm,
+    'crm_mon': crm_mon,
+    'crm_resource': crm_resource,
+    'cibadmin': cibadmin,
+    'crm_attribute': crm_attribute,
+    'crm_node': crm_node,
+    'corosync-cfgtool': corosync_cfgtool}
+
+
+def install_stubs(bin_dir):
+    """Install the stub commands in bin_dir, to be put first in PATH.
+
+    :param bin_dir: directory to install the stubs into
+    :type bin_dir: str
+    """
+    os.makedirs(bin_dir, exist_ok=True)
+    for name in STUBS:
+        path = os.path.join(bin_dir, name)
+        if not os.path.lexists(path):
+            os.symlink(os.path.abspath(__file__), path)
+
+
+def main(argv):
+    command = os.path.basename(argv[0])
+    if command == 'crm':
+        latency = os.environ.get('FAKE_CLUSTER_CRM_LATENCY')
+    else:
+        latency = os.environ.get('FAKE_CLUSTER_TOOL_LATENCY')
+    if latency:
+        time.sleep(float(latency))
+    cluster = FakeCluster.load(os.environ['FAKE_CLUSTER_DIR'])
+    return COMMANDS[command](cluster, argv[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
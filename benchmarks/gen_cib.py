@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Generate synthetic CIBs and the matching ha relation payload.
+
+The payload is what a principle charm would send over the ha relation:
+`resources` VIPs spread over `groups` groups and `clones` cloned services,
+each group having a location and a colocation constraint. The CIB holds the
+cluster nodes (the local host being the first one), the pacemaker-remote
+nodes and, unless empty, the objects of the payload as if they had been
+applied already.
+"""
+
+import argparse
+import os
+import socket
+import sys
+import xml.etree.ElementTree as etree
+
+import fake_cluster
+
+
+def generate_payload(resources=10, groups=2, clones=2):
+    """Generate the ha relation payload.
+
+    :param resources: Number of VIP resources.
+    :type resources: int
+    :param groups: Number of groups the VIPs are spread over.
+    :type groups: int
+    :param clones: Number of cloned services.
+    :type clones: int
+    :returns: Relation data keyed by relation key
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    payload = {
+        'resources': {},
+        'resource_params': {},
+        'groups': {},
+        'clones': {},
+        'colocations': {},
+        'locations': {},
+        'init_services': {},
+        'delete_resources': [],
+    }
+    vips = []
+    for i in range(resources):
+        name = 'res_bench_{}_vip'.format(i)
+        vips.append(name)
+        payload['resources'][name] = 'ocf:heartbeat:IPaddr2'
+        payload['resource_params'][name] = (
+            'params ip="10.{}.{}.{}" op monitor timeout="20s" '
+            'interval="10s" depth="0"'.format(
+                i // 65536 % 256, i // 256 % 256, i % 256))
+
+    for i in range(groups):
+        name = 'grp_bench_{}_vips'.format(i)
+        members = vips[i::groups]
+        if not members:
+            continue
+        payload['groups'][name] = ' '.join(members)
+        payload['locations']['loc_{}'.format(name)] = (
+            '{} 100: {}'.format(name, socket.gethostname()))
+
+    for i in range(clones):
+        res_name = 'res_bench_{}_haproxy'.format(i)
+        payload['resources'][res_name] = 'lsb:haproxy'
+        payload['resource_params'][res_name] = (
+            'meta migration-threshold="INFINITY" failure-timeout="5s" '
+            'op monitor interval="5s"')
+        payload['init_services'][res_name] = 'haproxy'
+        cl_name = 'cl_bench_{}_haproxy'.format(i)
+        payload['clones'][cl_name] = res_name
+        for grp_name in payload['groups']:
+            payload['colocations']['col_{}_{}'.format(grp_name, cl_name)] = (
+                'inf: {} {}'.format(grp_name, cl_name))
+
+    return payload
+
+
+def payload_directives(payload):
+    """crm configure directives creating the objects of the payload.
+
+    :param payload: ha relation payload
+    :type payload: Dict[str, Dict[str, str]]
+    :returns: crm configure directives in creation order
+    :rtype: List[str]
+    """
+    directives = []
+    for name, res_type in payload['resources'].items():
+        directives.append('primitive {} {} {}'.format(
+            name, res_type, payload['resource_params'].get(name, '')))
+    for obj_type, key in (('group', 'groups'),
+                          ('clone', 'clones'),
+                          ('colocation', 'colocations'),
+                          ('location', 'locations')):
+        for name, params in payload[key].items():
+            directives.append('{} {} {}'.format(obj_type, name, params))
+    return directives
+
+
+def generate_cib(nodes=3, remotes=0, payload=None):
+    """Generate a CIB.
+
+    :param nodes: Number of cluster nodes, the local host being the first.
+    :type nodes: int
+    :param remotes: Number of pacemaker-remote nodes.
+    :type remotes: int
+    :param payload: ha relation payload whose objects are already applied.
+    :type payload: Optional[Dict[str, Dict[str, str]]]
+    :returns: CIB XML document
+    :rtype: str
+    """
+    cib = etree.Element('cib', {
+        'epoch': '1',
+        'num_updates': '0',
+        'admin_epoch': '0',
+        'have-quorum': '1',
+        'dc-uuid': '1000',
+        'validate-with': 'pacemaker-3.7'})
+    configuration = etree.SubElement(cib, 'configuration')
+    crm_config = etree.SubElement(configuration, 'crm_config')
+    etree.SubElement(crm_config, 'cluster_property_set',
+                     {'id': 'cib-bootstrap-options'})
+    cib_nodes = etree.SubElement(configuration, 'nodes')
+    for i in range(nodes):
+        uname = socket.gethostname() if i == 0 else 'node{}'.format(i + 1)
+        etree.SubElement(cib_nodes, 'node',
+                         {'id': str(1000 + i), 'uname': uname})
+    for i in range(remotes):
+        uname = 'remote{}'.format(i + 1)
+        etree.SubElement(cib_nodes, 'node',
+                         {'id': uname, 'uname': uname, 'type': 'remote'})
+    etree.SubElement(configuration, 'resources')
+    etree.SubElement(configuration, 'constraints')
+    etree.SubElement(cib, 'status')
+
+    if payload:
+        cluster = fake_cluster.FakeCluster(cib)
+        for directive in payload_directives(payload):
+            cluster.apply(directive)
+
+    return etree.tostring(cib, encoding='unicode')
+
+
+def write_cib(state_dir, cib_xml):
+    """Write the CIB of the fake cluster, resetting its resource state.
+
+    :param state_dir: $FAKE_CLUSTER_DIR of the fake cluster
+    :type state_dir: str
+    :param cib_xml: CIB XML document
+    :type cib_xml: str
+    """
+    os.makedirs(state_dir, exist_ok=True)
+    with open(os.path.join(state_dir, 'cib.xml'), 'w') as f:
+        f.write(cib_xml)
+    stopped_path = os.path.join(state_dir, 'stopped.json')
+    if os.path.exists(stopped_path):
+        os.remove(stopped_path)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--remotes', type=int, default=0)
+    parser.add_argument('--resources', type=int, default=10)
+    parser.add_argument('--groups', type=int, default=2)
+    parser.add_argument('--clones', type=int, default=2)
+    parser.add_argument('--empty', action='store_true',
+                        help="don't configure the payload objects")
+    parser.add_argument('output', help='path of the CIB to write')
+    args = parser.parse_args(argv)
+
+    payload = None
+    if not args.empty:
+        payload = generate_payload(args.resources, args.groups, args.clones)
+    with open(args.output, 'w') as f:
+        f.write(generate_cib(args.nodes, args.remotes, payload))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the crm_mon XML parsers against large synthetic outputs.
+
+The two parsers of pcmk.parse_cluster_status() are compared: the
+ElementTree based one used up to pcmk.STREAM_PARSE_THRESHOLD characters and
+the streaming one used above. Each parser runs in its own process so that
+the growth of its peak RSS while parsing can be reported along with the
+parse time.
+
+    ./benchmarks/parse_status.py --nodes 3 --remotes 500 --history 50
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as etree
+
+_path = os.path.dirname(os.path.realpath(__file__))
+_root = os.path.abspath(os.path.join(_path, '..'))
+for _dir in ('hooks', ''):
+    _dir = os.path.join(_root, _dir).rstrip(os.sep)
+    if _dir not in sys.path:
+        sys.path.insert(1, _dir)
+
+
+def generate_crm_mon_xml(nodes=3, remotes=0, resources=100, clones=10,
+                         history=10):
+    """Generate a crm_mon XML output.
+
+    :param nodes: Number of cluster nodes.
+    :type nodes: int
+    :param remotes: Number of pacemaker-remote nodes, each with its
+                    ocf:pacemaker:remote resource.
+    :type remotes: int
+    :param resources: Number of VIP resources, grouped by ten.
+    :type resources: int
+    :param clones: Number of cloned services, running on every node.
+    :type clones: int
+    :param history: Operations recorded per resource and node.
+    :type history: int
+    :returns: crm_mon XML output
+    :rtype: str
+    """
+    names = ['node{}'.format(i + 1) for i in range(nodes)]
+    remote_names = ['remote{}'.format(i + 1) for i in range(remotes)]
+    all_names = names + remote_names
+
+    root = etree.Element('pacemaker-result', {
+        'api-version': '2.0', 'request': 'crm_mon --output-as=xml --inactive'})
+    summary = etree.SubElement(root, 'summary')
+    etree.SubElement(summary, 'stack', {'type': 'corosync'})
+    etree.SubElement(summary, 'current_dc', {
+        'present': 'true', 'version': '2.0.3', 'name': names[0],
+        'id': '1000', 'with_quorum': 'true'})
+    etree.SubElement(summary, 'nodes_configured',
+                     {'number': str(len(all_names))})
+
+    nodes_element = etree.SubElement(root, 'nodes')
+    for i, name in enumerate(all_names):
+        etree.SubElement(nodes_element, 'node', {
+            'name': name, 'id': str(1000 + i), 'online': 'true',
+            'standby': 'false', 'maintenance': 'false', 'is_dc': 'false',
+            'type': 'member' if name in names else 'remote'})
+
+    def _resource(parent, res_id, agent, node):
+        element = etree.SubElement(parent, 'resource', {
+            'id': res_id, 'resource_agent': agent, 'role': 'Started',
+            'active': 'true', 'orphaned': 'false', 'managed': 'true',
+            'failed': 'false', 'nodes_running_on': '1'})
+        etree.SubElement(element, 'node', {
+            'name': node, 'id': str(1000 + all_names.index(node)),
+            'cached': 'true'})
+
+    history_resources = {name: [] for name in all_names}
+    resources_element = etree.SubElement(root, 'resources')
+    for i, name in enumerate(remote_names):
+        node = names[i % len(names)]
+        _resource(resources_element, name, 'ocf::pacemaker:remote', node)
+        history_resources[node].append(name)
+    group = None
+    for i in range(resources):
+        if i % 10 == 0:
+            group = etree.SubElement(resources_element, 'group', {
+                'id': 'grp_{}'.format(i // 10), 'number_resources': '10'})
+        res_id = 'res_{}_vip'.format(i)
+        node = names[i % len(names)]
+        _resource(group, res_id, 'ocf::heartbeat:IPaddr2', node)
+        history_resources[node].append(res_id)
+    for i in range(clones):
+        clone = etree.SubElement(resources_element, 'clone', {
+            'id': 'cl_{}'.format(i), 'multi_state': 'false',
+            'unique': 'false', 'managed': 'true', 'failed': 'false'})
+        res_id = 'res_{}_svc'.format(i)
+        for name in all_names:
+            _resource(clone, res_id, 'lsb:svc', name)
+            history_resources[name].append(res_id)
+
+    node_history = etree.SubElement(root, 'node_history')
+    for name in all_names:
+        node = etree.SubElement(node_history, 'node', {'name': name})
+        for res_id in history_resources[name]:
+            res_history = etree.SubElement(node, 'resource_history', {
+                'id': res_id, 'orphan': 'false',
+                'migration-threshold': '1000000'})
+            for call in range(history):
+                etree.SubElement(res_history, 'operation_history', {
+                    'call': str(call), 'task': 'monitor',
+                    'interval': '10000ms',
+                    'last-rc-change': 'Tue Jan  5 09:03:52 2021',
+                    'exec-time': '{}ms'.format(call % 97),
+                    'queue-time': '0ms', 'rc': '0', 'rc_text': 'ok'})
+    etree.SubElement(root, 'status', {'code': '0', 'message': 'OK'})
+    return etree.tostring(root, encoding='unicode')
+
+
+def run_child(parser, path):
+    """Parse the output in this process and print the measures as JSON."""
+    import pcmk
+
+    # The output is parsed as a tree up to the threshold.
+    thresholds = {'tree': float('inf'), 'iterparse': 0}
+    pcmk.STREAM_PARSE_THRESHOLD = thresholds[parser]
+    with open(path) as f:
+        xml = f.read()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    status = pcmk.parse_cluster_status(xml, '2.0.3', resources=True,
+                                       history=True)
+    duration = time.monotonic() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'time': duration,
+        'rss_kb': rss_after - rss_before,
+        'checksum': pcmk.generate_checksum([json.dumps(status,
+                                                       sort_keys=True)])}))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--remotes', type=int, default=100)
+    parser.add_argument('--resources', type=int, default=100)
+    parser.add_argument('--clones', type=int, default=10)
+    parser.add_argument('--history', type=int, default=20,
+                        help='operations recorded per resource and node')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs of each parser, the fastest is shown')
+    parser.add_argument('--child', nargs=2, metavar=('PARSER', 'PATH'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        return run_child(*args.child)
+
+    xml = generate_crm_mon_xml(args.nodes, args.remotes, args.resources,
+                               args.clones, args.history)
+    with tempfile.NamedTemporaryFile('w', suffix='.xml') as f:
+        f.write(xml)
+        f.flush()
+        print('{} nodes, {} remotes, {} resources, {} clones, {} operations '
+              'per resource: {:.1f} MiB of XML'.format(
+                  args.nodes, args.remotes, args.resources, args.clones,
+                  args.history, len(xml) / 1024.0 / 1024.0))
+        checksums = set()
+        for name in ('tree', 'iterparse'):
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.check_output(
+                    [sys.executable, os.path.realpath(__file__),
+                     '--child', name, f.name], universal_newlines=True)
+                runs.append(json.loads(output.splitlines()[-1]))
+            checksums.update(run['checksum'] for run in runs)
+            print('{:<10} {:>8.3f}s {:>10.1f} MiB peak RSS growth'.format(
+                name, min(run['time'] for run in runs),
+                min(run['rss_kb'] for run in runs) / 1024.0))
+        if len(checksums) != 1:
+            print('The parsers returned different results')
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the charm hooks and actions against a fake cluster.
+
+The hooks run in process with the Juju hook tools and the local system
+changes (packages, services, corosync.conf) faked out, while every cluster
+command goes through the fake_cluster stand-ins installed first in $PATH.
+For each scenario the wall time and the command counts and times recorded by
+pcmk.command_stats_summary() are reported. By default the scenarios run with
+the crmsh backend then with the Pacemaker tools one. All the stand-ins start
+alike, so the wall times of both runs are only compared when a start up
+latency is given for crm or the Pacemaker tools.
+
+    ./benchmarks/run.py --resources 200 --remotes 10 --crm-latency 0.3
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import yaml
+
+_path = os.path.dirname(os.path.realpath(__file__))
+_root = os.path.abspath(os.path.join(_path, '..'))
+for _dir in ('actions', 'hooks', ''):
+    _dir = os.path.join(_root, _dir).rstrip(os.sep)
+    if _dir not in sys.path:
+        sys.path.insert(1, _dir)
+
+import fake_cluster  # noqa: E402
+import gen_cib  # noqa: E402
+
+HOSTNAME = 'juju-bench-0'
+
+HA_RELATION_ID = 'ha:1'
+HANODE_RELATION_ID = 'hanode:0'
+REMOTE_RELATION_ID = 'pacemaker-remote:2'
+
+
+class ScenarioFailed(Exception):
+    """Raised when the charm reports a failure while running a scenario."""
+
+
+def fail(message):
+    raise ScenarioFailed(message)
+
+
+class FakeConfig(dict):
+    """Charm config, every option keeping its previous value."""
+
+    def previous(self, key):
+        return self.get(key)
+
+
+class FakeJuju(object):
+    """Juju hook tools backed by static relation data."""
+
+    def __init__(self, nodes, remotes, payload):
+        self.cfg = FakeConfig()
+        with open(os.path.join(_root, 'config.yaml')) as f:
+            for name, option in yaml.safe_load(f)['options'].items():
+                self.cfg[name] = option.get('default')
+        self.cfg['corosync_key'] = 'Y29yb3N5bmNrZXk='
+        self.cfg['cluster_count'] = nodes
+
+        self.relations = {
+            'ha': {HA_RELATION_ID: {
+                'keystone/0': {
+                    'json_{}'.format(key): json.dumps(value)
+                    for key, value in payload.items()}}},
+            'hanode': {HANODE_RELATION_ID: {
+                'hacluster/{}'.format(i): {
+                    'private-address': '10.0.0.{}'.format(i + 1),
+                    'hostname': 'node{}'.format(i + 1),
+                    'ready': 'True',
+                    'member_ready': 'True'}
+                for i in range(1, nodes)}},
+            'pacemaker-remote': {REMOTE_RELATION_ID: {
+                'remote/{}'.format(i): {
+                    'private-address': '10.1.0.{}'.format(i + 1),
+                    'remote-hostname': json.dumps('remote{}'.format(i + 1)),
+                    'remote-ip': json.dumps('10.1.0.{}'.format(i + 1)),
+                    'enable-resources': 'false'}
+                for i in range(remotes)}},
+        }
+        self.relation_name = 'ha'
+        # Parameters of the status action, as function_get() returns them.
+        # Update along with the action parameters in actions.yaml, history
+        # is enabled so that its parsing is measured.
+        self.action_params = {
+            'resources': True,
+            'history': True,
+            'summary': False,
+            'node': '',
+            'resource': '',
+        }
+
+    def config(self, key=None):
+        if key is None:
+            return self.cfg
+        return self.cfg.get(key)
+
+    def relation_ids(self, reltype=None):
+        return sorted(self.relations.get(reltype, {}))
+
+    def related_units(self, relid=None):
+        for relations in self.relations.values():
+            if relid in relations:
+                return sorted(relations[relid])
+        return []
+
+    def relation_get(self, attribute=None, unit=None, rid=None, app=None):
+        for relations in self.relations.values():
+            data = relations.get(rid, {}).get(unit)
+            if data is not None:
+                return data if attribute is None else data.get(attribute)
+        return None
+
+    def relation_type(self):
+        return self.relation_name
+
+    def function_get(self, key=None):
+        if key is None:
+            return self.action_params
+        return self.action_params.get(key)
+
+    def fakes(self):
+        """Functions to patch, by name, in the charm modules."""
+        noop = mock.MagicMock(return_value=None)
+        return {
+            # Juju hook tools
+            'config': self.config,
+            'relation_ids': self.relation_ids,
+            'related_units': self.related_units,
+            'relation_get': self.relation_get,
+            'relation_type': self.relation_type,
+            'relation_set': noop,
+            'remote_unit': mock.MagicMock(return_value='hacluster/1'),
+            'local_unit': mock.MagicMock(return_value='hacluster/0'),
+            'unit_get': mock.MagicMock(return_value='10.0.0.1'),
+            'get_relation_ip': mock.MagicMock(return_value='10.0.0.1'),
+            'is_leader': mock.MagicMock(return_value=True),
+            'leader_get': mock.MagicMock(return_value=None),
+            'leader_set': noop,
+            'log': noop,
+            'status_set': noop,
+            'application_version_set': noop,
+            'action_get': mock.MagicMock(return_value='all'),
+            'action_set': noop,
+            'action_fail': fail,
+            'function_get': self.function_get,
+            'function_set': noop,
+            'function_fail': fail,
+            # Local system
+            'get_hostname': mock.MagicMock(return_value=HOSTNAME),
+            'lsb_release': mock.MagicMock(
+                return_value={'DISTRIB_CODENAME': 'jammy'}),
+            'get_distrib_codename': mock.MagicMock(return_value='jammy'),
+            'get_upstream_version': mock.MagicMock(return_value='2.1.2'),
+            'apt_install': noop,
+            'apt_purge': noop,
+            'apt_mark': noop,
+            'filter_installed_packages': mock.MagicMock(return_value=[]),
+            'service_running': mock.MagicMock(return_value=True),
+            'service_start': noop,
+            'service_stop': noop,
+            'service_restart': noop,
+            'setup_ocf_files': noop,
+            'enable_lsb_services': noop,
+            'disable_lsb_services': noop,
+            'disable_upstart_services': noop,
+            'emit_systemd_overrides_file': noop,
+            'get_corosync_conf': mock.MagicMock(return_value=True),
+            'configure_corosync': mock.MagicMock(return_value=True),
+            'emit_corosync_conf': mock.MagicMock(return_value=True),
+            'trigger_corosync_update_from_leader': mock.MagicMock(
+                return_value=False),
+            'update_nrpe_config': noop,
+            'kill_legacy_ocf_daemon_process': noop,
+            'is_waiting_unit_series_upgrade_set': mock.MagicMock(
+                return_value=False),
+        }
+
+
+def hook_scenario(name):
+    def run(modules):
+        modules['hooks'].hooks.execute([name])
+    return run
+
+
+def update_status(modules):
+    modules['utils'].assess_status_helper()
+
+
+def status_action(modules):
+    modules['actions'].main(['status'])
+
+
+def reset(modules, backend=None):
+    """Drop the state the charm modules keep between runs.
+
+    :param backend: Backend class to query the cluster with, picked by
+                    pcmk.get_backend() if None.
+    :type backend: Optional[type]
+    """
+    pcmk = modules['pcmk']
+    pcmk._command_stats[:] = []
+    pcmk._versions.clear()
+    pcmk._backend = backend() if backend else None
+    pcmk.invalidate_cib_snapshot()
+    modules['utils'].flush_relation_data()
+
+
+def run_scenario(modules, name, func, repeat, setup=None, backend=None):
+    """Run a scenario, reporting its timings.
+
+    :param setup: Called before each run, outside of the timings.
+    :type setup: Optional[Callable[[], None]]
+    :param backend: Backend class to query the cluster with.
+    :type backend: Optional[type]
+
+    :returns: Wall time of each run in seconds, None if the scenario failed
+    :rtype: Optional[List[float]]
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        reset(modules, backend)
+        start = time.monotonic()
+        try:
+            func(modules)
+        except Exception as e:
+            # A failed scenario must not be reported as a measurement.
+            print('{:<34} FAILED: {!r}'.format(name, e))
+            return None
+        durations.append(time.monotonic() - start)
+    summary = modules['pcmk'].command_stats_summary()
+    print('{:<34} {:>8.3f}s {:>6} cmds {:>8.3f}s in cmds'.format(
+        name, min(durations), summary['count'], summary['time']))
+    for verb, stat in sorted(summary['verbs'].items(),
+                             key=lambda item: -item[1]['time']):
+        print('    {:<30} {:>6} {:>8.3f}s'.format(
+            verb, stat['count'], stat['time']))
+    return durations
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--remotes', type=int, default=0)
+    parser.add_argument('--resources', type=int, default=10)
+    parser.add_argument('--groups', type=int, default=2)
+    parser.add_argument('--clones', type=int, default=2)
+    parser.add_argument('--config', action='append', default=[],
+                        metavar='KEY=VALUE',
+                        help='charm config option to set, may be repeated')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs of each scenario, the fastest is shown')
+    parser.add_argument('--crm-latency', type=float, default=0.0,
+                        help='seconds added to each crm invocation')
+    parser.add_argument('--tool-latency', type=float, default=0.0,
+                        help='seconds added to each Pacemaker tool '
+                             'invocation')
+    parser.add_argument('--backend', default='both',
+                        choices=['auto', 'crmsh', 'pacemaker', 'both'],
+                        help='backend the cluster is queried with, both '
+                             'runs every scenario with crmsh then with the '
+                             'Pacemaker tools and compares them')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='hacluster-bench-')
+    try:
+        bin_dir = os.path.join(workdir, 'bin')
+        state_dir = os.path.join(workdir, 'cluster')
+        fake_cluster.install_stubs(bin_dir)
+        os.environ['PATH'] = os.pathsep.join(
+            [bin_dir, os.environ.get('PATH', '')])
+        os.environ['FAKE_CLUSTER_DIR'] = state_dir
+        os.environ['FAKE_CLUSTER_CRM_LATENCY'] = str(args.crm_latency)
+        os.environ['FAKE_CLUSTER_TOOL_LATENCY'] = str(args.tool_latency)
+        os.environ['UNIT_STATE_DB'] = os.path.join(workdir, 'unit-state.db')
+
+        patches = [
+            mock.patch('charmhelpers.osplatform.get_platform',
+                       return_value='ubuntu'),
+            mock.patch('socket.gethostname', return_value=HOSTNAME),
+        ]
+        for p in patches:
+            p.start()
+
+        payload = gen_cib.generate_payload(
+            args.resources, args.groups, args.clones)
+        juju = FakeJuju(args.nodes, args.remotes, payload)
+        for option in args.config:
+            key, value = option.split('=', 1)
+            juju.cfg[key] = yaml.safe_load(value)
+
+        import actions
+        import hooks
+        import pcmk
+        import utils
+        modules = {'actions': actions, 'hooks': hooks, 'pcmk': pcmk,
+                   'utils': utils}
+        for module in modules.values():
+            for name, fake in juju.fakes().items():
+                if hasattr(module, name):
+                    patches.append(mock.patch.object(module, name, fake))
+                    patches[-1].start()
+
+        def fresh_cluster(populated):
+            def setup():
+                # A unit that never configured the cluster.
+                if os.path.exists(os.environ['UNIT_STATE_DB']):
+                    os.remove(os.environ['UNIT_STATE_DB'])
+                utils.unitdata._KV = None
+                gen_cib.write_cib(state_dir, gen_cib.generate_cib(
+                    args.nodes, args.remotes,
+                    payload if populated else None))
+            return setup
+
+        scenarios = [
+            ('ha-relation-changed (empty CIB)', fresh_cluster(False),
+             hook_scenario('ha-relation-changed')),
+            ('ha-relation-changed (populated)', fresh_cluster(True),
+             hook_scenario('ha-relation-changed')),
+            ('ha-relation-changed (unchanged)', None,
+             hook_scenario('ha-relation-changed')),
+            ('config-changed', None, hook_scenario('config-changed')),
+            ('update-status', None, update_status),
+            ('status action', None, status_action),
+        ]
+        print('{} nodes, {} remotes, {} resources, {} groups, {} clones'
+              ''.format(args.nodes, args.remotes, args.resources,
+                        args.groups, args.clones))
+        backends = {'auto': None,
+                    'crmsh': pcmk.CrmshBackend,
+                    'pacemaker': pcmk.PacemakerBackend}
+        if args.backend == 'both':
+            selected = ['crmsh', 'pacemaker']
+        else:
+            selected = [args.backend]
+        failed = 0
+        results = {}
+        for backend in selected:
+            print('{} backend'.format(backend))
+            for name, setup, func in scenarios:
+                durations = run_scenario(modules, name, func, args.repeat,
+                                         setup, backends[backend])
+                if durations is None:
+                    failed += 1
+                    continue
+                results[backend, name] = min(durations)
+        if len(selected) == 2 and not (args.crm_latency or
+                                       args.tool_latency):
+            print('Not comparing the backends: with --crm-latency and '
+                  '--tool-latency at 0 the crm and Pacemaker tool stand-ins '
+                  'cost the same to run')
+        elif len(selected) == 2:
+            print('{:<34} {:>9} {:>9} {:>8}'.format(
+                'wall time', selected[0], selected[1], 'speedup'))
+            for name, _, _ in scenarios:
+                before = results.get((selected[0], name))
+                after = results.get((selected[1], name))
+                if before is None or after is None:
+                    continue
+                print('{:<34} {:>8.3f}s {:>8.3f}s {:>7.1f}x'.format(
+                    name, before, after, before / after if after else 0))
+
+        for p in reversed(patches):
+            p.stop()
+    finally:
+        shutil.rmtree(workdir)
+    if failed:
+        print('{} scenario(s) failed'.format(failed))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
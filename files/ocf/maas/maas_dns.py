@@ -15,18 +15,34 @@
 # limitations under the License.
 
 import argparse
+import json
+import os
+import random
 import requests_oauthlib
 import logging
 import sys
+import tempfile
 import time
+import urllib.error
 
 import maasclient
 
 
 # Default MaaS API options
 NUM_RETRIES = 5
-RETRY_BASE_DELAY = 10
+RETRY_BASE_DELAY = 1
+RETRY_MAX_DELAY = 10
 RETRY_CODES = [500]
+# Share of the pacemaker operation timeout the retries may use, the rest is
+# left to the resource agent.
+DEADLINE_SHARE = 0.9
+
+# When the script started, the deadline of the retries is relative to it.
+START_TIME = time.monotonic()
+
+# Default location and lifetime in seconds of the cached dnsresource ids
+CACHE_FILE = '/var/cache/maas_dns/dnsresources.json'
+CACHE_TTL = 300
 
 # the global options that is parsed from the arguments
 options = None
@@ -36,16 +52,36 @@ class RetriesException(Exception):
     pass
 
 
-def retry_on_request_error(retries=3, base_delay=0, codes=None):
+def is_connection_error(exc):
+    """Whether the exception is a connection-level error worth retrying.
+
+    Connection failures and timeouts of requests and urllib are OSErrors,
+    the HTTP errors raised by urllib are left to the status code handling.
+
+    :param exc: The exception raised by the decorated function
+    :type exc: Exception
+    :rtype: bool
+    """
+    return (isinstance(exc, OSError) and
+            not isinstance(exc, urllib.error.HTTPError))
+
+
+def retry_on_request_error(retries=3, base_delay=0, codes=None,
+                           max_delay=None, deadline=None):
     """Retry a function that retures a requests response.
 
     If the response from the target function has an error code in the
-    :param:`codes` list then retry the function up to :param:`retries`.  The
-    :param:`base_delay`, if not zero, will progressively back off at
-    `base_delay`, `base_delay * 2`, `base_delay * 3` ...
+    :param:`codes` list, or the function raises a connection-level error,
+    then retry the function up to :param:`retries`. The delay before each
+    retry is drawn uniformly between 0 and `base_delay * 2 ** attempt`,
+    capped to :param:`max_delay` (exponential backoff with full jitter).
+
+    No retry is attempted when its delay would end past the
+    :param:`deadline`, a RetriesException is raised with the last error
+    instead.
 
-    If the decorated function raises an exception, then the decorator DOESN'T
-    catch it, and this will bypass any retries.
+    Other exceptions raised by the decorated function are not caught and
+    bypass any retries.
 
     In order to enable the decorator to access command line arguments, each of
     the arguments can optionally be a Callable that returns the value, which
@@ -53,49 +89,66 @@ def retry_on_request_error(retries=3, base_delay=0, codes=None):
 
     :param retries: Number of attempts to run the decorated function.
     :type retries: Option[int, Callable[..., int]]
-    :param base_delay: Back off time, which linearly increases by the number of
-        retries for each failed request.
-    :type base_delay: Option[int, Callable[..., int]]
+    :param base_delay: Back off time, which doubles with each failed request.
+    :type base_delay: Option[float, Callable[..., float]]
     :param codes: The codes to detect that force a retry that
         response.status_code may contain.
     :type codes: Option[List[int], Callable(..., List[int]]
+    :param max_delay: Upper bound of the back off time, unbounded if None.
+    :type max_delay: Option[float, Callable[..., float]]
+    :param deadline: time.monotonic() value past which no retry is
+        attempted, no deadline if None.
+    :type deadline: Option[float, Callable[..., float]]
     :returns: decorated target function
     :rtype: Callable
-    :raises: Exception, if the decorated function raises an exception
+    :raises: RetriesException, if the retries or the time left before the
+        deadline are exhausted by connection errors or error codes
     """
     if codes is None:
         codes = [500]
 
+    def _value(option):
+        return option() if callable(option) else option
+
     def inner1(f):
 
         def inner2(*args, **kwargs):
-            if callable(retries):
-                _retries = retries()
-            else:
-                _retries = retries
+            _retries = _value(retries)
             num_retries = _retries
-            if callable(base_delay):
-                _base_delay = base_delay()
-            else:
-                _base_delay = base_delay
-            if callable(codes):
-                _codes = codes()
-            else:
-                _codes = codes
-            multiplier = 1
+            _base_delay = _value(base_delay)
+            _codes = _value(codes)
+            _max_delay = _value(max_delay)
+            _deadline = _value(deadline)
+            attempt = 0
             while True:
-                response = f(*args, **kwargs)
-                if response.status_code not in _codes:
-                    return response
+                error = None
+                try:
+                    response = f(*args, **kwargs)
+                except Exception as e:
+                    if not is_connection_error(e):
+                        raise
+                    error = e
+                else:
+                    if response.status_code not in _codes:
+                        return response
+                    error = "status code {}".format(response.status_code)
                 if _retries <= 0:
                     raise RetriesException(
-                        "Command {} failed after {} retries"
-                        .format(f.__name__, num_retries))
-                delay = _base_delay * multiplier
-                multiplier += 1
+                        "Command {} failed after {} retries: {}"
+                        .format(f.__name__, num_retries, error))
+                delay = _base_delay * 2 ** attempt
+                if _max_delay is not None:
+                    delay = min(delay, _max_delay)
+                delay = random.uniform(0, delay)
+                if (_deadline is not None and
+                        time.monotonic() + delay >= _deadline):
+                    raise RetriesException(
+                        "Command {} failed, no time left to retry: {}"
+                        .format(f.__name__, error))
+                attempt += 1
                 logging.debug(
-                    "Retrying '{}' {} more times (delay={})"
-                    .format(f.__name__, _retries, delay))
+                    "Retrying '{}' {} more times (delay={:.2f}) after: {}"
+                    .format(f.__name__, _retries, delay, error))
                 _retries -= 1
                 if delay:
                     time.sleep(delay)
@@ -168,12 +221,86 @@ def options_codes():
         return RETRY_CODES
 
 
+def options_max_delay():
+    """Returns options.maas_max_delay
+
+    :returns: options.maas_max_delay
+    :rtype: float
+    """
+    global options
+    if options is not None:
+        return options.maas_max_delay
+    else:
+        return RETRY_MAX_DELAY
+
+
+def options_deadline():
+    """Returns the time.monotonic() value past which no retry is attempted
+
+    It is derived from options.maas_deadline, which defaults to a share of
+    the pacemaker operation timeout (OCF_RESKEY_CRM_meta_timeout, in
+    milliseconds). There is no deadline if neither is set.
+
+    :returns: deadline of the retries
+    :rtype: Optional[float]
+    """
+    global options
+    deadline = options.maas_deadline if options is not None else None
+    if deadline is None:
+        try:
+            timeout_ms = int(os.environ.get('OCF_RESKEY_CRM_meta_timeout'))
+        except (TypeError, ValueError):
+            return None
+        deadline = timeout_ms / 1000.0 * DEADLINE_SHARE
+    return START_TIME + deadline
+
+
+def load_cache(path):
+    """Load the cached dnsresource ids.
+
+    :param path: Path of the cache
+    :type path: str
+    :returns: id and time it was looked up by fqdn
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_cache(path, cache):
+    """Save the cached dnsresource ids, replacing the file atomically.
+
+    :param path: Path of the cache
+    :type path: str
+    :param cache: id and time it was looked up by fqdn
+    :type cache: Dict[str, Dict[str, Any]]
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=dirname, prefix='.',
+                                         delete=False) as f:
+            json.dump(cache, f)
+        os.rename(f.name, path)
+    except OSError as e:
+        logging.warning('Unable to save the dnsresource cache: {}'.format(e))
+
+
 class MAASDNS(object):
     def __init__(self, options):
         self.maas = maasclient.MAASClient(options.maas_server,
-                                          options.maas_credentials)
+                                          options.maas_credentials,
+                                          driver=options.maas_driver)
         # String representation of the fqdn
         self.fqdn = options.fqdn
+        self.cache_file = options.cache_file
+        self.cache_ttl = options.cache_ttl
+        # Whether the dnsresource only holds the cached id of the fqdn
+        self.from_cache = False
         # Dictionary representation of MAAS dnsresource object
         # TODO: Do this as a property
         self.dnsresource = self.get_dnsresource()
@@ -184,13 +311,50 @@ class MAASDNS(object):
         self.maas_server = options.maas_server
         self.maas_creds = options.maas_credentials
 
-    def get_dnsresource(self):
-        """ Get a dnsresource object """
-        dnsresources = self.maas.get_dnsresources()
+    def get_cached_dnsresource_id(self):
+        """ Get the dnsresource ID of the fqdn if cached recently """
+        if self.cache_ttl <= 0:
+            return None
+        entry = load_cache(self.cache_file).get(self.fqdn)
+        try:
+            if time.time() - entry['time'] < self.cache_ttl:
+                return entry['id']
+        except (TypeError, KeyError):
+            pass
+        return None
+
+    def cache_dnsresource_id(self, rid):
+        """ Cache the dnsresource ID of the fqdn, None to forget it """
+        if self.cache_ttl <= 0:
+            return
+        cache = load_cache(self.cache_file)
+        if rid is None:
+            cache.pop(self.fqdn, None)
+        else:
+            cache[self.fqdn] = {'id': rid, 'time': time.time()}
+        save_cache(self.cache_file, cache)
+
+    def get_dnsresource(self, use_cache=True):
+        """ Get a dnsresource object
+
+        A recently cached ID is returned as a dnsresource without its
+        addresses, the dnsresources are otherwise listed by fqdn.
+        """
         self.dnsresource = None
+        self.from_cache = False
+        rid = self.get_cached_dnsresource_id() if use_cache else None
+        if rid is not None:
+            logging.info('Using the cached dnsresource ID {} of {}'
+                         ''.format(rid, self.fqdn))
+            self.from_cache = True
+            self.dnsresource = {'id': rid, 'fqdn': self.fqdn}
+            return self.dnsresource
+        dnsresources = self.maas.get_dnsresources(self.fqdn)
         for dnsresource in dnsresources:
             if dnsresource['fqdn'] == self.fqdn:
                 self.dnsresource = dnsresource
+        if self.dnsresource:
+            self.cache_dnsresource_id(self.dnsresource['id'])
         return self.dnsresource
 
     def get_dnsresource_id(self):
@@ -199,7 +363,9 @@ class MAASDNS(object):
 
     @retry_on_request_error(retries=options_retries,
                             base_delay=options_base_delay,
-                            codes=options_codes)
+                            codes=options_codes,
+                            max_delay=options_max_delay,
+                            deadline=options_deadline)
     def update_resource(self):
         """ Update a dnsresource record with an IP """
         return self.maas.update_dnsresource(self.dnsresource['id'],
@@ -234,7 +400,9 @@ class MAASDNS(object):
 
         @retry_on_request_error(retries=options_retries,
                                 base_delay=options_base_delay,
-                                codes=options_codes)
+                                codes=options_codes,
+                                max_delay=options_max_delay,
+                                deadline=options_deadline)
         def inner_maas_session_post(session, dns_url, payload):
             return session.post(dns_url, data=payload)
 
@@ -244,7 +412,8 @@ class MAASDNS(object):
 class MAASIP(object):
     def __init__(self, options):
         self.maas = maasclient.MAASClient(options.maas_server,
-                                          options.maas_credentials)
+                                          options.maas_credentials,
+                                          driver=options.maas_driver)
         # String representation of the IP
         self.ip = options.ip_address
         # Dictionary representation of MAAS ipaddresss object
@@ -253,7 +422,7 @@ class MAASIP(object):
 
     def get_ipaddress(self):
         """ Get an ipaddresses object """
-        ipaddresses = self.maas.get_ipaddresses()
+        ipaddresses = self.maas.get_ipaddresses(self.ip)
         self.ipaddress = None
         for ipaddress in ipaddresses:
             if ipaddress['ip'] == self.ip:
@@ -262,7 +431,9 @@ class MAASIP(object):
 
     @retry_on_request_error(retries=options_retries,
                             base_delay=options_base_delay,
-                            codes=options_codes)
+                            codes=options_codes,
+                            max_delay=options_max_delay,
+                            deadline=options_deadline)
     def create_ipaddress(self, hostname=None):
         """ Create an ipaddresses object
         Due to https://bugs.launchpad.net/maas/+bug/1555393
@@ -323,9 +494,21 @@ def dns_ha():
                         type=int,
                         default=3)
     parser.add_argument('--maas_base_delay', '-b',
-                        help='The base delay after a failed MaaS API call',
-                        type=int,
-                        default=10)
+                        help=('The base delay after a failed MaaS API call, '
+                              'doubled after each retry'),
+                        type=float,
+                        default=RETRY_BASE_DELAY)
+    parser.add_argument('--maas_max_delay',
+                        help='The maximum delay after a failed MaaS API call',
+                        type=float,
+                        default=RETRY_MAX_DELAY)
+    parser.add_argument('--maas_deadline',
+                        help=('Seconds after which a failed MaaS API call is '
+                              'not retried anymore, defaults to {:.0%} of '
+                              'the pacemaker operation timeout'
+                              ''.format(DEADLINE_SHARE).replace('%', '%%')),
+                        type=float,
+                        default=None)
 
     def read_int_list(s):
         try:
@@ -339,6 +522,21 @@ def dns_ha():
                               'comma-separated list.'),
                         type=read_int_list,
                         default=[500])
+    parser.add_argument('--maas_driver',
+                        help=('How to talk to the MAAS API: "session" keeps '
+                              'the connection alive and decodes JSON, "api" '
+                              'uses the MAAS client dispatcher'),
+                        choices=['session', 'api'],
+                        default='session')
+    parser.add_argument('--cache_file',
+                        help='Path of the cached dnsresource IDs',
+                        default=CACHE_FILE)
+    parser.add_argument('--cache_ttl',
+                        help=('Seconds a cached dnsresource ID is used for '
+                              'before being looked up again, 0 to disable '
+                              'the cache'),
+                        type=int,
+                        default=CACHE_TTL)
     global options
     options = parser.parse_args()
 
@@ -346,6 +544,17 @@ def dns_ha():
     logging.info("Starting maas_dns")
 
     dns_obj = MAASDNS(options)
+    if dns_obj.from_cache:
+        # The cached dnsresource has no addresses to compare with, updating
+        # it costs a single request.
+        logging.info('Update the dnsresource with IP: {}'
+                     ''.format(options.ip_address))
+        if dns_obj.update_resource().ok:
+            return
+        logging.info('The cached dnsresource ID of {} is stale'
+                     ''.format(options.fqdn))
+        dns_obj.cache_dnsresource_id(None)
+        dns_obj.get_dnsresource(use_cache=False)
     if not dns_obj.dnsresource:
         dns_obj.create_dnsresource()
     elif dns_obj.dnsresource.get('ip_addresses'):
@@ -16,13 +16,16 @@
 
 import aiohttp
 import functools
+import json
 import os
 import subprocess
 import sys
+import tempfile
 import time
 import xml.etree.ElementTree as ET
 
 import maas.client
+from maas.client.bones import CallError
 
 DESCRIPTION = "Maas stonith plugin"
 DESCRIPTION_LONG = "External Maas stonith plugin"
@@ -60,12 +63,56 @@ Maas API key
 </longdesc>
 </parameter>
 
+<parameter name="poll_interval" unique="0">
+<content type="string" default="0.5" />
+<shortdesc lang="en">
+Poll interval
+</shortdesc>
+<longdesc lang="en">
+Seconds between the first two polls of the power state of a machine
+</longdesc>
+</parameter>
+
+<parameter name="poll_backoff" unique="0">
+<content type="string" default="1.5" />
+<shortdesc lang="en">
+Poll backoff
+</shortdesc>
+<longdesc lang="en">
+Factor the poll interval is multiplied by after each poll, up to 5 seconds
+</longdesc>
+</parameter>
+
+<parameter name="poll_deadline" unique="0">
+<content type="string" default="30" />
+<shortdesc lang="en">
+Poll deadline
+</shortdesc>
+<longdesc lang="en">
+Seconds to wait for a machine to reach a power state before failing, it
+should be lower than the pacemaker stonith-timeout
+</longdesc>
+</parameter>
+
 </parameters>"""
 
 INFO = "info"
 DEBUG = "debug"
+WARN = "warn"
 CRIT = "crit"
 
+# Defaults of the power state polling parameters.
+POLL_INTERVAL = 0.5
+POLL_BACKOFF = 1.5
+POLL_DEADLINE = 30.0
+# Upper bound of the interval between two polls, whatever the backoff.
+MAX_POLL_INTERVAL = 5.0
+
+# hostname -> system_id of the machines already looked up, by MAAS URL. A
+# cached system_id saves listing the machines by hostname, the entry is
+# checked against the machine it returns and refreshed when it is stale.
+SYSTEM_ID_CACHE = '/var/cache/hacluster/maas-stonith-system-ids.json'
+
 
 class FindMachineException(Exception):
     """Exception raised when machine lookup fails
@@ -105,7 +152,7 @@ def get_config_names():
 
 
 def log(msg, level=None):
-    """Log messages
+    """Log messages to syslog and the cluster log through ha_log.sh
 
     :param msg: Message to log
     :type msg: str
@@ -114,8 +161,6 @@ def log(msg, level=None):
     """
     level = level or 'debug'
     subprocess.call(['ha_log.sh', level, msg])
-    with open('/tmp/maas.log', 'a') as f:
-        f.write('{} {}\n'.format(level, msg))
 
 
 def get_maas_client(maas_url, auth_token):
@@ -134,48 +179,155 @@ def get_maas_client(maas_url, auth_token):
         apikey=auth_token)
 
 
-def get_machine(client, hostname):
+def load_system_ids(path=SYSTEM_ID_CACHE):
+    """Load the hostname to system_id cache.
+
+    :param path: Path of the cache
+    :type path: str
+    :returns: system_id by hostname, by MAAS URL
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def save_system_ids(cache, path=SYSTEM_ID_CACHE):
+    """Save the hostname to system_id cache, replacing it atomically.
+
+    Failing to save it only costs a lookup on the next operation.
+
+    :param cache: system_id by hostname, by MAAS URL
+    :type cache: Dict[str, Dict[str, str]]
+    :param path: Path of the cache
+    :type path: str
+    """
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        with tempfile.NamedTemporaryFile('w', dir=dirname, prefix='.',
+                                         delete=False) as f:
+            json.dump(cache, f)
+        os.rename(f.name, path)
+    except OSError as e:
+        log("Unable to save the system_id cache: {}".format(e), WARN)
+
+
+def machine_matches(machine, hostname):
+    """Whether the machine is the one with the given hostname."""
+    return hostname in (machine.hostname, machine.fqdn)
+
+
+def get_machine(client, hostname, maas_url=None):
     """Return the machine corresponding to hostname.
 
+    The system_id of the machine is looked up in the on-disk cache first,
+    the machines are only listed by hostname when it isn't cached or the
+    cached one doesn't match anymore.
+
     :param client: Maas client
     :type client: maas.client.facade.Client
     :param hostname: Name of hostname to lookup.
     :type hostname: str
+    :param maas_url: URL of maas api, the cache isn't used if None
+    :type maas_url: Optional[str]
     :returns: Maas machine
     :rtype: origin.Machine
     """
-    log("Creating maas client", DEBUG)
+    cache = load_system_ids(SYSTEM_ID_CACHE) if maas_url else {}
+    system_id = cache.get(maas_url, {}).get(hostname)
+    if system_id:
+        log("Getting machine {} ({}) from maas".format(hostname, system_id),
+            DEBUG)
+        try:
+            machine = client.machines.get(system_id=system_id)
+        except CallError as e:
+            log("Cached system_id {} of {} is stale: {}".format(
+                system_id, hostname, e), INFO)
+        else:
+            if machine_matches(machine, hostname):
+                return machine
+            log("Cached system_id {} is now {}, not {}".format(
+                system_id, machine.hostname, hostname), INFO)
+
     log("Getting machine with hostname {} from maas ".format(hostname), DEBUG)
     machines = client.machines.list(hostnames=[hostname])
     if len(machines) != 1:
         raise FindMachineException(len(machines))
     log("Found machine {} ({})".format(hostname, machines[0].system_id), DEBUG)
+    if maas_url:
+        cache.setdefault(maas_url, {})[hostname] = machines[0].system_id
+        save_system_ids(cache, SYSTEM_ID_CACHE)
     return machines[0]
 
 
-def wait_for_power_state(client, hostname, state):
+def get_poll_config(config=None):
+    """Return the power state polling parameters.
+
+    Missing or invalid parameters are replaced by their default.
+
+    :param config: Config as returned by get_environment_config
+    :type config: Optional[dict]
+    :returns: Poll interval, backoff and deadline
+    :rtype: Tuple[float, float, float]
+    """
+    config = config or {}
+    values = []
+    for name, default, minimum in (('poll_interval', POLL_INTERVAL, 0.1),
+                                   ('poll_backoff', POLL_BACKOFF, 1.0),
+                                   ('poll_deadline', POLL_DEADLINE, 0.0)):
+        try:
+            value = float(config.get(name) or default)
+        except ValueError:
+            log("Invalid {} {}, using {}".format(
+                name, config.get(name), default), WARN)
+            value = default
+        values.append(max(value, minimum))
+    return tuple(values)
+
+
+def wait_for_power_state(machine, state, poll_config=None):
     """Wait for machine power to reach given state.
 
-    :param client: Maas client
-    :type client: maas.client.facade.Client
-    :param hostname: Name of hostname to lookup.
-    :type hostname: str
+    The power state is polled at an interval growing by the backoff factor
+    until the state is reached or the deadline has passed.
+
+    :param machine: Maas machine, refreshed while waiting
+    :type machine: origin.Machine
     :param state: Target power state
     :type state: maas.client.enum.PowerState
+    :param poll_config: Poll interval, backoff and deadline
+    :type poll_config: Optional[Tuple[float, float, float]]
+    :returns: Seconds it took to reach the state
+    :rtype: float
     :raises: MachinePowerException
     """
-    log("Waiting for {} to reach power state {}".format(hostname, state.value),
-        DEBUG)
-    for i in range(0, 20):
-        machine = get_machine(client, hostname)
+    interval, backoff, deadline = poll_config or get_poll_config()
+    hostname = machine.hostname
+    log("Waiting up to {}s for {} to reach power state {}".format(
+        deadline, hostname, state.value), DEBUG)
+    start = time.monotonic()
+    polls = 0
+    while True:
+        machine.refresh()
+        polls += 1
+        elapsed = time.monotonic() - start
         if machine.power_state == state:
-            log("{} reached {}".format(hostname, state.value), DEBUG)
             break
-        time.sleep(0.5)
-    else:
-        raise MachinePowerException(state.value)
-    log("{} is in power state {}".format(hostname, machine.power_state.value),
-        INFO)
+        remaining = deadline - elapsed
+        if remaining <= 0:
+            log("{} did not reach power state {} in {:.2f}s ({} polls), it "
+                "is {}".format(hostname, state.value, elapsed, polls,
+                               machine.power_state.value), CRIT)
+            raise MachinePowerException(state.value)
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, MAX_POLL_INTERVAL)
+    log("{} reached power state {} in {:.2f}s ({} polls)".format(
+        hostname, state.value, elapsed, polls), INFO)
+    return elapsed
 
 
 def power_on(maas_url, auth_token, hostname):
@@ -192,7 +344,7 @@ def power_on(maas_url, auth_token, hostname):
     """
     log("Powering on {}".format(hostname), INFO)
     client = get_maas_client(maas_url, auth_token)
-    machine = get_machine(client, hostname)
+    machine = get_machine(client, hostname, maas_url)
     machine.power_on()
     return 0
 
@@ -211,12 +363,12 @@ def power_off(maas_url, auth_token, hostname):
     """
     log("Powering off {}".format(hostname), INFO)
     client = get_maas_client(maas_url, auth_token)
-    machine = get_machine(client, hostname)
+    machine = get_machine(client, hostname, maas_url)
     machine.power_off()
     return 0
 
 
-def power_reset(maas_url, auth_token, hostname):
+def power_reset(maas_url, auth_token, hostname, poll_config=None):
     """Reset power on given machine
 
     :param maas_url: URL of maas api
@@ -225,12 +377,15 @@ def power_reset(maas_url, auth_token, hostname):
     :type auth_token: str
     :param hostname: Name of hostname to lookup.
     :type hostname: str
+    :param poll_config: Poll interval, backoff and deadline
+    :type poll_config: Optional[Tuple[float, float, float]]
     :returns: Success indicator
     :rtype: int
     """
     log("Performing power reset on {}".format(hostname), INFO)
+    start = time.monotonic()
     client = get_maas_client(maas_url, auth_token)
-    machine = get_machine(client, hostname)
+    machine = get_machine(client, hostname, maas_url)
     log("{} is in power state {}".format(hostname, machine.power_state.value),
         INFO)
     if machine.power_state != maas.client.enum.PowerState.OFF:
@@ -239,9 +394,12 @@ def power_reset(maas_url, auth_token, hostname):
     else:
         log("Skipping power off of {} it is already off".format(hostname),
             INFO)
-    wait_for_power_state(client, hostname, maas.client.enum.PowerState.OFF)
+    off_time = wait_for_power_state(
+        machine, maas.client.enum.PowerState.OFF, poll_config)
     log("Powering on {}".format(hostname), INFO)
     machine.power_on()
+    log("Fenced {} in {:.2f}s, {:.2f}s waiting for power off".format(
+        hostname, time.monotonic() - start, off_time), INFO)
     return 0
 
 
@@ -360,7 +518,7 @@ def map_commands(args):
         'on': functools.partial(power_on, maas_url, auth_token, hostname),
         'off': functools.partial(power_off, maas_url, auth_token, hostname),
         'reset': functools.partial(power_reset, maas_url, auth_token,
-                                   hostname),
+                                   hostname, get_poll_config(config)),
         'status': functools.partial(status, maas_url, auth_token),
         'gethosts': show_hosts,
         'getconfignames': show_config_names,
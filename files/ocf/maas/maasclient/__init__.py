@@ -15,6 +15,7 @@
 import logging
 
 from .apidriver import APIDriver
+from .apidriver import SessionAPIDriver
 
 log = logging.getLogger('vmaas.main')
 
@@ -36,7 +37,17 @@ class MAASClient(object):
     def __init__(self, api_url, api_key, **kwargs):
         self.driver = self._get_driver(api_url, api_key, **kwargs)
 
-    def _get_driver(self, api_url, api_key, **kwargs):
+    def _get_driver(self, api_url, api_key, driver='api', **kwargs):
+        """
+        Return the driver used to talk to the MAAS API.
+
+        :param driver: 'api' for the MAAS client dispatcher, which opens a
+                       connection per request, or 'session' for a keep-alive
+                       OAuth session decoding the responses as JSON
+        :type driver: str
+        """
+        if driver == 'session':
+            return SessionAPIDriver(api_url, api_key)
         return APIDriver(api_url, api_key)
 
     def _validate_maas(self):
@@ -53,10 +64,12 @@ class MAASClient(object):
     ###########################################################################
     #  DNS API - http://maas.ubuntu.com/docs2.0/api.html#dnsresource
     ###########################################################################
-    def get_dnsresources(self):
+    def get_dnsresources(self, fqdn=None):
         """
         Get a listing of DNS resources which are currently defined.
 
+        The listing is filtered by the MAAS server when fqdn is given.
+
         DNS object is a dictionary of the form:
         {'fqdn': 'keystone.maas',
          'resource_records': [],
@@ -65,10 +78,12 @@ class MAASClient(object):
          'ip_addresses': [],
          'id': 1}
 
+        :param fqdn: Only list the DNS resources of this fqdn
+        :type fqdn: Optional[str]
         :returns: a list of DNS objects
         :rtype: List[Dict[str, Any]]
         """
-        resp = self.driver.get_dnsresources()
+        resp = self.driver.get_dnsresources(fqdn)
         if resp.ok:
             return resp.data
         return []
@@ -101,14 +116,16 @@ class MAASClient(object):
     ###########################################################################
     #  IP API - http://maas.ubuntu.com/docs2.0/api.html#ip-address
     ###########################################################################
-    def get_ipaddresses(self):
+    def get_ipaddresses(self, ip_address=None):
         """
         Get a list of ip addresses
 
+        :param ip_address: Only list this ip address
+        :type ip_address: Optional[str]
         :returns: a list of ip address dictionaries
         :rtype: List[str]
         """
-        resp = self.driver.get_ipaddresses()
+        resp = self.driver.get_ipaddresses(ip_address)
         if resp.ok:
             return resp.data
         return []
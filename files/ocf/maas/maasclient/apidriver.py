@@ -12,8 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import yaml
+import json
 import logging
+import time
+
+import requests
+import requests_oauthlib
+import yaml
 
 from apiclient import maas_client as maas
 from .driver import MAASDriver
@@ -26,6 +31,8 @@ except ImportError:
 
 log = logging.getLogger('vmaas.main')
 OK = 200
+# Seconds to wait for the MAAS API to accept a connection and to answer.
+REQUEST_TIMEOUT = (10, 60)
 
 
 class APIDriver(MAASDriver):
@@ -143,12 +150,15 @@ class APIDriver(MAASDriver):
     ###########################################################################
     #  DNS API - http://maas.ubuntu.com/docs2.0/api.html#dnsresource
     ###########################################################################
-    def get_dnsresources(self):
+    def get_dnsresources(self, fqdn=None):
         """
         Get a listing of the MAAS dnsresources
 
+        :param fqdn: Only list the dnsresources of this fqdn
         :returns: a list of MAAS dnsresrouce objects
         """
+        if fqdn:
+            return self._get('/dnsresources/', fqdn=fqdn)
         return self._get('/dnsresources/')
 
     def update_dnsresource(self, rid, fqdn, ip_address):
@@ -188,13 +198,15 @@ class APIDriver(MAASDriver):
     ###########################################################################
     #  IP API - http://maas.ubuntu.com/docs2.0/api.html#ip-addresses
     ###########################################################################
-    def get_ipaddresses(self):
+    def get_ipaddresses(self, ip_address=None):
         """
         Get a dictionary of a given ip_address
 
         :param ip_address: The ip address to get information for
         :returns: a dictionary for a given ip
         """
+        if ip_address:
+            return self._get('/ipaddresses/', ip=ip_address)
         return self._get('/ipaddresses/')
 
     def create_ipaddress(self, ip_address, hostname=None):
@@ -212,3 +224,120 @@ class APIDriver(MAASDriver):
         else:
             return self._post('/ipaddresses/', op='reserve',
                               ip_addresses=ip_address)
+
+
+class SessionAPIDriver(APIDriver):
+    """
+    A MAAS driver implementation which uses the MAAS API through a single
+    OAuth session.
+
+    The connection to the MAAS server is kept alive between the requests,
+    the responses are decoded as JSON and the time taken by every request
+    is logged.
+    """
+
+    def __init__(self, api_url, api_key, *args, **kwargs):
+        super(SessionAPIDriver, self).__init__(api_url, api_key, *args,
+                                               **kwargs)
+        self._session = None
+
+    @property
+    def session(self):
+        """
+        OAuth session with the MAAS API.
+
+        :rtype: requests_oauthlib.OAuth1Session
+        """
+        if self._session:
+            return self._session
+
+        if self.api_key:
+            consumer_key, token_key, token_secret = self.api_key.split(':')
+            # The use of PLAINTEXT signature is inline with libmaas.
+            self._session = requests_oauthlib.OAuth1Session(
+                consumer_key,
+                signature_method='PLAINTEXT',
+                resource_owner_key=token_key,
+                resource_owner_secret=token_secret)
+        else:
+            # Anonymous access, as with the MAAS client dispatcher.
+            self._session = requests.Session()
+        self._session.headers['Accept'] = 'application/json'
+        return self._session
+
+    def _request(self, method, path, decode=True, **kwargs):
+        """
+        Issues a request to the MAAS REST API.
+
+        :param method: HTTP method
+        :param path: Path of the API endpoint, relative to the API URL
+        :param decode: Whether to decode the JSON payload of the response
+        :returns: the response of the MAAS API
+        :rtype: maasclient.driver.Response
+        """
+        url = self.api_url + path.lstrip('/')
+        start = time.monotonic()
+        response = self.session.request(method, url, timeout=REQUEST_TIMEOUT,
+                                        **kwargs)
+        log.info("%s %s: %s in %.3fs, %d bytes", method, path,
+                 response.status_code, time.monotonic() - start,
+                 len(response.content))
+        log.debug("Request %s results: [%s] %s", path, response.status_code,
+                  response.content)
+        if response.status_code != OK:
+            return Response(False, response.content, response.status_code)
+        if not decode:
+            return Response(True, response.content, OK)
+        try:
+            return Response(True, json.loads(response.text), OK)
+        except ValueError as e:
+            log.error("Invalid JSON returned by %s: %s", path, e)
+            return Response(False, response.content, response.status_code)
+
+    def validate_maas(self):
+        return self._get('/')
+
+    def _get(self, path, **kwargs):
+        """
+        Issues a GET request to the MAAS REST API, returning the data
+        from the query in the python form of the json data.
+        """
+        try:
+            return self._request('GET', path, params=kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            # Left to the caller to retry.
+            raise
+        except requests.RequestException as e:
+            log.error("Get request to %s with params %s raised exception: "
+                      "%s", path, str(kwargs), e)
+            return Response(False, None, None)
+
+    def _post(self, path, op=None, **kwargs):
+        """
+        Issues a POST request to the MAAS REST API.
+        """
+        try:
+            return self._request('POST', path,
+                                 params={'op': op} if op else None,
+                                 data=kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            # Left to the caller to retry.
+            raise
+        except requests.RequestException as e:
+            log.error("Post request to %s with params %s raised exception: "
+                      "%s", path, str(kwargs), e)
+            return Response(False, None, None)
+
+    def _put(self, path, **kwargs):
+        """
+        Issues a PUT request to the MAAS REST API.
+        """
+        try:
+            return self._request('PUT', path, decode=False, data=kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            # Left to the caller to retry.
+            raise
+        except requests.RequestException as e:
+            log.error("Put request to %s with params %s raised exception: "
+                      "%s", path, str(kwargs), e)
+            return Response(False, None, None)
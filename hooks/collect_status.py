@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+#
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Collect the cluster status snapshot and metrics.
+
+Run by the hacluster-status-snapshot systemd timer, see
+pcmk.collect_status_snapshot() and metrics.write_textfile(). crm_mon is run
+once for both.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+_path = os.path.dirname(os.path.realpath(__file__))
+_root = os.path.abspath(os.path.join(_path, '..'))
+
+
+def _add_path(path):
+    if path not in sys.path:
+        sys.path.insert(1, path)
+
+
+_add_path(_path)
+_add_path(_root)
+
+
+import metrics  # noqa: E402
+import pcmk  # noqa: E402
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ttl', type=int, default=0,
+                        help='seconds the snapshot is considered fresh for, '
+                             'no snapshot is written if 0')
+    parser.add_argument('--path', default=pcmk.STATUS_SNAPSHOT,
+                        help='path of the snapshot')
+    parser.add_argument('--textfile',
+                        help='path of the node_exporter textfile to write '
+                             'the metrics to')
+    args = parser.parse_args(args)
+    try:
+        xml = pcmk.crm_mon_xml()
+        if args.ttl > 0:
+            pcmk.collect_status_snapshot(args.ttl, args.path, xml)
+        if args.textfile:
+            metrics.write_textfile(args.textfile, xml)
+    # ValueError is raised when the version of crm_mon can't be parsed.
+    except (subprocess.CalledProcessError, OSError, ValueError) as e:
+        print('Unable to collect the cluster status: {}'.format(e),
+              file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -86,6 +86,7 @@ from utils import (
     parse_data,
     configure_corosync,
     configure_stonith,
+    configure_status_snapshot,
     configure_monitor_host,
     configure_cluster_global,
     configure_pacemaker_remote_resources,
@@ -228,6 +229,7 @@ def config_changed():
             run_initial_setup()
 
     update_nrpe_config()
+    configure_status_snapshot()
 
     cfg = config()
     if (is_leader() and
@@ -431,7 +433,9 @@ def ha_relation_changed():
     # NOTE: this should be removed in 15.04 cycle as corosync
     # configuration should be set directly on subordinate
     configure_corosync()
-    try_pcmk_wait()
+    # Enough nodes are in the cluster by now, the resources are only
+    # configured once it has quorum.
+    try_pcmk_wait(require_quorum=True)
 
     # Only configure the cluster resources
     # from the oldest peer unit.
@@ -439,28 +443,28 @@ def ha_relation_changed():
         run_initial_setup()
         log('Setting cluster symmetry', level=INFO)
         set_cluster_symmetry()
-        log('Deleting Resources' % (delete_resources), level=DEBUG)
+        log('Deleting Resources: %s' % (delete_resources), level=DEBUG)
         for res_name in delete_resources:
-            if pcmk.crm_opt_exists(res_name):
-                if ocf_file_exists(res_name, resources):
-                    log('Stopping and deleting resource %s' % res_name,
-                        level=DEBUG)
-                    if pcmk.crm_res_running(res_name):
-                        pcmk.commit('crm -w -F resource stop %s' % res_name)
-                else:
-                    log('Cleanuping and deleting resource %s' % res_name,
-                        level=DEBUG)
-                    pcmk.commit('crm resource cleanup %s' % res_name)
-                # Daemon process may still be running after the upgrade.
-                kill_legacy_ocf_daemon_process(res_name)
-
-                # Stop the resource before the deletion (LP: #1838528)
-                log('Stopping %s' % res_name, level=INFO)
-                pcmk.commit('crm -w -F resource stop %s' % res_name)
-                log('Deleting %s' % res_name, level=INFO)
-                pcmk.commit('crm -w -F configure delete %s' % res_name)
-
-        log('Configuring Resources: %s' % (resources), level=DEBUG)
+            if not pcmk.crm_opt_exists(res_name):
+                continue
+            if ocf_file_exists(res_name, resources):
+                log('Stopping and deleting resource %s' % res_name,
+                    level=DEBUG)
+                if pcmk.crm_res_running(res_name):
+                    pcmk.commit('crm -w -F resource stop %s' % res_name)
+            else:
+                log('Cleanuping and deleting resource %s' % res_name,
+                    level=DEBUG)
+                pcmk.commit('crm resource cleanup %s' % res_name)
+            # Daemon process may still be running after the upgrade.
+            kill_legacy_ocf_daemon_process(res_name)
+
+            # Stop the resource before the deletion (LP: #1838528)
+            log('Stopping %s' % res_name, level=INFO)
+            pcmk.commit('crm -w -F resource stop %s' % res_name)
+            log('Deleting %s' % res_name, level=INFO)
+            pcmk.commit('crm -w -F configure delete %s' % res_name)
+
         for res_name, res_type in resources.items():
             # disable the service we are going to put in HA
             if res_type.split(':')[0] == "lsb":
@@ -473,83 +477,29 @@ def ha_relation_changed():
                 disable_upstart_services(init_services[res_name])
                 if service_running(init_services[res_name]):
                     service_stop(init_services[res_name])
-            # Put the services in HA, if not already done so
-            # if not pcmk.is_resource_present(res_name):
-            if not pcmk.crm_opt_exists(res_name):
-                if res_name not in resource_params:
-                    cmd = 'crm -w -F configure primitive %s %s' % (res_name,
-                                                                   res_type)
-                else:
-                    cmd = ('crm -w -F configure primitive %s %s %s' %
-                           (res_name, res_type, resource_params[res_name]))
-
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-                if config('monitor_host'):
-                    cmd = ('crm -F configure location Ping-%s %s rule '
-                           '-inf: pingd lte 0' % (res_name, res_name))
-                    pcmk.commit(cmd)
-
-            else:
-                # the resource already exists so it will be updated.
-                code = pcmk.crm_update_resource(res_name, res_type,
-                                                resource_params.get(res_name))
-                if code != 0:
-                    msg = "Cannot update pcmkr resource: {}".format(res_name)
-                    status_set('blocked', msg)
-                    raise Exception(msg)
-
-        log('Configuring Groups: %s' % (groups), level=DEBUG)
-        for grp_name, grp_params in groups.items():
-            if not pcmk.crm_opt_exists(grp_name):
-                cmd = ('crm -w -F configure group %s %s' %
-                       (grp_name, grp_params))
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-
-        log('Configuring Master/Slave (ms): %s' % (ms), level=DEBUG)
-        for ms_name, ms_params in ms.items():
-            if not pcmk.crm_opt_exists(ms_name):
-                cmd = 'crm -w -F configure ms %s %s' % (ms_name, ms_params)
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-
-        log('Configuring Orders: %s' % (orders), level=DEBUG)
-        for ord_name, ord_params in orders.items():
-            if not pcmk.crm_opt_exists(ord_name):
-                cmd = 'crm -w -F configure order %s %s' % (ord_name,
-                                                           ord_params)
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-
-        log('Configuring Clones: %s' % clones, level=DEBUG)
-        for cln_name, cln_params in clones.items():
-            if not pcmk.crm_opt_exists(cln_name):
-                cmd = 'crm -w -F configure clone %s %s' % (cln_name,
-                                                           cln_params)
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-
-        # Ordering is important here, colocation and location constraints
-        # reference resources. All resources referenced by the constraints
-        # need to exist otherwise constraint creation will fail.
-
-        log('Configuring Colocations: %s' % colocations, level=DEBUG)
-        for col_name, col_params in colocations.items():
-            if not pcmk.crm_opt_exists(col_name):
-                cmd = 'crm -w -F configure colocation %s %s' % (col_name,
-                                                                col_params)
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
-
-        log('Configuring Locations: %s' % locations, level=DEBUG)
-        for loc_name, loc_params in locations.items():
-            if not pcmk.crm_opt_exists(loc_name):
-                cmd = 'crm -w -F configure location %s %s' % (loc_name,
-                                                              loc_params)
-                pcmk.commit(cmd)
-                log('%s' % cmd, level=DEBUG)
 
+        # Only the objects that differ from the CIB are applied, see
+        # pcmk.apply_cib_objects.
+        desired = pcmk.desired_cib_objects(
+            resources=resources,
+            resource_params=resource_params,
+            groups=groups,
+            ms=ms,
+            orders=orders,
+            clones=clones,
+            colocations=colocations,
+            locations=locations,
+            monitor_host=bool(config('monitor_host')))
+        log('Configuring cluster objects: %s' % list(desired), level=DEBUG)
+        if pcmk.apply_cib_objects(
+                desired, batch=bool(config('batch_configure'))) != 0:
+            msg = "Cannot apply pcmkr configuration"
+            status_set('blocked', msg)
+            raise Exception(msg)
+
+        # Resources which failed or aren't running are cleaned up so that
+        # they get started in case they failed for some unrelated reason.
+        failed = pcmk.failed_resources()
         for res_name, res_type in resources.items():
             if len(init_services) != 0 and res_name in init_services:
                 # Checks that the resources are running and started.
@@ -559,21 +509,17 @@ def ha_relation_changed():
                 # than as individual resources.
                 if (res_name not in clones.values() and
                     res_name not in groups.values() and
-                        not pcmk.crm_res_running(res_name)):
-                    # Just in case, cleanup the resources to ensure they get
-                    # started in case they failed for some unrelated reason.
+                        (res_name in failed or
+                         not pcmk.crm_res_running(res_name))):
                     cmd = 'crm resource cleanup %s' % res_name
                     pcmk.commit(cmd)
 
-        for cl_name in clones:
-            # Always cleanup clones
-            cmd = 'crm resource cleanup %s' % cl_name
-            pcmk.commit(cmd)
-
-        for grp_name in groups:
-            # Always cleanup groups
-            cmd = 'crm resource cleanup %s' % grp_name
-            pcmk.commit(cmd)
+        for name, members in list(clones.items()) + list(groups.items()):
+            if (name in failed or
+                    any(member in failed for member in members.split()) or
+                    not pcmk.crm_res_running(name)):
+                cmd = 'crm resource cleanup %s' % name
+                pcmk.commit(cmd)
 
         # All members of the cluster need to be registered before resources
         # that reference them can be created.
@@ -767,6 +713,8 @@ if __name__ == '__main__':
         hooks.execute(sys.argv)
     except UnregisteredHookError as e:
         log('Unknown hook {} - skipping.'.format(e), level=DEBUG)
+    finally:
+        pcmk.report_command_stats(os.path.basename(sys.argv[0]))
     try:
         set_unit_status()
     except Exception:
@@ -0,0 +1,219 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Pacemaker and Corosync metrics for the node_exporter textfile collector.
+
+The metrics are built from the crm_mon output collected for the status
+snapshot and from `corosync-cfgtool -s`, see collect_status.py.
+"""
+
+import collections
+import re
+import subprocess
+import time
+import xml.etree.ElementTree as etree
+
+import pcmk
+
+# Name of the file written in the textfile collector directory.
+TEXTFILE_NAME = 'hacluster.prom'
+
+METRICS = {
+    'hacluster_quorate': (
+        'gauge', 'Whether the cluster partition has quorum.'),
+    'hacluster_dc_info': (
+        'gauge', 'Node acting as the designated controller.'),
+    'hacluster_node_online': (
+        'gauge', 'Whether the node is online.'),
+    'hacluster_node_standby': (
+        'gauge', 'Whether the node is in standby.'),
+    'hacluster_node_maintenance': (
+        'gauge', 'Whether the node is in maintenance.'),
+    'hacluster_resource_role': (
+        'gauge', 'Instances of the resource in the role on the node.'),
+    'hacluster_resource_failed': (
+        'gauge', 'Failed instances of the resource on the node.'),
+    'hacluster_resource_unmanaged': (
+        'gauge', 'Unmanaged instances of the resource on the node.'),
+    'hacluster_resource_failcount': (
+        'gauge', 'Fail count of the resource on the node.'),
+    'hacluster_resource_last_exec_seconds': (
+        'gauge', 'Execution time of the last operation of the resource.'),
+    'hacluster_resource_last_queue_seconds': (
+        'gauge', 'Queue time of the last operation of the resource.'),
+    'hacluster_corosync_ring_up': (
+        'gauge', 'Whether the corosync ring or link has no faults.'),
+    'hacluster_corosync_link_connected': (
+        'gauge', 'Whether the corosync link to the node is connected.'),
+    'hacluster_collect_timestamp_seconds': (
+        'gauge', 'Time the metrics were collected.'),
+}
+
+_RING_RE = re.compile(r'^(?:RING|LINK) ID (\d+)')
+_RING_STATUS_RE = re.compile(r'^\s*status\s*=\s*(.*)$')
+_LINK_NODE_RE = re.compile(r'^\s*nodeid:?\s+(\d+):\s+(\S+)')
+
+
+def _bool(value):
+    return 1 if value == 'true' else 0
+
+
+def cluster_metrics(crm_mon_output):
+    """Metrics of the cluster status.
+
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    :returns: Samples as (metric, labels, value)
+    :rtype: List[Tuple[str, Dict[str, str], float]]
+    """
+    samples = []
+    root = etree.fromstring(crm_mon_output)
+
+    dc = pcmk.get_tag(pcmk.get_tag(root, 'summary'), 'current_dc')
+    samples.append(('hacluster_quorate', {},
+                    _bool(dc.get('with_quorum'))))
+    if dc.get('name'):
+        samples.append(('hacluster_dc_info', {'node': dc.get('name')}, 1))
+
+    for node in pcmk.get_tag(root, 'nodes').findall('node'):
+        labels = {'node': node.get('name'), 'type': node.get('type', '')}
+        for attr in ('online', 'standby', 'maintenance'):
+            samples.append(('hacluster_node_{}'.format(attr), labels,
+                            _bool(node.get(attr))))
+
+    # Instances of a clone share the resource id and stopped ones have no
+    # node, they are counted so that every series is unique.
+    instances = collections.Counter()
+    for resource in pcmk.get_tag(root, 'resources').iter('resource'):
+        res_id = resource.get('id')
+        nodes = [node.get('name') for node in resource.findall('node')]
+        for node in nodes or ['']:
+            instances['hacluster_resource_role', res_id, node,
+                      resource.get('role', '')] += 1
+            instances['hacluster_resource_failed', res_id, node, None] += \
+                _bool(resource.get('failed'))
+            instances['hacluster_resource_unmanaged', res_id, node, None] += \
+                int(resource.get('managed') == 'false')
+    for (metric, res_id, node, role), count in sorted(
+            instances.items(), key=lambda item: [str(k) for k in item[0]]):
+        labels = {'resource': res_id, 'node': node}
+        if role is not None:
+            labels['role'] = role
+        samples.append((metric, labels, count))
+
+    for node in pcmk.get_tag(root, 'node_history').findall('node'):
+        for history in node.findall('resource_history'):
+            labels = {'resource': history.get('id'),
+                      'node': node.get('name')}
+            failcount = history.get('fail-count', '0')
+            samples.append(('hacluster_resource_failcount', labels,
+                            float('inf') if failcount == 'INFINITY'
+                            else int(failcount)))
+            operations = history.findall('operation_history')
+            if not operations:
+                continue
+            last = max(operations, key=lambda op: int(op.get('call', 0)))
+            labels = dict(labels, operation=last.get('task', ''))
+            samples.append(('hacluster_resource_last_exec_seconds', labels,
+                            pcmk.duration_ms(last.get('exec-time')) / 1000.0))
+            samples.append(('hacluster_resource_last_queue_seconds', labels,
+                            pcmk.duration_ms(last.get('queue-time')) / 1000.0))
+
+    return samples
+
+
+def corosync_metrics(cfgtool_output):
+    """Metrics of the corosync rings or links.
+
+    :param cfgtool_output: Output of `corosync-cfgtool -s`
+    :type cfgtool_output: str
+    :returns: Samples as (metric, labels, value)
+    :rtype: List[Tuple[str, Dict[str, str], float]]
+    """
+    samples = []
+    ring = None
+    for line in cfgtool_output.splitlines():
+        match = _RING_RE.match(line)
+        if match:
+            ring = match.group(1)
+            continue
+        if ring is None:
+            continue
+        match = _RING_STATUS_RE.match(line)
+        if match:
+            status = match.group(1).strip()
+            samples.append(('hacluster_corosync_ring_up', {'ring': ring},
+                            1 if 'no faults' in status or status == 'OK'
+                            else 0))
+            continue
+        match = _LINK_NODE_RE.match(line)
+        if match:
+            samples.append(('hacluster_corosync_link_connected',
+                            {'ring': ring, 'nodeid': match.group(1)},
+                            1 if match.group(2) in ('connected', 'localhost')
+                            else 0))
+    return samples
+
+
+def format_metrics(samples):
+    """Format samples in the Prometheus text exposition format.
+
+    :param samples: Samples as (metric, labels, value)
+    :type samples: List[Tuple[str, Dict[str, str], float]]
+    :returns: Metrics text
+    :rtype: str
+    """
+    by_metric = {}
+    for metric, labels, value in samples:
+        by_metric.setdefault(metric, []).append((labels, value))
+
+    lines = []
+    for metric in sorted(by_metric):
+        metric_type, help_text = METRICS[metric]
+        lines.append('# HELP {} {}'.format(metric, help_text))
+        lines.append('# TYPE {} {}'.format(metric, metric_type))
+        for labels, value in by_metric[metric]:
+            label_text = ','.join(
+                '{}="{}"'.format(key, str(labels[key]).replace(
+                    '\\', '\\\\').replace('"', '\\"'))
+                for key in sorted(labels))
+            if value == float('inf'):
+                value = '+Inf'
+            lines.append('{}{} {}'.format(
+                metric, '{' + label_text + '}' if label_text else '', value))
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path, crm_mon_output):
+    """Write the metrics for the node_exporter textfile collector.
+
+    The corosync metrics are left out if corosync-cfgtool can't be run.
+
+    :param path: Path of the textfile.
+    :type path: str
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    """
+    samples = cluster_metrics(crm_mon_output)
+    try:
+        cfgtool_output = pcmk.check_output(['corosync-cfgtool', '-s'],
+                                           universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        # Exits non-zero when a ring or link is faulty.
+        cfgtool_output = e.output or ''
+    except OSError:
+        cfgtool_output = ''
+    samples.extend(corosync_metrics(cfgtool_output))
+    samples.append(('hacluster_collect_timestamp_seconds', {}, time.time()))
+    pcmk.write_atomically(path, format_metrics(samples))
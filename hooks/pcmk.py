@@ -12,8 +12,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import hashlib
+import json
+import math
+import os
 import re
+import shutil
 import subprocess
 import socket
 import tempfile
@@ -24,6 +29,7 @@ from distutils.version import StrictVersion
 from io import StringIO
 from charmhelpers.core import unitdata
 from charmhelpers.core.hookenv import (
+    local_unit,
     log,
     INFO,
     DEBUG,
@@ -43,35 +49,597 @@ class PropertyNotFound(Exception):
     pass
 
 
-def wait_for_pcmk(retries=12, sleep=10):
+# Directory where the summary of the commands run by each hook is saved.
+COMMAND_STATS_DIR = '/var/lib/juju'
+
+
+# Commands run during this hook execution, see check_output() and friends.
+_command_stats = []
+
+CommandStat = collections.namedtuple(
+    'CommandStat', ['cmd', 'verb', 'duration', 'returncode', 'output_size'])
+
+
+def command_verb(cmd):
+    """Name of the command used to aggregate statistics.
+
+    crm is followed by its first sub-command (e.g. "crm configure").
+
+    :param cmd: command as run
+    :type cmd: Union[str, List[str]]
+    :returns: command verb
+    :rtype: str
+    """
+    args = cmd.split() if isinstance(cmd, str) else list(cmd)
+    if not args:
+        return ''
+    verb = os.path.basename(args[0])
+    if verb == 'crm':
+        sub = [arg for arg in args[1:] if not arg.startswith('-')]
+        if sub:
+            verb = '{} {}'.format(verb, sub[0])
+    return verb
+
+
+def _record_command(cmd, start, returncode, output=None):
+    _command_stats.append(CommandStat(
+        cmd=cmd if isinstance(cmd, str) else ' '.join(cmd),
+        verb=command_verb(cmd),
+        duration=time.monotonic() - start,
+        returncode=returncode,
+        output_size=len(output) if output is not None else 0))
+
+
+def check_output(cmd, **kwargs):
+    """Timed subprocess.check_output()."""
+    start = time.monotonic()
+    try:
+        output = subprocess.check_output(cmd, **kwargs)
+    except subprocess.CalledProcessError as e:
+        _record_command(cmd, start, e.returncode, e.output)
+        raise
+    except OSError:
+        _record_command(cmd, start, None)
+        raise
+    _record_command(cmd, start, 0, output)
+    return output
+
+
+def check_call(cmd, **kwargs):
+    """Timed subprocess.check_call()."""
+    start = time.monotonic()
+    try:
+        retcode = subprocess.check_call(cmd, **kwargs)
+    except subprocess.CalledProcessError as e:
+        _record_command(cmd, start, e.returncode)
+        raise
+    except OSError:
+        _record_command(cmd, start, None)
+        raise
+    _record_command(cmd, start, retcode)
+    return retcode
+
+
+def call(cmd, **kwargs):
+    """Timed subprocess.call()."""
+    start = time.monotonic()
+    try:
+        retcode = subprocess.call(cmd, **kwargs)
+    except OSError:
+        _record_command(cmd, start, None)
+        raise
+    _record_command(cmd, start, retcode)
+    return retcode
+
+
+def getstatusoutput(cmd):
+    """Timed subprocess.getstatusoutput()."""
+    start = time.monotonic()
+    status, output = subprocess.getstatusoutput(cmd)
+    _record_command(cmd, start, status, output)
+    return status, output
+
+
+def command_stats_summary(top=5):
+    """Summarize the commands run during this hook execution.
+
+    :param top: Number of slowest commands to report.
+    :type top: int
+    :returns: Total time, counts and time per verb and slowest commands
+    :rtype: Dict[str, Any]
+    """
+    verbs = {}
+    for stat in _command_stats:
+        verb = verbs.setdefault(stat.verb, {'count': 0, 'time': 0.0})
+        verb['count'] += 1
+        verb['time'] = round(verb['time'] + stat.duration, 3)
+    slowest = sorted(_command_stats, key=lambda s: s.duration, reverse=True)
+    return {
+        'count': len(_command_stats),
+        'time': round(sum(s.duration for s in _command_stats), 3),
+        'verbs': verbs,
+        'slowest': [{'cmd': s.cmd,
+                     'time': round(s.duration, 3),
+                     'returncode': s.returncode,
+                     'output_size': s.output_size}
+                    for s in slowest[:top]]}
+
+
+def report_command_stats(name, stats_dir=COMMAND_STATS_DIR, top=5):
+    """Log the summary of the commands run and save it as JSON.
+
+    :param name: Name of the hook or action that ran the commands.
+    :type name: str
+    :param stats_dir: Directory of the JSON file, not saved if None.
+    :type stats_dir: Optional[str]
+    :param top: Number of slowest commands to report.
+    :type top: int
+    """
+    summary = command_stats_summary(top=top)
+    log('{}: {} commands run in {:.2f}s, slowest: {}'.format(
+        name, summary['count'], summary['time'],
+        ', '.join('{} ({:.2f}s)'.format(s['cmd'], s['time'])
+                  for s in summary['slowest'])), level=DEBUG)
+    if not stats_dir or not os.path.isdir(stats_dir):
+        return
+
+    summary['name'] = name
+    summary['timestamp'] = time.time()
+    path = os.path.join(stats_dir, '{}-{}-command-stats.json'.format(
+        local_unit().replace('/', '-'), name))
+    try:
+        with open(path, 'w') as f:
+            json.dump(summary, f, indent=2)
+    except OSError as e:
+        log('Unable to save command stats to {}: {}'.format(path, e),
+            level=WARNING)
+
+
+# Tags of the CIB configuration elements that define a resource.
+RESOURCE_TAGS = ('primitive', 'group', 'clone', 'master', 'bundle')
+
+# Resource roles reported by crm_mon for an instance that is up.
+RUNNING_ROLES = ('Started', 'Master', 'Slave', 'Promoted', 'Unpromoted')
+
+# Snapshot of the CIB shared by all the callers in a hook execution, see
+# get_cib_snapshot().
+_cib_snapshot = None
+
+# Attribute set `crm configure property` stores the cluster properties in.
+CLUSTER_OPTIONS_SET = 'cib-bootstrap-options'
+
+# Size of the crm_mon output, in characters, above which it is parsed in a
+# streaming pass rather than as a tree, see parse_cluster_status().
+STREAM_PARSE_THRESHOLD = 8 * 1024 * 1024
+
+# Cluster status collected periodically and shared by the hooks, actions and
+# monitoring checks, see collect_status_snapshot().
+STATUS_SNAPSHOT = '/var/lib/hacluster/cluster-status.json'
+
+# Last time this process changed the cluster, status snapshots collected
+# before then are outdated.
+_cluster_changed_at = 0
+
+# Status snapshots read by this process along with the mtime of their file,
+# keyed by path, see read_status_snapshot().
+_status_snapshots = {}
+
+
+# Backend used to query the cluster, see get_backend().
+_backend = None
+
+# Versions of the cluster commands detected in this hook execution, see
+# cached_version().
+_versions = {}
+
+
+class CrmshBackend(object):
+    """Query the cluster through crmsh.
+
+    Every call starts the crmsh interpreter, this backend is only used when
+    the Pacemaker command line tools aren't available.
+    """
+
+    name = 'crmsh'
+
+    def cib_xml(self):
+        """Get the CIB configuration.
+
+        :returns: XML document with the CIB configuration
+        :rtype: str
+        :raises: subprocess.CalledProcessError
+        """
+        return check_output(['crm', 'configure', 'show', 'xml'],
+                            universal_newlines=True)
+
+    def list_nodes(self):
+        """List the nodes configured in the cluster.
+
+        :returns: Node names
+        :rtype: List[str]
+        :raises: subprocess.CalledProcessError
+        """
+        nodes = []
+        if CompareHostReleases(get_distrib_codename()) >= 'jammy':
+            cmd = ['crm', 'node', 'show']
+            out = check_output(cmd).decode('utf-8')
+            for line in out.strip().split('\n'):
+                if re.match(r'^\S+\(\d+\)', line):
+                    line = line.split('(')[0]
+                    line = line.split(':')[0]
+                    nodes.append(line)
+        else:
+            cmd = ['crm', 'node', 'status']
+            out = check_output(cmd).decode('utf-8')
+            tree = etree.fromstring(out)
+            nodes = [n.attrib['uname'] for n in tree.iter('node')]
+        return nodes
+
+    def get_property(self, name):
+        """Retrieve a cluster's property.
+
+        :param name: property name
+        :type name: str
+        :returns: property value
+        :rtype: str
+        :raises: subprocess.CalledProcessError
+        :raises: pcmk.PropertyNotFound
+        """
+        crm_ver = crm_version()
+        # get-property deprecated in favor of get_property (LP: #2008704)
+        if crm_ver >= StrictVersion('4.2.1'):
+            output = check_output(
+                ['crm', 'configure', 'get_property', name],
+                universal_newlines=True)
+        # crmsh >= 2.3 renamed show-property to get-property, 2.3.x is
+        # available since zesty
+        elif crm_ver >= StrictVersion('2.3.0'):
+            output = check_output(
+                ['crm', 'configure', 'get-property', name],
+                universal_newlines=True)
+        elif crm_ver < StrictVersion('2.2.0'):
+            # before 2.2.0 there is no method to get a property
+            output = check_output(
+                ['crm', 'configure', 'show', 'xml'],
+                universal_newlines=True)
+
+            return get_property_from_xml(name, output)
+        else:
+            output = check_output(
+                ['crm', 'configure', 'show-property', name],
+                universal_newlines=True)
+
+        return output
+
+
+class PacemakerBackend(CrmshBackend):
+    """Query the cluster through the Pacemaker command line tools.
+
+    cibadmin and crm_attribute are small C programs that talk to the
+    cluster daemons directly, so they are much cheaper to run than crmsh.
+    """
+
+    name = 'pacemaker'
+    commands = ('cibadmin', 'crm_attribute')
+
+    def cib_xml(self):
+        return check_output(['cibadmin', '--query'],
+                            universal_newlines=True)
+
+    def list_nodes(self):
+        out = check_output(
+            ['cibadmin', '--query', '--scope', 'nodes'],
+            universal_newlines=True)
+        # pacemaker-remote nodes are listed too, as type="remote".
+        return [n.attrib['uname'] for n in etree.fromstring(out).iter('node')
+                if n.get('type', 'member') == 'member']
+
+    def get_property(self, name):
+        try:
+            return check_output(
+                ['crm_attribute', '--type', 'crm_config', '--name', name,
+                 '--query', '--quiet'],
+                universal_newlines=True)
+        except subprocess.CalledProcessError as e:
+            # crm_attribute exits with ENXIO (Pacemaker 1.x) or
+            # CRM_EX_NOSUCH (Pacemaker 2.x) when the property isn't set.
+            if e.returncode in (6, 105):
+                raise PropertyNotFound(name)
+            raise
+
+
+def get_backend():
+    """Return the backend used to query the cluster.
+
+    The Pacemaker command line tools are used when they are all installed,
+    crmsh otherwise.
+
+    :returns: Cluster query backend
+    :rtype: CrmshBackend
+    """
+    global _backend
+    if _backend is None:
+        if all(shutil.which(cmd) for cmd in PacemakerBackend.commands):
+            _backend = PacemakerBackend()
+        else:
+            _backend = CrmshBackend()
+        log('Querying the cluster with the {} backend'.format(_backend.name),
+            level=DEBUG)
+    return _backend
+
+
+class CIBSnapshot(object):
+    """Point in time view of the cluster configuration and resource status.
+
+    The configuration is fetched at most once and indexed by object id so
+    that repeated lookups don't need to query the cluster. The resource
+    status is only fetched the first time it is needed.
+    """
+
+    def __init__(self):
+        self._objects = None
+        self._status = None
+        self._running = None
+        self._failed = None
+
+    @property
+    def objects(self):
+        """CIB configuration elements indexed by id.
+
+        :returns: Map of object id to its XML element
+        :rtype: Dict[str, etree.Element]
+        """
+        if self._objects is None:
+            try:
+                output = get_backend().cib_xml()
+            except (subprocess.CalledProcessError, OSError) as e:
+                # NOTE: don't cache the failure, pacemaker may still be
+                # starting up.
+                log('Unable to read the CIB: {}'.format(e), WARNING)
+                return {}
+            self._objects = index_cib_objects(output)
+        return self._objects
+
+    @property
+    def running(self):
+        """Nodes each resource is running on, indexed by resource id.
+
+        :returns: Map of resource id to the nodes it is running on
+        :rtype: Dict[str, List[str]]
+        """
+        if self._running is None:
+            status = read_status_snapshot()
+            if status is not None:
+                self._running = status['running']
+                return self._running
+            output = self._status_xml()
+            if output is None:
+                return {}
+            self._running = index_running_resources(output)
+        return self._running
+
+    @property
+    def failed(self):
+        """Resources crm_mon reports as failed.
+
+        :returns: Ids of the failed resources
+        :rtype: Set[str]
+        """
+        if self._failed is None:
+            status = read_status_snapshot()
+            if status is not None:
+                self._failed = set(status['failed'])
+                return self._failed
+            output = self._status_xml()
+            if output is None:
+                return set()
+            self._failed = index_failed_resources(output)
+        return self._failed
+
+    def nvpairs(self, set_id):
+        """Name/value pairs of an attribute set of the CIB configuration.
+
+        :param set_id: id of the attribute set (e.g. "cib-bootstrap-options")
+        :type set_id: str
+        :returns: Values keyed by name, empty if the set doesn't exist
+        :rtype: Dict[str, str]
+        """
+        element = self.objects.get(set_id)
+        if element is None:
+            return {}
+        return {nvpair.get('name'): nvpair.get('value')
+                for nvpair in element.iter('nvpair')}
+
+    def _status_xml(self):
+        """Fetch the cluster status once for running and failed.
+
+        :returns: XML output of crm_mon or None if it can't be read
+        :rtype: Optional[str]
+        """
+        if self._status is None:
+            try:
+                self._status = crm_mon_xml()
+            except (subprocess.CalledProcessError, OSError) as e:
+                log('Unable to read the cluster status: {}'.format(e),
+                    WARNING)
+        return self._status
+
+
+def get_cib_snapshot():
+    """Return the CIB snapshot of this hook execution.
+
+    :returns: CIB snapshot
+    :rtype: CIBSnapshot
+    """
+    global _cib_snapshot
+    if _cib_snapshot is None:
+        _cib_snapshot = CIBSnapshot()
+    return _cib_snapshot
+
+
+def invalidate_cib_snapshot():
+    """Discard the CIB snapshot, it must be called after changing the CIB."""
+    global _cib_snapshot, _cluster_changed_at
+    _cib_snapshot = None
+    _cluster_changed_at = time.time()
+
+
+def index_cib_objects(cib_xml):
+    """Index the elements of the CIB configuration by id.
+
+    :param cib_xml: output of `crm configure show xml`
+    :type cib_xml: str
+    :returns: Map of object id to its XML element
+    :rtype: Dict[str, etree.Element]
+    """
+    root = etree.fromstring(cib_xml)
+    configuration = root.find('configuration')
+    if configuration is None:
+        configuration = root
+    return {element.get('id'): element
+            for element in configuration.iter()
+            if element.get('id')}
+
+
+def index_running_resources(crm_mon_output):
+    """Index the nodes resources are running on by resource id.
+
+    Groups, clones and bundles are considered running on every node where
+    any of their members is running. The instance suffix of unique clones
+    (e.g. "res_foo:0") is dropped.
+
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    :returns: Map of resource id to the nodes it is running on
+    :rtype: Dict[str, List[str]]
+    """
+    running = {}
+
+    def _walk(element, parents):
+        for child in element:
+            res_id = (child.get('id') or '').split(':')[0]
+            if child.tag == 'resource':
+                if (child.get('active') == 'true' and
+                        child.get('role') in RUNNING_ROLES):
+                    for name in [res_id] + parents:
+                        nodes = running.setdefault(name, [])
+                        for node in child.findall('node'):
+                            if node.get('name') not in nodes:
+                                nodes.append(node.get('name'))
+            elif child.tag in ('group', 'clone', 'bundle'):
+                _walk(child, parents + [res_id])
+
+    _walk(get_tag(etree.fromstring(crm_mon_output), 'resources'), [])
+    return running
+
+
+def index_failed_resources(crm_mon_output):
+    """Ids of the resources crm_mon reports as failed.
+
+    A resource is failed when it is flagged as such in the resources section
+    or has operation failures recorded against it. The instance suffix of
+    unique clones (e.g. "res_foo:0") is dropped.
+
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    :returns: Ids of the failed resources
+    :rtype: Set[str]
+    """
+    root = etree.fromstring(crm_mon_output)
+    failed = set()
+    for resource in get_tag(root, 'resources').iter('resource'):
+        if resource.get('failed') == 'true':
+            failed.add(resource.get('id').split(':')[0])
+    for failure in get_tag(root, 'failures').iter('failure'):
+        # op_key is <resource>_<operation>_<interval>
+        op_key = failure.get('op_key') or ''
+        if op_key.count('_') >= 2:
+            failed.add(op_key.rsplit('_', 2)[0].split(':')[0])
+    return failed
+
+
+def cluster_readiness(crm_mon_output, node_name, require_quorum=False):
+    """Check whether the cluster is usable from the given node.
+
+    The node needs to be online, i.e. a member of the cluster, and a DC has
+    to be elected. Quorum is only checked when required.
+
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    :param node_name: name of the local node
+    :type node_name: str
+    :param require_quorum: Whether the cluster must have quorum.
+    :type require_quorum: bool
+    :returns: Why the cluster isn't ready, None if it is.
+    :rtype: Optional[str]
+    """
+    root = etree.fromstring(crm_mon_output)
+    online = [node.get('name') for node in get_tag(root, 'nodes')
+              if node.get('online') == 'true']
+    if node_name not in online:
+        return 'node {} is not online'.format(node_name)
+
+    current_dc = get_tag(get_tag(root, 'summary'), 'current_dc')
+    if current_dc.get('present') != 'true':
+        return 'no DC elected'
+    if require_quorum and current_dc.get('with_quorum') != 'true':
+        return 'no quorum'
+    return None
+
+
+def wait_for_pcmk(timeout=120, sleep=0.5, max_sleep=10,
+                  require_quorum=False):
     """Wait for pacemaker/corosync to fully come up.
 
-    :param retries: Number of times to check for crm's output before raising.
-    :type retries: int
-    :param sleep: Number of seconds to sleep between retries.
-    :type sleep: int
+    The cluster status is polled with an exponential backoff, starting with
+    a short sleep, until the cluster is usable or the timeout expires.
+
+    :param timeout: Number of seconds to wait for before raising.
+    :type timeout: float
+    :param sleep: Number of seconds to sleep after the first check.
+    :type sleep: float
+    :param max_sleep: Maximum number of seconds to sleep between checks.
+    :type max_sleep: float
+    :param require_quorum: Whether the cluster must have quorum.
+    :type require_quorum: bool
     :raises: ServicesNotUp
     """
     expected_hostname = socket.gethostname()
-    last_exit_code = None
-    last_output = None
-    for i in range(retries):
-        if i > 0:
-            time.sleep(sleep)
-        last_exit_code, last_output = subprocess.getstatusoutput(
-            'crm node list')
-        if expected_hostname in last_output:
+    start = time.monotonic()
+    attempts = 0
+    while True:
+        attempts += 1
+        last_exit_code = 0
+        try:
+            last_output = crm_mon_xml()
+            reason = cluster_readiness(last_output, expected_hostname,
+                                       require_quorum=require_quorum)
+        except subprocess.CalledProcessError as e:
+            last_exit_code = e.returncode
+            last_output = (e.output or b'').decode('utf-8', 'replace')
+            reason = 'crm_mon failed'
+        except (OSError, ValueError, etree.ParseError) as e:
+            last_output = str(e)
+            reason = 'crm_mon failed'
+
+        elapsed = time.monotonic() - start
+        if reason is None:
+            log('Pacemaker ready after {:.1f}s ({} checks)'.format(
+                elapsed, attempts), level=DEBUG)
             return
 
+        if elapsed + sleep > timeout:
+            break
+        log('Pacemaker not ready yet: {}, checking again in {}s'.format(
+            reason, sleep), level=DEBUG)
+        time.sleep(sleep)
+        sleep = min(sleep * 2, max_sleep)
+
     msg = ('Pacemaker or Corosync are still not fully up after waiting for '
-           '{} retries. '.format(retries))
+           '{:.0f}s ({} checks): {}. '.format(elapsed, attempts, reason))
     if last_exit_code != 0:
         msg += 'Last exit code: {}. '.format(last_exit_code)
-    if 'not supported between' in last_output:
-        # NOTE(lourot): transient crmsh bug
-        # https://github.com/ClusterLabs/crmsh/issues/764
-        msg += 'This looks like ClusterLabs/crmsh#764. '
-    elif 'node1' in last_output:
+    if 'name="node1"' in last_output:
         # NOTE(lourot): transient bug on deployment. The charm will recover
         # later but the corosync ring will still show an offline 'node1' node.
         # The corosync ring can then be cleaned up by running the 'update-ring'
@@ -90,18 +658,295 @@ def commit(cmd, failure_is_fatal=False):
     :type failure_is_fatal: bool
     :raises: subprocess.CalledProcessError
     """
+    invalidate_cib_snapshot()
     if failure_is_fatal:
-        return subprocess.check_output(cmd.split(), stderr=subprocess.STDOUT)
+        return check_output(cmd.split(), stderr=subprocess.STDOUT)
     else:
-        return subprocess.call(cmd.split())
+        return call(cmd.split())
+
+
+class ConfigureBatch(object):
+    """Group crm configure directives into a single CIB commit.
+
+    When enabled the directives added to the batch are rendered into one crm
+    script and applied with `crm configure load update`, so they cost a
+    single policy engine transition and either all or none of them are
+    applied. When disabled each directive is committed straight away.
+
+    :param enabled: Whether to defer the directives until commit() is called.
+    :type enabled: bool
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.directives = []
+
+    def add(self, directive, wait=True):
+        """Add a crm configure directive to the batch.
+
+        :param directive: crm configure directive
+                          (e.g. "primitive res_foo ocf:heartbeat:IPaddr2")
+        :type directive: str
+        :param wait: Whether to wait for the transition to complete when the
+                     directive is committed straight away.
+        :type wait: bool
+        :returns: Return code (0 => success)
+        :rtype: int
+        """
+        if self.enabled:
+            self.directives.append(directive)
+            return 0
+
+        cmd = 'crm {}-F configure {}'.format('-w ' if wait else '', directive)
+        retcode = commit(cmd)
+        log(cmd, level=DEBUG)
+        return retcode
+
+    def commit(self):
+        """Apply all the directives in the batch in one CIB commit.
+
+        :returns: Return code (0 => success)
+        :rtype: int
+        """
+        if not self.directives:
+            return 0
+
+        with tempfile.NamedTemporaryFile() as f:
+            f.write('\n'.join(self.directives + ['']).encode('utf-8'))
+            f.flush()
+            log('Applying {} crm configure directives:\n{}'.format(
+                len(self.directives), '\n'.join(self.directives)),
+                level=DEBUG)
+            retcode = commit('crm -w -F configure load update {}'.format(
+                f.name))
+
+        if retcode == 0:
+            self.directives = []
+        else:
+            log('crm configure load update exit code: {}'.format(retcode),
+                level=WARNING)
+        return retcode
+
+
+# Tags of the CIB elements managed from the ha relation, in the order in
+# which they have to be deleted: constraints and containers reference the
+# resources defined after them.
+CIB_DELETION_ORDER = ('rsc_location', 'rsc_colocation', 'rsc_order',
+                      'clone', 'master', 'group', 'primitive')
+
+# crm_config attribute set holding the digest of each cluster object applied
+# from the ha relation. It lives in the CIB so that every unit, and a new
+# leader in particular, sees what has been applied.
+CIB_APPLIED_SET = 'juju-hacluster-objects'
+
+CIBObjectsDiff = collections.namedtuple('CIBObjectsDiff',
+                                        ['add', 'modify', 'delete'])
+
+
+def desired_cib_objects(resources=None, resource_params=None, groups=None,
+                        ms=None, orders=None, clones=None, colocations=None,
+                        locations=None, monitor_host=False):
+    """Render the crm configure directive of each requested cluster object.
+
+    :param resources: Resource types keyed by resource name.
+    :type resources: Dict[str, str]
+    :param resource_params: Resource parameters keyed by resource name.
+    :type resource_params: Dict[str, str]
+    :param groups: Group definitions keyed by group name.
+    :type groups: Dict[str, str]
+    :param ms: Master/slave definitions keyed by name.
+    :type ms: Dict[str, str]
+    :param orders: Order constraints keyed by name.
+    :type orders: Dict[str, str]
+    :param clones: Clone definitions keyed by clone name.
+    :type clones: Dict[str, str]
+    :param colocations: Colocation constraints keyed by name.
+    :type colocations: Dict[str, str]
+    :param locations: Location constraints keyed by name.
+    :type locations: Dict[str, str]
+    :param monitor_host: Whether to add a Ping location for each resource.
+    :type monitor_host: bool
+    :returns: Directives keyed by object name, in creation order.
+    :rtype: collections.OrderedDict
+    """
+    resource_params = resource_params or {}
+    desired = collections.OrderedDict()
+    for res_name, res_type in (resources or {}).items():
+        if res_name in resource_params:
+            desired[res_name] = 'primitive {} {} {}'.format(
+                res_name, res_type, resource_params[res_name])
+        else:
+            desired[res_name] = 'primitive {} {}'.format(res_name, res_type)
+
+    if monitor_host:
+        for res_name in (resources or {}):
+            desired['Ping-{}'.format(res_name)] = (
+                'location Ping-{0} {0} rule -inf: pingd lte 0'
+                .format(res_name))
+
+    for obj_type, objects in (('group', groups),
+                              ('ms', ms),
+                              ('order', orders),
+                              ('clone', clones),
+                              ('colocation', colocations),
+                              ('location', locations)):
+        for obj_name, obj_params in (objects or {}).items():
+            desired[obj_name] = '{} {} {}'.format(obj_type, obj_name,
+                                                  obj_params)
+
+    return desired
+
+
+def cib_objects_digests(desired):
+    """Compute the digest of the directive of each cluster object.
+
+    :param desired: Directives keyed by object name.
+    :type desired: Dict[str, str]
+    :returns: Digests keyed by object name.
+    :rtype: Dict[str, str]
+    """
+    return {obj_name: generate_checksum([directive])
+            for obj_name, directive in desired.items()}
+
+
+def applied_cib_objects():
+    """Digests of the cluster objects applied from the ha relation.
+
+    :returns: Digests keyed by object name, as recorded in the CIB.
+    :rtype: Dict[str, str]
+    """
+    return get_cib_snapshot().nvpairs(CIB_APPLIED_SET)
+
+
+def record_cib_objects(digests):
+    """Record the cluster objects applied from the ha relation in the CIB.
+
+    :param digests: Digests keyed by object name.
+    :type digests: Dict[str, str]
+    :returns: Return code (0 => success)
+    :rtype: int
+    """
+    exists = CIB_APPLIED_SET in get_cib_snapshot().objects
+    element = etree.Element('cluster_property_set', id=CIB_APPLIED_SET)
+    for obj_name, digest in sorted(digests.items()):
+        etree.SubElement(element, 'nvpair',
+                         id='{}-{}'.format(CIB_APPLIED_SET, obj_name),
+                         name=obj_name, value=digest)
+    invalidate_cib_snapshot()
+    return call(['cibadmin', '--replace' if exists else '--create',
+                 '--scope', 'crm_config',
+                 '--xml-text', etree.tostring(element, encoding='unicode')])
+
+
+def diff_cib_objects(desired, applied):
+    """Compute the changes needed to converge the CIB to the desired objects.
+
+    An object is added if it's missing from the CIB and modified if it
+    exists but wasn't applied with the same directive. Only objects
+    recorded as applied from the ha relation are ever deleted.
+
+    :param desired: Directives keyed by object name.
+    :type desired: Dict[str, str]
+    :param applied: Digests of the applied directives, keyed by object name.
+    :type applied: Dict[str, str]
+    :returns: Names of the objects to add, modify and delete.
+    :rtype: CIBObjectsDiff
+    """
+    digests = cib_objects_digests(desired)
+    diff = CIBObjectsDiff([], [], [])
+    for obj_name in desired:
+        if not crm_opt_exists(obj_name):
+            diff.add.append(obj_name)
+        elif applied.get(obj_name) != digests[obj_name]:
+            diff.modify.append(obj_name)
+
+    for obj_name in applied:
+        if obj_name not in desired and crm_opt_exists(obj_name):
+            diff.delete.append(obj_name)
+
+    return diff
+
+
+def apply_cib_objects(desired, batch=True):
+    """Converge the cluster configuration to the desired objects.
+
+    The desired objects are compared with the CIB and with the digests of
+    the objects applied before, which are recorded in the CIB too. Only the
+    objects that differ are created or updated, and the objects applied
+    before which aren't requested anymore are stopped and deleted. Nothing
+    is changed when the CIB is already up to date.
+
+    When batching is disabled the objects are created one at a time, as
+    they used to be: the ones that fail are logged, left out of the record
+    and retried in the next hook.
+
+    :param desired: Directives keyed by object name, in creation order.
+    :type desired: Dict[str, str]
+    :param batch: Whether to apply all the changes in a single CIB commit.
+    :type batch: bool
+    :returns: Return code (0 => success), non zero if the CIB commit of the
+              batch failed.
+    :rtype: int
+    """
+    objects = get_cib_snapshot().objects
+    applied = applied_cib_objects()
+    diff = diff_cib_objects(desired, applied)
+    digests = cib_objects_digests(desired)
+    if not any(diff) and applied == digests:
+        log('Cluster objects up to date', level=DEBUG)
+        return 0
+
+    log('Cluster objects to add: {}, modify: {}, delete: {}'.format(
+        diff.add, diff.modify, diff.delete), level=INFO)
+
+    record = dict(digests)
+    configure = ConfigureBatch(enabled=batch)
+    for obj_name in diff.add:
+        if configure.add(desired[obj_name],
+                         wait=not obj_name.startswith('Ping-')) != 0:
+            log('Unable to create {}'.format(obj_name), level=WARNING)
+            del record[obj_name]
+    # `load update` replaces the definition of the existing objects, so the
+    # modified ones always go through a batch.
+    update = configure if batch else ConfigureBatch()
+    for obj_name in diff.modify:
+        update.add(desired[obj_name])
+    retcode = configure.commit() or update.commit()
+    if retcode != 0:
+        return retcode
+
+    def _deletion_order(obj_name):
+        tag = objects[obj_name].tag
+        if tag in CIB_DELETION_ORDER:
+            return CIB_DELETION_ORDER.index(tag)
+        return len(CIB_DELETION_ORDER)
+
+    for obj_name in sorted(diff.delete, key=_deletion_order):
+        if objects[obj_name].tag in RESOURCE_TAGS:
+            log('Stopping {}'.format(obj_name), level=INFO)
+            commit('crm -w -F resource stop {}'.format(obj_name))
+        log('Deleting {}'.format(obj_name), level=INFO)
+        if commit('crm -w -F configure delete {}'.format(obj_name)) != 0:
+            log('Unable to delete {}'.format(obj_name), level=WARNING)
+            record[obj_name] = applied[obj_name]
+
+    if record_cib_objects(record) != 0:
+        # The objects are applied, they are only compared again and updated
+        # in the next hook.
+        log('Unable to record the applied cluster objects', level=WARNING)
+    return 0
 
 
 def is_resource_present(resource):
-    status = subprocess.getstatusoutput("crm resource status %s" % resource)[0]
-    if status != 0:
-        return False
+    """Whether a resource with the given id is defined in the CIB.
 
-    return True
+    :param resource: resource id
+    :type resource: str
+    :returns: True if the resource is defined
+    :rtype: bool
+    """
+    element = get_cib_snapshot().objects.get(resource)
+    return element is not None and element.tag in RESOURCE_TAGS
 
 
 def parse_version(cmd_output):
@@ -122,11 +967,14 @@ def parse_version(cmd_output):
 
 
 def crm_opt_exists(opt_name):
-    output = subprocess.getstatusoutput("crm configure show")[1]
-    if opt_name in output:
-        return True
+    """Whether an object with the given id exists in the CIB configuration.
 
-    return False
+    :param opt_name: object id (e.g. resource or constraint name)
+    :type opt_name: str
+    :returns: True if the object exists
+    :rtype: bool
+    """
+    return opt_name in get_cib_snapshot().objects
 
 
 def crm_maas_stonith_resource_list():
@@ -136,20 +984,35 @@ def crm_maas_stonith_resource_list():
     :rtype: [str,]
     """
     resource_names = []
-    output = subprocess.check_output(['crm_resource', '-L']).decode()
+    output = check_output(['crm_resource', '-L']).decode()
     for line in output.split('\n'):
         if 'stonith:external/maas' in line:
             resource_names.append(line.split()[0])
     return [n for n in resource_names if n.startswith('st-maas-')]
 
 
+def failed_resources():
+    """Resources crm_mon currently reports as failed.
+
+    :returns: Ids of the failed resources
+    :rtype: Set[str]
+    """
+    return get_cib_snapshot().failed
+
+
 def crm_res_running(opt_name):
-    (_, output) = subprocess.getstatusoutput(
-        "crm resource status %s" % opt_name)
-    if output.startswith("resource %s is running" % opt_name):
+    """Whether the resource is running on any node.
+
+    :param opt_name: resource id
+    :type opt_name: str
+    :returns: True if the resource is running
+    :rtype: bool
+    """
+    if get_cib_snapshot().running.get(opt_name):
         return True
 
-    log('CRM Resource not running - Status: {}'.format(output), WARNING)
+    log('CRM Resource not running - Status: resource {} is NOT running'
+        .format(opt_name), WARNING)
     return False
 
 
@@ -163,46 +1026,20 @@ def crm_res_running_on_node(resource, node):
     :param node: str name of node
     :returns: boolean
     """
-
-    (_, output) = subprocess.getstatusoutput(
-        "crm resource status {}".format(resource))
-    lines = output.split("\n")
-
-    if len(lines) > 1:
-        # Multi line is a clone list like haproxy and should run on all nodes
-        # check if it is running on this node
-        for line in lines:
-            if node in line:
-                if line.startswith("resource {} is running".format(resource)):
-                    return True
+    nodes = get_cib_snapshot().running.get(resource, [])
+    if len(nodes) > 1:
+        running = node in nodes
     else:
-        # Single line is for active/passive like a VIP, may not be on this node
-        # but check it is running somewhere
-        if output.startswith("resource {} is running".format(resource)):
-            return True
-
-    log('CRM Resource not running - Status: {}'.format(output), WARNING)
-    return False
+        running = bool(nodes)
+    if not running:
+        log('CRM Resource not running - Status: resource {} is running '
+            'on: {}'.format(resource, nodes), WARNING)
+    return running
 
 
 def list_nodes():
     """List member nodes."""
-    nodes = []
-    if CompareHostReleases(get_distrib_codename()) >= 'jammy':
-        cmd = ['crm', 'node', 'show']
-        out = subprocess.check_output(cmd).decode('utf-8')
-        for line in out.strip().split('\n'):
-            if re.match(r'^\S+\(\d+\)', line):
-                line = line.split('(')[0]
-                line = line.split(':')[0]
-                nodes.append(line)
-    else:
-        cmd = ['crm', 'node', 'status']
-        out = subprocess.check_output(cmd).decode('utf-8')
-        tree = etree.fromstring(out)
-        nodes = [n.attrib['uname'] for n in tree.iter('node')]
-
-    return sorted(nodes)
+    return sorted(get_backend().list_nodes())
 
 
 def set_node_status_to_maintenance(node_name):
@@ -289,40 +1126,70 @@ def get_property(name):
     :returns: property value
     :rtype: str
     """
-    # get-property deprecated in favor of get_property (LP: #2008704)
-    if crm_version() >= StrictVersion('4.2.1'):
-        output = subprocess.check_output(
-            ['crm', 'configure', 'get_property', name],
-            universal_newlines=True)
-    # crmsh >= 2.3 renamed show-property to get-property, 2.3.x is
-    # available since zesty
-    elif crm_version() >= StrictVersion('2.3.0'):
-        output = subprocess.check_output(
-            ['crm', 'configure', 'get-property', name],
-            universal_newlines=True)
-    elif crm_version() < StrictVersion('2.2.0'):
-        # before 2.2.0 there is no method to get a property
-        output = subprocess.check_output(['crm', 'configure', 'show', 'xml'],
-                                         universal_newlines=True)
-
-        return get_property_from_xml(name, output)
-    else:
-        output = subprocess .check_output(
-            ['crm', 'configure', 'show-property', name],
-            universal_newlines=True)
-
-    return output
+    return get_backend().get_property(name)
 
 
-def set_property(name, value):
+def set_property(name, value, failure_is_fatal=True):
     """Set a cluster's property
 
+    Nothing is done when the CIB snapshot shows the property is already set
+    to the value.
+
     :param name: property name
     :param value: new value
+    :param failure_is_fatal: Whether to raise exception if command fails.
+    :type failure_is_fatal: bool
+    :raises: subprocess.CalledProcessError
+    """
+    value = str(value)
+    if get_cib_snapshot().nvpairs(CLUSTER_OPTIONS_SET).get(name) == value:
+        log('Cluster property {} already set to {}'.format(name, value),
+            level=DEBUG)
+        return
+    invalidate_cib_snapshot()
+    cmd = ['crm', 'configure', 'property', '%s=%s' % (name, value)]
+    if failure_is_fatal:
+        check_call(cmd, universal_newlines=True)
+    else:
+        call(cmd, universal_newlines=True)
+
+
+def cached_version(command, probe):
+    """Get the version of a command, probing it only once per upgrade.
+
+    The version is cached in unitdata along with the mtime of the command's
+    binary, so it's probed again only after the package shipping it has been
+    upgraded. It's also remembered for the rest of the hook execution.
+
+    :param command: name of the command (e.g. crm)
+    :type command: str
+    :param probe: callable returning the version of the command
+    :type probe: Callable[[], distutils.version.StrictVersion]
+    :returns: command version
+    :rtype: distutils.version.StrictVersion
     """
-    subprocess.check_call(['crm', 'configure',
-                           'property', '%s=%s' % (name, value)],
-                          universal_newlines=True)
+    path = shutil.which(command)
+    if not path:
+        # let the probe report the missing command.
+        return probe()
+
+    mtime = os.stat(path).st_mtime
+    if command in _versions and _versions[command][0] == mtime:
+        return _versions[command][1]
+
+    db = unitdata.kv()
+    key = 'pcmk-version-{}'.format(command)
+    cached = db.get(key)
+    if cached and cached['mtime'] == mtime:
+        version = StrictVersion(cached['version'])
+    else:
+        version = probe()
+        log('{} version {} detected'.format(command, version), level=DEBUG)
+        db.set(key, {'mtime': mtime, 'version': str(version)})
+        db.flush()
+
+    _versions[command] = (mtime, version)
+    return version
 
 
 def crm_version():
@@ -335,9 +1202,12 @@ def crm_version():
     :raises: ValueError version could not be parsed
     :raises: subprocess.CalledProcessError if the check_output fails
     """
-    ver = subprocess.check_output(["crm", "--version"],
-                                  universal_newlines=True)
-    return parse_version(ver)
+    def _probe():
+        ver = check_output(["crm", "--version"],
+                           universal_newlines=True)
+        return parse_version(ver)
+
+    return cached_version('crm', _probe)
 
 
 def _crm_update_object(update_template, update_ctxt, hash_keys, unitdata_key,
@@ -463,6 +1333,18 @@ def crm_update_location(location_name, resource_name, score, node,
         force=force)
 
 
+def configured_locations():
+    """Node based location constraints currently in the CIB.
+
+    :returns: Map of constraint id to its (resource, score, node)
+    :rtype: Dict[str, Tuple[str, str, str]]
+    """
+    return {
+        name: (element.get('rsc'), element.get('score'), element.get('node'))
+        for name, element in get_cib_snapshot().objects.items()
+        if element.tag == 'rsc_location' and element.get('node')}
+
+
 def generate_checksum(check_strings):
     """Create a md5 checksum using each string in the list.
 
@@ -490,6 +1372,134 @@ def resource_checksum(res_name, res_type, res_params=None):
     return generate_checksum(data)
 
 
+def write_atomically(path, content, mode=0o644):
+    """Replace a file so that readers never see a partial one.
+
+    :param path: Path of the file.
+    :type path: str
+    :param content: Content of the file.
+    :type content: str
+    :param mode: Permissions of the file.
+    :type mode: int
+    """
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=dirname, prefix='.',
+                                     delete=False) as f:
+        f.write(content)
+    os.chmod(f.name, mode)
+    os.rename(f.name, path)
+
+
+def status_snapshot_xml_path(path=STATUS_SNAPSHOT):
+    """Path of the crm_mon output collected along with a status snapshot.
+
+    :param path: Path of the snapshot.
+    :type path: str
+    :returns: Path of the crm_mon output
+    :rtype: str
+    """
+    return os.path.splitext(path)[0] + '.xml'
+
+
+def collect_status_snapshot(ttl, path=STATUS_SNAPSHOT, xml=None):
+    """Collect the cluster status and store it for the other consumers.
+
+    `crm_mon` is run once. The snapshot only holds what most consumers need:
+    the summary and nodes as converted by cluster_status(), the nodes each
+    resource is running on and the failed resources. The output of crm_mon
+    is written to a separate file, see status_snapshot_xml_path(), for the
+    consumers which need the resources or the operation history, such as
+    the check_crm NRPE plugin. Both files are replaced atomically so that
+    readers never see a partial one.
+
+    :param ttl: Seconds the snapshot is considered fresh for.
+    :type ttl: int
+    :param path: Path of the snapshot.
+    :type path: str
+    :param xml: XML output of crm_mon, crm_mon is run if not provided.
+    :type xml: Optional[str]
+    :returns: The snapshot
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError if crm_mon fails
+    """
+    crm_mon_ver = crm_mon_version()
+    if xml is None:
+        xml = crm_mon_xml(crm_mon_ver)
+    status = parse_cluster_status(xml, crm_mon_ver,
+                                  resources=False, history=False)
+    status['running'] = index_running_resources(xml)
+    status['failed'] = sorted(index_failed_resources(xml))
+    status['timestamp'] = time.time()
+    status['ttl'] = ttl
+    # The output is written first, it's never older than a fresh snapshot.
+    write_atomically(status_snapshot_xml_path(path), xml)
+    write_atomically(path, json.dumps(status))
+    return status
+
+
+def _load_status_snapshot(path):
+    """Load a status snapshot, reusing the one this process read before if
+    the file hasn't been replaced since.
+
+    :param path: Path of the snapshot.
+    :type path: str
+    :returns: The snapshot
+    :rtype: Dict[str, Any]
+    :raises: OSError, ValueError
+    """
+    mtime = os.stat(path).st_mtime_ns
+    cached = _status_snapshots.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path) as f:
+        status = json.load(f)
+    _status_snapshots[path] = (mtime, status)
+    return status
+
+
+def read_status_snapshot(path=STATUS_SNAPSHOT):
+    """Read the cluster status snapshot if it is still fresh.
+
+    The snapshot is only parsed again once the file has been replaced.
+
+    :param path: Path of the snapshot.
+    :type path: str
+    :returns: The snapshot or None if it is missing, older than its ttl or
+              older than the last change made to the cluster by this process.
+    :rtype: Optional[Dict[str, Any]]
+    """
+    try:
+        status = _load_status_snapshot(path)
+        timestamp = float(status['timestamp'])
+        ttl = float(status['ttl'])
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+    if timestamp < _cluster_changed_at:
+        return None
+    if not timestamp <= time.time() <= timestamp + ttl:
+        return None
+    return status
+
+
+def read_status_xml(path=STATUS_SNAPSHOT):
+    """Read the crm_mon output collected with the status snapshot.
+
+    :param path: Path of the snapshot.
+    :type path: str
+    :returns: XML output of crm_mon or None if the snapshot isn't fresh.
+    :rtype: Optional[str]
+    """
+    if read_status_snapshot(path) is None:
+        return None
+    try:
+        with open(status_snapshot_xml_path(path)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
 def get_tag(element, name):
     """Get tag from element.
 
@@ -536,33 +1546,270 @@ def crm_mon_version():
     :raises: ValueError version could not be parsed
     :raises: subprocess.CalledProcessError if the check_output fails
     """
-    ver = subprocess.check_output(["crm_mon", "--version"],
-                                  universal_newlines=True)
-    return parse_version(ver)
+    def _probe():
+        ver = check_output(["crm_mon", "--version"],
+                           universal_newlines=True)
+        return parse_version(ver)
 
+    return cached_version('crm_mon', _probe)
 
-def cluster_status(resources=True, history=False):
+
+def crm_mon_xml(crm_mon_ver=None):
+    """Get the cluster status from `crm_mon` in XML format.
+
+    :param crm_mon_ver: crm_mon version, detected if not provided
+    :type crm_mon_ver: distutils.version.StrictVersion
+    :returns: XML output of crm_mon
+    :rtype: str
+    :raises: subprocess.CalledProcessError if the check_output fails
+    """
+    if crm_mon_ver is None:
+        crm_mon_ver = crm_mon_version()
+
+    if crm_mon_ver >= StrictVersion("2.0.0"):
+        cmd = ["crm_mon", "--output-as=xml", "--inactive"]
+    else:
+        # NOTE (rgildein): The `--as-xml` option is deprecated.
+        cmd = ["crm_mon", "--as-xml", "--inactive"]
+
+    return check_output(cmd).decode('utf-8')
+
+
+def cluster_status(resources=True, history=False, history_summary=False,
+                   only_nodes=None, only_resources=None):
     """Parse the cluster status from `crm_mon`.
 
     The `crm_mon` provides a summary of cluster's current state in XML format.
+    The status snapshot is used instead while it is fresh.
 
     :param resources: flag for parsing resources from status, default is True
     :type: boolean
     :param history: flag for parsing history from status, default is False
     :type: boolean
+    :param history_summary: flag for adding the operation statistics computed
+                            by summarize_operation_history(), default is False
+    :type: boolean
+    :param only_nodes: names of the nodes to report, all if None
+    :type only_nodes: Optional[Iterable[str]]
+    :param only_resources: ids of the resources to report, all if None
+    :type only_resources: Optional[Iterable[str]]
     :returns: converted cluster status to the Dict
     :rtype: Dict[str, Any]]
     """
-    status = {}
-    crm_mon_ver = crm_mon_version()
+    filtered = only_nodes is not None or only_resources is not None
+    snapshot = read_status_snapshot()
+    if snapshot is not None and not (resources or history or filtered or
+                                     history_summary):
+        return {key: snapshot[key]
+                for key in ('crm_mon_version', 'summary', 'nodes')}
+
+    xml = read_status_xml() if snapshot is not None else None
+    if xml is not None:
+        crm_mon_ver = snapshot['crm_mon_version']
+    else:
+        crm_mon_ver = crm_mon_version()
+        xml = crm_mon_xml(crm_mon_ver)
+    status = parse_cluster_status(xml, crm_mon_ver,
+                                  resources=resources, history=history,
+                                  only_nodes=only_nodes,
+                                  only_resources=only_resources)
+    if history_summary:
+        status['history_summary'] = summarize_operation_history(
+            xml, only_nodes=only_nodes, only_resources=only_resources)
+    return status
 
-    if crm_mon_ver >= StrictVersion("2.0.0"):
-        cmd = ["crm_mon", "--output-as=xml", "--inactive"]
+
+def duration_ms(value):
+    """Convert a crm_mon duration such as "57ms" to milliseconds.
+
+    :param value: Duration as reported by crm_mon
+    :type value: Optional[str]
+    :returns: Duration in milliseconds, 0 if unknown
+    :rtype: int
+    """
+    if not value:
+        return 0
+    try:
+        if value.endswith('ms'):
+            return int(value[:-2])
+        return int(float(value.rstrip('s')) * 1000)
+    except ValueError:
+        return 0
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0
+    rank = max(int(math.ceil(percent / 100.0 * len(values))), 1)
+    return values[rank - 1]
+
+
+def _operation_succeeded(operation):
+    rc = operation.get('rc')
+    if rc in ('0', '8'):
+        # ok, running as master
+        return True
+    # Probes (one-off monitors) report "not running" for the nodes the
+    # resource isn't on, it is a failure for any other operation.
+    task = operation.get('task')
+    return rc == '7' and (
+        task == 'probe' or
+        (task == 'monitor' and duration_ms(operation.get('interval')) == 0))
+
+
+def iterparse(xml, events=('end',), chunk_size=65536):
+    """Parse an XML document incrementally, like etree.iterparse().
+
+    The document is fed to the parser by chunks so that no copy of it is
+    made (io.StringIO would hold one with 4 bytes per character).
+
+    :param xml: XML document
+    :type xml: str
+    :param events: Events to report
+    :type events: Tuple[str]
+    :param chunk_size: Characters fed to the parser at once
+    :type chunk_size: int
+    :returns: (event, element) pairs
+    :rtype: Iterator[Tuple[str, etree.Element]]
+    """
+    parser = etree.XMLPullParser(events=events)
+    for offset in range(0, len(xml), chunk_size):
+        parser.feed(xml[offset:offset + chunk_size])
+        yield from parser.read_events()
+    parser.close()
+    yield from parser.read_events()
+
+
+def summarize_operation_history(crm_mon_output, only_nodes=None,
+                                only_resources=None):
+    """Compute operation statistics from the crm_mon operation history.
+
+    The history is read in a single streaming pass. The operations of a
+    resource are aggregated over all the nodes, by task (and interval for
+    recurring monitors, e.g. "monitor_10000ms"). The instance suffix of
+    unique clones (e.g. "res_foo:0") is dropped.
+
+    :param crm_mon_output: XML output of crm_mon
+    :type crm_mon_output: str
+    :param only_nodes: names of the nodes to aggregate, all if None
+    :type only_nodes: Optional[Iterable[str]]
+    :param only_resources: ids of the resources to report, all if None
+    :type only_resources: Optional[Iterable[str]]
+    :returns: Statistics by resource id and operation: count, failures,
+              p50/p95/max of exec and queue times in ms, rc of the last call
+    :rtype: Dict[str, Dict[str, Dict[str, Any]]]
+    """
+    collected = {}
+    node = None
+    resource = None
+    for event, element in iterparse(crm_mon_output, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'node':
+                node = element.get('name')
+            elif element.tag == 'resource_history':
+                resource = (element.get('id') or '').split(':')[0]
+                if (only_nodes is not None and node not in only_nodes or
+                        only_resources is not None and
+                        resource not in only_resources):
+                    resource = None
+            continue
+        if element.tag == 'operation_history' and resource:
+            task = element.get('task') or ''
+            if duration_ms(element.get('interval')):
+                task = '{}_{}'.format(task, element.get('interval'))
+            ops = collected.setdefault(resource, {}).setdefault(task, {
+                'count': 0, 'failures': 0, 'exec': [], 'queue': [],
+                'last_call': None, 'last_rc': None})
+            ops['count'] += 1
+            if not _operation_succeeded(element):
+                ops['failures'] += 1
+            ops['exec'].append(duration_ms(element.get('exec-time')))
+            ops['queue'].append(duration_ms(element.get('queue-time')))
+            try:
+                call = int(element.get('call'))
+            except (TypeError, ValueError):
+                call = -1
+            if ops['last_call'] is None or call >= ops['last_call']:
+                ops['last_call'] = call
+                ops['last_rc'] = element.get('rc')
+            element.clear()
+        elif element.tag == 'resource_history':
+            resource = None
+            element.clear()
+
+    summary = {}
+    for resource, operations in collected.items():
+        for task, ops in operations.items():
+            stats = {'count': ops['count'], 'failures': ops['failures'],
+                     'last_rc': ops['last_rc']}
+            for key in ('exec', 'queue'):
+                values = sorted(ops[key])
+                stats['{}_time_ms'.format(key)] = {
+                    'p50': _percentile(values, 50),
+                    'p95': _percentile(values, 95),
+                    'max': values[-1] if values else 0}
+            summary.setdefault(resource, {})[task] = stats
+    return summary
+
+
+def parse_cluster_status(xml, crm_mon_ver, resources=True, history=False,
+                         only_nodes=None, only_resources=None):
+    """Convert the XML output of `crm_mon` to a Dict.
+
+    Outputs of up to STREAM_PARSE_THRESHOLD characters are parsed as a tree,
+    which takes the least CPU time. Larger ones, from clusters with many
+    remote nodes or a long operation history, are parsed in a single
+    streaming pass which trades CPU time for memory: with 45 MiB of XML it
+    takes 1.98s instead of 1.55s but its peak RSS grows by 24.7 MiB instead
+    of 112.8 MiB, see benchmarks/parse_status.py.
+
+    :param xml: XML output of crm_mon
+    :type xml: str
+    :param crm_mon_ver: crm_mon version
+    :type crm_mon_ver: distutils.version.StrictVersion
+    :param resources: flag for parsing resources from status, default is True
+    :type: boolean
+    :param history: flag for parsing history from status, default is False
+    :type: boolean
+    :param only_nodes: names of the nodes to report in nodes and history,
+                       all if None
+    :type only_nodes: Optional[Iterable[str]]
+    :param only_resources: ids of the resources to report in resources and
+                           history, all if None. A group or clone is reported
+                           when it or one of its members is listed.
+    :type only_resources: Optional[Iterable[str]]
+    :returns: converted cluster status to the Dict
+    :rtype: Dict[str, Any]]
+    """
+    if only_nodes is not None:
+        only_nodes = set(only_nodes)
+    if only_resources is not None:
+        only_resources = set(only_resources)
+
+    def _node_wanted(name):
+        return only_nodes is None or name in only_nodes
+
+    def _resource_wanted(res_id):
+        return (only_resources is None or
+                (res_id or '').split(':')[0] in only_resources)
+
+    if len(xml) > STREAM_PARSE_THRESHOLD:
+        parse = _stream_parse_cluster_status
     else:
-        # NOTE (rgildein): The `--as-xml` option is deprecated.
-        cmd = ["crm_mon", "--as-xml", "--inactive"]
+        parse = _tree_parse_cluster_status
+    return parse(xml, crm_mon_ver, resources, history,
+                 _node_wanted, _resource_wanted)
+
 
-    xml = subprocess.check_output(cmd).decode('utf-8')
+def _tree_parse_cluster_status(xml, crm_mon_ver, resources, history,
+                               node_wanted, resource_wanted):
+    """Convert the XML output of `crm_mon` to a Dict, parsed as a tree.
+
+    See parse_cluster_status(), node_wanted and resource_wanted tell whether
+    a node name or resource id is reported.
+    """
+    status = {}
     root = etree.fromstring(xml)
 
     # version
@@ -576,24 +1823,32 @@ def cluster_status(resources=True, history=False):
     nodes = get_tag(root, "nodes")
     status["nodes"] = {
         node.get("name"): node.attrib for node in nodes.findall("node")
+        if node_wanted(node.get("name"))
     }
 
     # resources
     if resources:
-        cluster_resources = get_tag(root, "resources")
-        resources_groups = {
-            group.get("id"): [
+        def _members(parent):
+            return [
                 add_key(resource.attrib, "nodes",
                         [node.attrib for node in resource.findall("node")])
-                for resource in group.findall("resource")
-            ] for group in cluster_resources.findall("group")
+                for resource in parent.findall("resource")
+            ]
+
+        def _wanted(parent):
+            return (resource_wanted(parent.get("id")) or
+                    any(resource_wanted(resource.get("id"))
+                        for resource in parent.findall("resource")))
+
+        cluster_resources = get_tag(root, "resources")
+        resources_groups = {
+            group.get("id"): _members(group)
+            for group in cluster_resources.findall("group") if _wanted(group)
         }
         resources_clones = {
-            clone.get("id"): add_key(clone.attrib, "resources", [
-                add_key(resource.attrib, "nodes",
-                        [node.attrib for node in resource.findall("node")])
-                for resource in clone.findall("resource")
-            ]) for clone in cluster_resources.findall("clone")
+            clone.get("id"): add_key(clone.attrib, "resources",
+                                     _members(clone))
+            for clone in cluster_resources.findall("clone") if _wanted(clone)
         }
         status["resources"] = {"groups": resources_groups,
                                "clones": resources_clones}
@@ -607,7 +1862,99 @@ def cluster_status(resources=True, history=False):
                     operation.attrib
                     for operation in resource.findall("operation_history")
                 ] for resource in node.findall("resource_history")
+                if resource_wanted(resource.get("id"))
             } for node in node_history.findall("node")
+            if node_wanted(node.get("name"))
         }
 
     return status
+
+
+def _stream_parse_cluster_status(xml, crm_mon_ver, resources, history,
+                                 node_wanted, resource_wanted):
+    """Convert the XML output of `crm_mon` to a Dict in a streaming pass.
+
+    The elements are dropped as soon as they are converted so that the
+    whole tree is never held in memory. See _tree_parse_cluster_status().
+    """
+    status = {"crm_mon_version": str(crm_mon_ver), "summary": {}, "nodes": {}}
+    if resources:
+        status["resources"] = {"groups": {}, "clones": {}}
+    if history:
+        status["history"] = {}
+
+    stack = []  # open elements, the root first
+    # For each open element, the tags of the open elements up to it, the root
+    # excluded.
+    paths = []
+    members = None  # resources of the open top level group or clone
+    history_node = None  # history of the open node
+    operations = None  # operations of the open resource history
+    for event, element in iterparse(xml, events=("start", "end")):
+        tag = element.tag
+        if event == "end":
+            stack.pop()
+            paths.pop()
+        if not paths:
+            # the root
+            if event == "start":
+                stack.append(element)
+                paths.append(())
+            continue
+        # tags of the parent elements, the root excluded
+        path = paths[-1]
+
+        if event == "start":
+            stack.append(element)
+            paths.append(path + (tag,))
+            if path == ("resources",) and tag in ("group", "clone"):
+                members = []
+            elif path == ("node_history",) and tag == "node":
+                history_node = None
+                if history and node_wanted(element.get("name")):
+                    history_node = status["history"].setdefault(
+                        element.get("name"), {})
+            elif path == ("node_history", "node") and \
+                    tag == "resource_history":
+                operations = None
+                if (history_node is not None and
+                        resource_wanted(element.get("id"))):
+                    operations = history_node.setdefault(element.get("id"),
+                                                         [])
+            continue
+
+        if path == ("summary",):
+            status["summary"][tag] = element.attrib
+        elif path == ("nodes",) and tag == "node":
+            if node_wanted(element.get("name")):
+                status["nodes"][element.get("name")] = element.attrib
+        elif (len(path) == 3 and path[0] == "resources" and
+                path[2] == "resource" and tag == "node"):
+            stack[-1].attrib.setdefault("nodes", []).append(element.attrib)
+        elif len(path) == 2 and path[0] == "resources" and \
+                tag == "resource":
+            if members is not None:
+                element.attrib.setdefault("nodes", [])
+                members.append(element.attrib)
+        elif path == ("resources",) and tag in ("group", "clone"):
+            if resources and (resource_wanted(element.get("id")) or
+                              any(resource_wanted(member.get("id"))
+                                  for member in members)):
+                if tag == "group":
+                    status["resources"]["groups"][element.get("id")] = \
+                        members
+                else:
+                    element.attrib["resources"] = members
+                    status["resources"]["clones"][element.get("id")] = \
+                        element.attrib
+            members = None
+        elif path == ("node_history", "node", "resource_history") and \
+                tag == "operation_history":
+            if operations is not None:
+                operations.append(element.attrib)
+
+        # Every earlier sibling has been converted already.
+        if stack:
+            del stack[-1][:]
+
+    return status
@@ -15,6 +15,8 @@
 # limitations under the License.
 
 import ast
+import copy
+import metrics
 import pcmk
 import json
 import os
@@ -34,6 +36,7 @@ from charmhelpers.core.strutils import (
 )
 from charmhelpers.core.hookenv import (
     application_version_set,
+    charm_dir,
     local_unit,
     log,
     TRACE,
@@ -112,12 +115,27 @@ PCMKR_SLEEP_SECS = 5
 SYSTEMD_OVERRIDES_DIR = '/etc/systemd/system/{}.service.d'
 SYSTEMD_OVERRIDES_FILE = '{}/overrides.conf'
 
+SYSTEMD_UNIT_DIR = '/etc/systemd/system'
+STATUS_SNAPSHOT_UNIT = 'hacluster-status-snapshot'
+STATUS_SNAPSHOT_STATE_DB = '/var/lib/hacluster/.status-snapshot.db'
+# Refresh interval of the Prometheus metrics in seconds.
+METRICS_INTERVAL = 15
+PROMETHEUS_TEXTFILE_KEY = 'prometheus-textfile'
+
 
 MAAS_DNS_CONF_DIR = '/etc/maas_dns'
 STONITH_CONFIGURED = 'stonith-configured'
 
 VERSION_PACKAGE = "pacemaker"
 
+REMOTE_PLACEMENTS = ('round-robin', 'rendezvous')
+PCMKR_REMOTES_KEY = 'pacemaker-remote-nodes'
+
+# Relation data of the related units and the values parsed out of it, kept
+# for the lifetime of the hook, see relation_data() and parse_data().
+_relation_data = {}
+_parsed_data = {}
+
 
 class MAASConfigIncomplete(Exception):
     pass
@@ -159,12 +177,12 @@ def enable_upstart_services(*services):
 
 def disable_lsb_services(*services):
     for service in services:
-        subprocess.check_call(['update-rc.d', '-f', service, 'remove'])
+        pcmk.check_call(['update-rc.d', '-f', service, 'remove'])
 
 
 def enable_lsb_services(*services):
     for service in services:
-        subprocess.check_call(['update-rc.d', '-f', service, 'defaults'])
+        pcmk.check_call(['update-rc.d', '-f', service, 'defaults'])
 
 
 def get_iface_ipaddr(iface):
@@ -354,7 +372,69 @@ def emit_systemd_overrides_file():
                                   systemd_overrides_context))
 
     # Update systemd with the new information
-    subprocess.check_call(['systemctl', 'daemon-reload'])
+    pcmk.check_call(['systemctl', 'daemon-reload'])
+
+
+def configure_status_snapshot():
+    """Install or remove the timer collecting the cluster status snapshot.
+
+    The snapshot is collected twice per status_snapshot_ttl so that a fresh
+    one is available to the hooks, actions and monitoring checks as long as
+    the timer runs. When prometheus_textfile_dir is set, the same crm_mon
+    output is also turned into metrics for the node_exporter textfile
+    collector, at least every METRICS_INTERVAL seconds.
+    """
+    ttl = int(config('status_snapshot_ttl') or 0)
+    textfile_dir = config('prometheus_textfile_dir')
+    textfile = None
+    if textfile_dir:
+        textfile = os.path.join(textfile_dir, metrics.TEXTFILE_NAME)
+    units = [os.path.join(SYSTEMD_UNIT_DIR, STATUS_SNAPSHOT_UNIT + suffix)
+             for suffix in ('.service', '.timer')]
+    timer = STATUS_SNAPSHOT_UNIT + '.timer'
+    snapshots = [pcmk.STATUS_SNAPSHOT,
+                 pcmk.status_snapshot_xml_path(pcmk.STATUS_SNAPSHOT)]
+
+    db = unitdata.kv()
+    previous_textfile = db.get(PROMETHEUS_TEXTFILE_KEY)
+    if previous_textfile and previous_textfile != textfile and \
+            os.path.exists(previous_textfile):
+        os.remove(previous_textfile)
+    db.set(PROMETHEUS_TEXTFILE_KEY, textfile)
+    db.flush()
+
+    if ttl > 0 or textfile:
+        if not init_is_systemd():
+            log('Cluster status snapshot requires systemd', level=WARNING)
+            return
+        intervals = []
+        if ttl > 0:
+            intervals.append(max(ttl // 2, 1))
+        if textfile:
+            intervals.append(METRICS_INTERVAL)
+        context = {
+            'collector': os.path.join(charm_dir(), 'hooks',
+                                      'collect_status.py'),
+            'snapshot': pcmk.STATUS_SNAPSHOT,
+            'state_db': STATUS_SNAPSHOT_STATE_DB,
+            'ttl': ttl,
+            'textfile': textfile,
+            'interval': min(intervals)}
+        for unit in units:
+            write_file(path=unit,
+                       content=render(os.path.basename(unit), context))
+        pcmk.check_call(['systemctl', 'daemon-reload'])
+        pcmk.check_call(['systemctl', 'enable', '--now', timer])
+        if ttl <= 0:
+            for path in snapshots:
+                if os.path.exists(path):
+                    os.remove(path)
+    elif os.path.exists(units[1]):
+        pcmk.check_call(['systemctl', 'disable', '--now', timer])
+        for path in units + snapshots:
+            if os.path.exists(path):
+                os.remove(path)
+        pcmk.check_call(['systemctl', 'daemon-reload'])
 
 
 def emit_corosync_conf():
@@ -523,17 +603,49 @@ def get_member_ready_nodes():
     return get_node_flags('member_ready')
 
 
+def relation_data(relid, unit):
+    """Relation data of a related unit.
+
+    The whole data bag of the unit is fetched with a single relation-get
+    call the first time it is needed and served from memory afterwards.
+
+    :param relid: Relation id
+    :type relid: str
+    :param unit: Related unit name
+    :type unit: str
+    :returns: Relation data of the unit
+    :rtype: Dict[str, str]
+    """
+    if (relid, unit) not in _relation_data:
+        _relation_data[(relid, unit)] = relation_get(rid=relid,
+                                                     unit=unit) or {}
+    return _relation_data[(relid, unit)]
+
+
+def flush_relation_data():
+    """Forget the relation data fetched so far."""
+    _relation_data.clear()
+    _parsed_data.clear()
+
+
 def parse_data(relid, unit, key):
-    """Helper to detect and parse json or ast based relation data"""
-    _key = 'json_{}'.format(key)
-    data = relation_get(_key, unit, relid) or relation_get(key, unit, relid)
-    if data:
-        try:
-            return json.loads(data)
-        except (TypeError, ValueError):
-            return ast.literal_eval(data)
+    """Helper to detect and parse json or ast based relation data
+
+    Parsed values are memoized, a copy is returned so that callers are free
+    to modify it.
+    """
+    if (relid, unit, key) not in _parsed_data:
+        data = relation_data(relid, unit)
+        value = data.get('json_{}'.format(key)) or data.get(key)
+        parsed = {}
+        if value:
+            try:
+                parsed = json.loads(value)
+            except (TypeError, ValueError):
+                parsed = ast.literal_eval(value)
+        _parsed_data[(relid, unit, key)] = parsed
 
-    return {}
+    return copy.deepcopy(_parsed_data[(relid, unit, key)])
 
 
 def configure_stonith():
@@ -598,19 +710,22 @@ def configure_cluster_global(failure_timeout, cluster_recheck_interval=60):
     # initial cluster startup but not if a node was previously in
     # contact with the full cluster.
     log('Configuring no-quorum-policy to stop', level=DEBUG)
-    cmd = "crm configure property no-quorum-policy=stop"
-    pcmk.commit(cmd)
-
-    cmd = ('crm configure rsc_defaults $id="rsc-options" '
-           'resource-stickiness="100" '
-           'failure-timeout={}'.format(failure_timeout))
-    pcmk.commit(cmd)
+    pcmk.set_property('no-quorum-policy', 'stop', failure_is_fatal=False)
+
+    rsc_defaults = {'resource-stickiness': '100',
+                    'failure-timeout': str(failure_timeout)}
+    current = pcmk.get_cib_snapshot().nvpairs('rsc-options')
+    if any(current.get(name) != value
+           for name, value in rsc_defaults.items()):
+        cmd = ('crm configure rsc_defaults $id="rsc-options" '
+               'resource-stickiness="100" '
+               'failure-timeout={}'.format(failure_timeout))
+        pcmk.commit(cmd)
 
     log('Configuring cluster-recheck-interval to {} seconds'.format(
         cluster_recheck_interval), level=DEBUG)
-    cmd = "crm configure property cluster-recheck-interval={}".format(
-        cluster_recheck_interval)
-    pcmk.commit(cmd)
+    pcmk.set_property('cluster-recheck-interval', cluster_recheck_interval,
+                      failure_is_fatal=False)
 
 
 def remove_legacy_maas_stonith_resources():
@@ -676,6 +791,12 @@ def configure_maas_stonith_resource(stonith_hostnames):
                              refers to the remote node as.
     :type stonith_hostname: List
     """
+    poll_params = ''.join(
+        "{}='{}' ".format(param, config(option))
+        for param, option in (('poll_interval', 'maas_poll_interval'),
+                              ('poll_backoff', 'maas_poll_backoff'),
+                              ('poll_deadline', 'maas_poll_deadline'))
+        if config(option) is not None)
     ctxt = {
         'stonith_plugin': 'stonith:external/maas',
         'stonith_hostnames': stonith_hostnames,
@@ -683,7 +804,8 @@ def configure_maas_stonith_resource(stonith_hostnames):
         'url': config('maas_url'),
         'apikey': config('maas_credentials'),
         'resource_params': (
-            "params url='{url}' apikey='{apikey}' hostnames='{hostnames}' "
+            "params url='{url}' apikey='{apikey}' hostnames='{hostnames}' " +
+            poll_params +
             "op monitor interval=25 start-delay=25 "
             "timeout=25")}
     _configure_stonith_resource(ctxt)
@@ -697,9 +819,7 @@ def enable_stonith():
     """
     log('Enabling STONITH', level=INFO)
     try:
-        pcmk.commit(
-            "crm configure property stonith-enabled=true",
-            failure_is_fatal=True)
+        pcmk.set_property('stonith-enabled', 'true')
     except subprocess.CalledProcessError as e:
         raise EnableStonithFailed(e)
 
@@ -713,9 +833,8 @@ def disable_stonith(failure_is_fatal=True):
     """
     log('Disabling STONITH', level=INFO)
     try:
-        pcmk.commit(
-            "crm configure property stonith-enabled=false",
-            failure_is_fatal=failure_is_fatal)
+        pcmk.set_property('stonith-enabled', 'false',
+                          failure_is_fatal=failure_is_fatal)
     except subprocess.CalledProcessError as e:
         raise DisableStonithFailed(e)
 
@@ -774,9 +893,7 @@ def set_cluster_symmetry():
         log(msg, level=WARNING)
         return
     log('Configuring symmetric-cluster: {}'.format(symmetric), level=DEBUG)
-    cmd = "crm configure property symmetric-cluster={}".format(
-        str(symmetric).lower())
-    pcmk.commit(cmd, failure_is_fatal=True)
+    pcmk.set_property('symmetric-cluster', str(symmetric).lower())
 
 
 def add_score_location_rule(res_name, node, location_score):
@@ -817,23 +934,98 @@ def add_location_rules_for_local_nodes(res_name):
             log('%s' % cmd, level=DEBUG)
 
 
+def add_location_rule_for_local_nodes(res_name):
+    """Add a single location rule for running resource on local nodes.
+
+    Unlike add_location_rules_for_local_nodes() the rule matches the local
+    nodes by their kind rather than by their name, so the number of
+    constraints doesn't grow with the number of nodes. Any per node
+    constraint previously created for the resource is removed.
+
+    :param res_name: Resource name to create the location rule for.
+    :type res_name: str
+    """
+    loc_constraint_name = 'loc-{}-local'.format(res_name)
+    legacy_constraints = [
+        name for name in ('loc-{}-{}'.format(res_name, node)
+                          for node in pcmk.list_nodes())
+        if pcmk.crm_opt_exists(name)]
+    if not pcmk.crm_opt_exists(loc_constraint_name):
+        cmd = ('crm -w -F configure location {} {} '
+               'rule 0: #kind eq cluster').format(loc_constraint_name,
+                                                  res_name)
+        pcmk.commit(cmd, failure_is_fatal=True)
+        log('%s' % cmd, level=DEBUG)
+    if legacy_constraints:
+        cmd = 'crm -w -F configure delete {}'.format(
+            ' '.join(legacy_constraints))
+        pcmk.commit(cmd, failure_is_fatal=True)
+        log('%s' % cmd, level=DEBUG)
+
+
+def get_remote_placement():
+    """Placement of the pacemaker remote resources on the local nodes.
+
+    :returns: One of REMOTE_PLACEMENTS
+    :rtype: str
+    :raises: ValueError
+    """
+    placement = config('remote_placement') or 'round-robin'
+    if placement not in REMOTE_PLACEMENTS:
+        msg = ("Unsupported remote_placement '%s' - supported values are: "
+               "%s" % (placement, ', '.join(REMOTE_PLACEMENTS)))
+        status_set('blocked', msg)
+        raise ValueError(msg)
+    return placement
+
+
+def rendezvous_node(res_name, nodes):
+    """Select the preferred node of a resource by rendezvous hashing.
+
+    Every (resource, node) pair is given a pseudo random weight and the node
+    with the highest weight is selected. Adding a node only moves the
+    resources that now prefer it and removing one only moves the resources
+    that preferred it.
+
+    :param res_name: Resource name.
+    :type res_name: str
+    :param nodes: Candidate nodes.
+    :type nodes: List[str]
+    :returns: Preferred node.
+    :rtype: str
+    """
+    return max(sorted(nodes),
+               key=lambda node: pcmk.generate_checksum([res_name, node]))
+
+
 def add_location_rules_for_pacemaker_remotes(res_names):
     """Add location rules for pacemaker remote resources on local nodes.
 
     Add location rules allowing the pacemaker remote resource to run on a local
-    node. Use location score rules to spread resources out.
+    node. Use location score rules to spread resources out, either round-robin
+    or by rendezvous hashing depending on the remote_placement option. Only
+    the location rules whose score changed are updated.
 
     :param res_names: Pacemaker remote resource names.
     :type res_names: List[str]
     """
     res_names = sorted(res_names)
     nodes = sorted(pcmk.list_nodes())
-    prefered_nodes = list(zip(res_names, itertools.cycle(nodes)))
+    if get_remote_placement() == 'rendezvous':
+        prefered_nodes = [(res_name, rendezvous_node(res_name, nodes))
+                          for res_name in res_names]
+    else:
+        prefered_nodes = list(zip(res_names, itertools.cycle(nodes)))
+    locations = pcmk.configured_locations() if res_names else {}
     for res_name in res_names:
         for node in nodes:
             location_score = 0
             if (res_name, node) in prefered_nodes:
                 location_score = 200
+            loc_constraint_name = 'loc-{}-{}'.format(res_name, node)
+            if (locations.get(loc_constraint_name) ==
+                    (res_name, str(location_score), node)):
+                continue
             add_score_location_rule(
                 res_name,
                 node,
@@ -861,6 +1053,26 @@ def configure_pacemaker_remote(remote_hostname, remote_ip):
     return resource_name
 
 
+def update_pacemaker_remote(remote_hostname, remote_ip):
+    """Update the address of the resource of a pacemaker remote node.
+
+    :param remote_hostname: Remote hostname used for registering remote node.
+    :type remote_hostname: str
+    :param remote_ip: Remote IP used for registering remote node.
+    :type remote_ip: str
+    :returns: Name of resource for pacemaker remote node.
+    :rtype: str
+    """
+    resource_name = remote_hostname
+    pcmk.crm_update_resource(
+        resource_name,
+        'ocf:pacemaker:remote',
+        'params server={} reconnect_interval=60 '
+        'op monitor interval=30s'.format(remote_ip),
+        force=True)
+    return resource_name
+
+
 def cleanup_remote_nodes(remote_nodes):
     """Cleanup pacemaker remote resources
 
@@ -925,21 +1137,56 @@ def configure_pacemaker_remote_resources():
     Create resources, location constraints and stonith resources for pacemaker
     remote node.
 
+    The settings of each remote unit are recorded in the local kv store, only
+    the remotes added or changed since the last run are configured. Only the
+    remote resources crm_mon reports as failed are cleaned up.
+
     :returns: resource dict {res_name: res_type, ...}
     :rtype: dict
     """
     log('Checking for pacemaker-remote nodes', level=DEBUG)
+    db = unitdata.kv()
+    applied = db.get(PCMKR_REMOTES_KEY) or {}
+    remotes = {}
     resources = []
     for relid in relation_ids('pacemaker-remote'):
         for unit in related_units(relid):
             remote_hostname = parse_data(relid, unit, 'remote-hostname')
             remote_ip = parse_data(relid, unit, 'remote-ip')
-            if remote_hostname:
+            if not remote_hostname:
+                continue
+            remote = {
+                'remote-hostname': remote_hostname,
+                'remote-ip': remote_ip,
+                'stonith-hostname': parse_data(relid, unit,
+                                               'stonith-hostname')}
+            remote['hash'] = pcmk.generate_checksum(
+                [json.dumps(remote, sort_keys=True)])
+            previous = applied.get(unit) or {}
+            if (previous.get('hash') == remote['hash'] and
+                    pcmk.is_resource_present(remote_hostname)):
+                log('Pacemaker remote {} unchanged'.format(unit),
+                    level=DEBUG)
+                resource_name = remote_hostname
+            elif (previous.get('remote-hostname') == remote_hostname and
+                    pcmk.is_resource_present(remote_hostname)):
+                log('Pacemaker remote {} changed'.format(unit), level=INFO)
+                resource_name = update_pacemaker_remote(
+                    remote_hostname,
+                    remote_ip)
+            else:
                 resource_name = configure_pacemaker_remote(
                     remote_hostname,
                     remote_ip)
-                resources.append(resource_name)
-    cleanup_remote_nodes(resources)
+            remotes[unit] = remote
+            resources.append(resource_name)
+    for unit in sorted(set(applied) - set(remotes)):
+        log('Pacemaker remote {} ({}) departed'.format(
+            unit, applied[unit].get('remote-hostname')), level=INFO)
+    failed = pcmk.failed_resources()
+    cleanup_remote_nodes([name for name in resources if name in failed])
+    db.set(PCMKR_REMOTES_KEY, remotes)
+    db.flush()
     return {name: 'ocf:pacemaker:remote' for name in resources}
 
 
@@ -969,16 +1216,20 @@ def configure_resources_on_remotes(resources=None, clones=None, groups=None):
                'location constraints')
         log(msg, level=WARNING)
         return
+    if config('local_node_location_rule'):
+        add_location_rules = add_location_rule_for_local_nodes
+    else:
+        add_location_rules = add_location_rules_for_local_nodes
     pacemaker_remotes = []
     for res_name, res_type in resources.items():
         if res_name not in list(clones.values()) + list(groups.values()):
             if res_type == 'ocf:pacemaker:remote':
                 pacemaker_remotes.append(res_name)
             else:
-                add_location_rules_for_local_nodes(res_name)
+                add_location_rules(res_name)
     add_location_rules_for_pacemaker_remotes(pacemaker_remotes)
     for cl_name in clones:
-        add_location_rules_for_local_nodes(cl_name)
+        add_location_rules(cl_name)
         # Limit clone resources to only running on X number of nodes where X
         # is the number of local nodes. Otherwise they will show as offline
         # on the remote nodes.
@@ -988,7 +1239,7 @@ def configure_resources_on_remotes(resources=None, clones=None, groups=None):
         pcmk.commit(cmd, failure_is_fatal=True)
         log('%s' % cmd, level=DEBUG)
     for grp_name in groups:
-        add_location_rules_for_local_nodes(grp_name)
+        add_location_rules(grp_name)
 
 
 def restart_corosync_on_change():
@@ -1014,12 +1265,16 @@ def restart_corosync_on_change():
     return wrap
 
 
-def try_pcmk_wait():
+def try_pcmk_wait(require_quorum=False):
     """Try pcmk.wait_for_pcmk()
     Log results and set status message
+
+    :param require_quorum: Whether the cluster must have quorum, e.g. before
+                           configuring resources.
+    :type require_quorum: bool
     """
     try:
-        pcmk.wait_for_pcmk()
+        pcmk.wait_for_pcmk(require_quorum=require_quorum)
         log("Pacemaker is ready", level=TRACE)
     except pcmk.ServicesNotUp as e:
         status_msg = "Pacemaker is down. Please manually start it."
@@ -1166,8 +1421,8 @@ def needs_maas_dns_migration():
     :return: True if migration is necessary, False otherwise.
     """
     try:
-        subprocess.check_call(['grep', 'OCF_RESOURCE_INSTANCE',
-                               '/usr/lib/ocf/resource.d/maas/dns'])
+        pcmk.check_call(['grep', 'OCF_RESOURCE_INSTANCE',
+                         '/usr/lib/ocf/resource.d/maas/dns'])
         return True
     except subprocess.CalledProcessError:
         # check_call will raise an exception if grep doesn't find the string
@@ -1180,9 +1435,14 @@ def is_in_standby_mode(node_name):
     @param node_name: The name of the node to check
     @returns boolean - True if node_name is in standby mode
     """
+    status = pcmk.read_status_snapshot()
+    if status is not None:
+        node = status['nodes'].get(node_name, {})
+        return node.get('standby') == 'true'
+
     if CompareHostReleases(get_distrib_codename()) >= 'jammy':
-        out = (subprocess.check_output(['crm', 'node', 'attribute',
-                                       node_name, 'show', 'standby'])
+        out = (pcmk.check_output(['crm', 'node', 'attribute',
+                                  node_name, 'show', 'standby'])
                .decode('utf-8'))
         attrs = {}
         for item in re.split('[ ]+', out.strip()):
@@ -1190,7 +1450,7 @@ def is_in_standby_mode(node_name):
             attrs[tokens[0]] = tokens[1]
         standby_mode = attrs['name'] == 'standby' and attrs['value'] == 'on'
     else:
-        out = (subprocess
+        out = (pcmk
                .check_output(['crm', 'node', 'status', node_name])
                .decode('utf-8'))
         root = ET.fromstring(out)
@@ -1216,7 +1476,8 @@ def enter_standby_mode(node_name, duration='forever'):
 
     @returns None
     """
-    subprocess.check_call(['crm', 'node', 'standby', node_name, duration])
+    pcmk.invalidate_cib_snapshot()
+    pcmk.check_call(['crm', 'node', 'standby', node_name, duration])
 
 
 def leave_standby_mode(node_name):
@@ -1224,7 +1485,8 @@ def leave_standby_mode(node_name):
 
     @returns None
     """
-    subprocess.check_call(['crm', 'node', 'online', node_name])
+    pcmk.invalidate_cib_snapshot()
+    pcmk.check_call(['crm', 'node', 'online', node_name])
 
 
 def node_has_resources(node_name):
@@ -1233,7 +1495,12 @@ def node_has_resources(node_name):
     @param node_name: The name of the node to check
     @returns boolean - True if node_name has resources
     """
-    out = subprocess.check_output(['crm_mon', '-X']).decode('utf-8')
+    status = pcmk.read_status_snapshot()
+    if status is not None:
+        node = status['nodes'].get(node_name, {})
+        return int(node.get('resources_running', 0)) > 0
+
+    out = pcmk.check_output(['crm_mon', '-X']).decode('utf-8')
     root = ET.fromstring(out)
     has_resources = False
     for resource in root.iter('resource'):
@@ -1249,7 +1516,12 @@ def node_is_dc(node_name):
     @param node_name: The name of the node to check
     @returns boolean - True if node_name is the DC
     """
-    out = subprocess.check_output(['crm_mon', '-X']).decode('utf-8')
+    status = pcmk.read_status_snapshot()
+    if status is not None:
+        current_dc = status['summary'].get('current_dc', {})
+        return current_dc.get('name') == node_name
+
+    out = pcmk.check_output(['crm_mon', '-X']).decode('utf-8')
     root = ET.fromstring(out)
     for current_dc in root.iter("current_dc"):
         if current_dc.attrib.get('name') == node_name:
@@ -1420,11 +1692,11 @@ def kill_legacy_ocf_daemon_process(res_name):
     ocf_name = res_name.replace('res_', '').replace('_', '-')
     reg_expr = r'([0-9]+)\s+[^0-9]+{}'.format(ocf_name)
     cmd = ['ps', '-eo', 'pid,cmd']
-    ps = subprocess.check_output(cmd).decode('utf-8')
+    ps = pcmk.check_output(cmd).decode('utf-8')
     res = re.search(reg_expr, ps, re.MULTILINE)
     if res:
         pid = res.group(1)
-        subprocess.call(['sudo', 'kill', '-9', pid])
+        pcmk.call(['sudo', 'kill', '-9', pid])
 
 
 def maintenance_mode(enable):
@@ -48,11 +48,18 @@ class ClusterStatusTestCase(test_utils.CharmTestCase):
                 "res_ks_haproxy": [{"call": "10", "task": "probe"},
                                    {"call": "12", "task": "monitor"}]}}
     }
+    history_summary = {
+        "res_ks_haproxy": {
+            "probe": {"count": 1, "failures": 0, "last_rc": "7",
+                      "exec_time_ms": {"p50": 20, "p95": 20, "max": 20},
+                      "queue_time_ms": {"p50": 0, "p95": 0, "max": 0}}}}
 
     def setUp(self):
         super(ClusterStatusTestCase, self).setUp(actions, self.TO_PATCH)
 
-        def _cluster_status(resources=True, history=False):
+        def _cluster_status(resources=True, history=False,
+                            history_summary=False, only_nodes=None,
+                            only_resources=None):
             status = self.health_status.copy()
             if not resources:
                 del status["resources"]
@@ -60,6 +67,9 @@ class ClusterStatusTestCase(test_utils.CharmTestCase):
             if not history:
                 del status["history"]
 
+            if history_summary:
+                status["history_summary"] = self.history_summary
+
             return status
 
         self.pcmk.cluster_status.side_effect = _cluster_status
@@ -103,6 +113,31 @@ class ClusterStatusTestCase(test_utils.CharmTestCase):
         self.function_set.assert_called_once_with(
             {"result": json.dumps(health_status)})
 
+    def test_status_with_summary(self):
+        """test getting cluster status with the history summary"""
+        self._function_get["summary"] = 1
+        health_status = self.health_status.copy()
+        del health_status["history"]
+        health_status["history_summary"] = self.history_summary
+
+        actions.status([])
+        self.pcmk.cluster_status.assert_called_once_with(
+            resources=True, history=False, history_summary=True,
+            only_nodes=None, only_resources=None)
+        self.function_set.assert_called_once_with(
+            {"result": json.dumps(health_status)})
+
+    def test_status_filtered(self):
+        """test getting cluster status of some nodes and resources"""
+        self._function_get["node"] = "juju-d07fb7-3, juju-d07fb7-4"
+        self._function_get["resource"] = "res_ks_haproxy"
+
+        actions.status([])
+        self.pcmk.cluster_status.assert_called_once_with(
+            resources=True, history=True, history_summary=False,
+            only_nodes=["juju-d07fb7-3", "juju-d07fb7-4"],
+            only_resources=["res_ks_haproxy"])
+
     def test_status_raise_error(self):
         self.pcmk.cluster_status.side_effect = subprocess.CalledProcessError(
             returncode=1, cmd=["crm", "status", "xml", "--inactive"])
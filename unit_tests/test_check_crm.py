@@ -0,0 +1,146 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib.machinery
+import importlib.util
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+_path = os.path.dirname(os.path.realpath(__file__))
+_loader = importlib.machinery.SourceFileLoader(
+    'check_crm', os.path.join(_path, '..', 'files', 'nrpe', 'check_crm'))
+_spec = importlib.util.spec_from_loader('check_crm', _loader)
+check_crm = importlib.util.module_from_spec(_spec)
+_loader.exec_module(check_crm)
+
+with open(os.path.join(_path, 'testdata', 'test_crm_mon.xml')) as f:
+    CRM_MON_XML = f.read()
+
+DEGRADED_XML = CRM_MON_XML.replace(
+    # juju-2eebcf-3 in standby, its haproxy instance stopped
+    'id="1002" online="true" standby="false"',
+    'id="1002" online="true" standby="true"'
+).replace(
+    '''role="Started" active="true" orphaned="false" blocked="false" managed="true" failed="false" failure_ignored="false" nodes_running_on="1" >
+                <node name="juju-2eebcf-3" id="1002" cached="false"/>''',  # noqa
+    '''role="Stopped" active="false" orphaned="false" blocked="false" managed="true" failed="false" failure_ignored="false" nodes_running_on="0" >'''  # noqa
+).replace(
+    '<resource_history id="res_ks_bc84550_vip"',
+    '<resource_history id="res_ks_bc84550_vip" fail-count="4"')
+
+
+class TestCheckCrm(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.snapshot = os.path.join(self.tmpdir, 'cluster-status.json')
+        check_output = mock.patch.object(check_crm.subprocess,
+                                         'check_output')
+        self.check_output = check_output.start()
+        self.addCleanup(check_output.stop)
+
+    def run_check(self, *args):
+        stdout = io.StringIO()
+        with mock.patch('sys.stdout', stdout):
+            with self.assertRaises(SystemExit) as cm:
+                check_crm.main(['--snapshot', self.snapshot] + list(args))
+        return cm.exception.code, stdout.getvalue().strip()
+
+    def test_ok(self):
+        self.check_output.return_value = CRM_MON_XML.encode()
+        code, output = self.run_check('-s')
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            output,
+            'CHECK_CRM OK - Cluster OK | failed_actions=0;;;0 '
+            'nodes_offline=0;;;0 nodes_online=3;;;0 nodes_standby=0;;;0 '
+            'resources_failed=0;;;0 resources_started=5;;;0 '
+            'resources_stopped=0;;;0')
+        self.check_output.assert_called_once_with(
+            ['/usr/bin/sudo', '/usr/sbin/crm_mon', '--output-as=xml',
+             '--inactive'], stderr=subprocess.STDOUT)
+
+    def test_degraded(self):
+        self.check_output.return_value = DEGRADED_XML.encode()
+        code, output = self.run_check()
+        self.assertEqual(code, 2)
+        self.assertIn('CHECK_CRM CRITICAL - : juju-2eebcf-3 in Standby '
+                      ': juju-2eebcf-3 Stopped |', output)
+        self.assertIn('nodes_standby=1;;;0', output)
+        self.assertIn('resources_stopped=1;;;0', output)
+
+        code, output = self.run_check('-s')
+        self.assertEqual(code, 1)
+        self.assertEqual(
+            output.split(' | ')[0],
+            'CHECK_CRM WARNING - : res_ks_bc84550_vip failure detected, '
+            'fail-count=4')
+
+        code, output = self.run_check('-s', '--failcount-crit=4')
+        self.assertEqual(code, 2)
+
+    def test_snapshot(self):
+        with open(self.snapshot, 'w') as f:
+            json.dump({'timestamp': 1000.0, 'ttl': 60}, f)
+        with open(os.path.join(self.tmpdir, 'cluster-status.xml'), 'w') as f:
+            f.write(DEGRADED_XML)
+        self.check_output.return_value = CRM_MON_XML.encode()
+
+        with mock.patch.object(check_crm.time, 'time', return_value=1030.0):
+            code, output = self.run_check()
+        self.assertEqual(code, 2)
+        self.assertFalse(self.check_output.called)
+
+        # expired
+        with mock.patch.object(check_crm.time, 'time', return_value=1061.0):
+            code, output = self.run_check()
+        self.assertEqual(code, 0)
+        self.assertTrue(self.check_output.called)
+
+    def test_crm_mon_fails(self):
+        self.check_output.side_effect = [
+            subprocess.CalledProcessError(64, 'crm_mon', b'unknown option'),
+            subprocess.CalledProcessError(
+                102, 'crm_mon', b'Connection to cluster failed'),
+        ]
+        code, output = self.run_check()
+        self.assertEqual(code, 2)
+        self.assertEqual(output, 'CHECK_CRM CRITICAL - Running crm_mon has '
+                                 'failed: Connection to cluster failed')
+        self.check_output.assert_called_with(
+            ['/usr/bin/sudo', '/usr/sbin/crm_mon', '--as-xml', '--inactive'],
+            stderr=subprocess.STDOUT)
+
+    def test_constraints(self):
+        self.check_output.side_effect = [
+            CRM_MON_XML.encode(),
+            b'<constraints>'
+            b'<rsc_location id="cli-ban-res_ks_vip-on-node1" '
+            b'rsc="res_ks_vip" node="node1" score="-INFINITY"/>'
+            b'<rsc_location id="loc-res_ks_vip" rsc="res_ks_vip" '
+            b'node="node1" score="0"/>'
+            b'</constraints>',
+        ]
+        code, output = self.run_check('-c')
+        self.assertEqual(code, 1)
+        self.assertEqual(output.split(' | ')[0],
+                         'CHECK_CRM WARNING - : res_ks_vip blocking location '
+                         'constraint detected')
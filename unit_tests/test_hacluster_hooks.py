@@ -27,6 +27,33 @@ import hooks
 import utils
 
 
+class FakeCIB(object):
+    """Keep the cluster properties and the applied objects record set with
+    `crm configure property` and cibadmin."""
+
+    def __init__(self):
+        self.properties = {}
+        self.applied = ''
+
+    def cib_xml(self):
+        nvpairs = ''.join(
+            '<nvpair id="cib-bootstrap-options-{0}" name="{0}" '
+            'value="{1}"/>'.format(name, value)
+            for name, value in self.properties.items())
+        return ('<cib><configuration><crm_config>'
+                '<cluster_property_set id="cib-bootstrap-options">{}'
+                '</cluster_property_set>{}</crm_config></configuration>'
+                '</cib>'.format(nvpairs, self.applied))
+
+    def call(self, cmd, **kwargs):
+        if cmd[0] == 'cibadmin':
+            self.applied = cmd[-1]
+        elif cmd[:3] == ['crm', 'configure', 'property']:
+            name, value = cmd[3].split('=', 1)
+            self.properties[name] = value
+        return 0
+
+
 @mock.patch.object(hooks, 'log', lambda *args, **kwargs: None)
 @mock.patch('utils.COROSYNC_CONF', os.path.join(tempfile.mkdtemp(),
                                                 'corosync.conf'))
@@ -36,10 +63,19 @@ class TestCorosyncConf(unittest.TestCase):
         self.tmpdir = tempfile.mkdtemp()
         self.tmpfile = tempfile.NamedTemporaryFile(delete=False)
         os.environ['UNIT_STATE_DB'] = ':memory:'
+        self.cib = FakeCIB()
+        pcmk.invalidate_cib_snapshot()
+        for name, new in (('_backend', self.cib),
+                          ('call', self.cib.call),
+                          ('check_call', self.cib.call)):
+            patcher = mock.patch.object(pcmk, name, new)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
     def tearDown(self):
         shutil.rmtree(self.tmpdir)
         os.remove(self.tmpfile.name)
+        pcmk.invalidate_cib_snapshot()
 
     @mock.patch.object(pcmk.unitdata, 'kv')
     @mock.patch.object(hooks, 'remote_unit')
@@ -145,6 +181,7 @@ class TestCorosyncConf(unittest.TestCase):
         set_cluster_symmetry.assert_called_with()
         configure_pacemaker_remote_resources.assert_called_with()
         write_maas_dns_address.assert_not_called()
+        wait_for_pcmk.assert_called_once_with(require_quorum=True)
 
         # verify deletion of resources.
         crm_opt_exists.assert_any_call('res_nova_eth0_vip')
@@ -162,7 +199,8 @@ class TestCorosyncConf(unittest.TestCase):
             for name, params in rel_get_data[key].items():
                 if name == "res_ubuntu":
                     commit.assert_any_call(
-                        'crm configure load update %s' % self.tmpfile.name)
+                        'crm -w -F configure load update %s' %
+                        self.tmpfile.name)
 
                 elif name in rel_get_data['resource_params']:
                     res_params = rel_get_data['resource_params'][name]
@@ -173,6 +211,150 @@ class TestCorosyncConf(unittest.TestCase):
                     commit.assert_any_call(
                         'crm -w -F configure %s %s %s' % (kw, name, params))
 
+    @mock.patch.object(pcmk.unitdata, 'kv')
+    @mock.patch.object(hooks, 'remote_unit')
+    @mock.patch.object(hooks, 'relation_type')
+    @mock.patch.object(hooks, 'trigger_corosync_update_from_leader')
+    @mock.patch.object(hooks, 'is_stonith_configured')
+    @mock.patch.object(hooks, 'configure_peer_stonith_resource')
+    @mock.patch.object(hooks, 'get_member_ready_nodes')
+    @mock.patch.object(hooks, 'configure_resources_on_remotes')
+    @mock.patch.object(hooks, 'configure_pacemaker_remote_stonith_resource')
+    @mock.patch.object(hooks, 'configure_pacemaker_remote_resources')
+    @mock.patch.object(hooks, 'set_cluster_symmetry')
+    @mock.patch.object(hooks, 'write_maas_dns_address')
+    @mock.patch('pcmk.wait_for_pcmk')
+    @mock.patch('pcmk.crm_opt_exists')
+    @mock.patch.object(hooks, 'is_leader')
+    @mock.patch.object(hooks, 'configure_corosync')
+    @mock.patch.object(hooks, 'configure_cluster_global')
+    @mock.patch.object(hooks, 'configure_monitor_host')
+    @mock.patch.object(hooks, 'configure_stonith')
+    @mock.patch.object(hooks, 'related_units')
+    @mock.patch.object(hooks, 'get_cluster_nodes')
+    @mock.patch.object(hooks, 'relation_set')
+    @mock.patch.object(hooks, 'relation_ids')
+    @mock.patch.object(hooks, 'get_corosync_conf')
+    @mock.patch('pcmk.commit')
+    @mock.patch.object(hooks, 'config')
+    @mock.patch.object(hooks, 'parse_data')
+    def test_ha_relation_changed_batch(
+            self, parse_data, config, commit, get_corosync_conf,
+            relation_ids, relation_set, get_cluster_nodes, related_units,
+            configure_stonith, configure_monitor_host,
+            configure_cluster_global, configure_corosync, is_leader,
+            crm_opt_exists, wait_for_pcmk, write_maas_dns_address,
+            set_cluster_symmetry, configure_pacemaker_remote_resources,
+            configure_pacemaker_remote_stonith_resource,
+            configure_resources_on_remotes, get_member_ready_nodes,
+            configure_peer_stonith_resource, is_stonith_configured,
+            trigger_corosync_update_from_leader, relation_type, remote_unit,
+            mock_kv):
+
+        def fake_crm_opt_exists(res_name):
+            # res_ubuntu will take the "update resource" route
+            # res_nova_eth0_vip will take the delete resource route
+            return res_name in ["res_ubuntu", "res_nova_eth0_vip"]
+
+        db = test_utils.FakeKvStore()
+        mock_kv.return_value = db
+        crm_opt_exists.side_effect = fake_crm_opt_exists
+        commit.return_value = 0
+        is_stonith_configured.return_value = False
+        is_leader.return_value = True
+        related_units.return_value = ['ha/0', 'ha/1', 'ha/2']
+        get_cluster_nodes.return_value = ['10.0.3.2', '10.0.3.3', '10.0.3.4']
+        get_member_ready_nodes.return_value = ['10.0.3.2', '10.0.3.3',
+                                               '10.0.3.4']
+        relation_ids.return_value = ['hanode:1']
+        get_corosync_conf.return_value = True
+        cfg = {'debug': False,
+               'prefer-ipv6': False,
+               'corosync_transport': 'udpu',
+               'corosync_mcastaddr': 'corosync_mcastaddr',
+               'cluster_count': 3,
+               'failure_timeout': 180,
+               'cluster_recheck_interval': 60,
+               'batch_configure': True}
+        trigger_corosync_update_from_leader.return_value = False
+        relation_type.return_value = "hanode"
+        remote_unit.return_value = "hacluster/0"
+
+        config.side_effect = lambda key: cfg.get(key)
+
+        rel_get_data = {'locations': {'loc_foo': 'bar rule inf: meh eq 1'},
+                        'clones': {'cl_foo': 'res_foo meta interleave=true'},
+                        'groups': {'grp_foo': 'res_foo'},
+                        'colocations': {'co_foo': 'inf: grp_foo cl_foo'},
+                        'resources': {'res_foo': 'ocf:heartbeat:IPaddr2',
+                                      'res_bar': 'ocf:heartbear:IPv6addr',
+                                      'res_ubuntu': 'IPaddr2'},
+                        'resource_params': {'res_foo': 'params bar',
+                                            'res_ubuntu': 'params ubuntu=42'},
+                        'ms': {'ms_foo': 'res_foo meta notify=true'},
+                        'orders': {'foo_after': 'inf: res_foo ms_foo'},
+                        'delete_resources': ['res_nova_eth0_vip']}
+
+        def fake_parse_data(relid, unit, key):
+            return rel_get_data.get(key, {})
+
+        parse_data.side_effect = fake_parse_data
+
+        hooks.ha_relation_changed()
+
+        relation_set.assert_any_call(relation_id='hanode:1', ready=True)
+        configure_stonith.assert_called_with()
+        configure_monitor_host.assert_called_with()
+        configure_cluster_global.assert_called_with(180, 60)
+        configure_corosync.assert_called_with()
+        set_cluster_symmetry.assert_called_with()
+        configure_pacemaker_remote_resources.assert_called_with()
+        write_maas_dns_address.assert_not_called()
+
+        # verify deletion of resources.
+        crm_opt_exists.assert_any_call('res_nova_eth0_vip')
+        commit.assert_any_call('crm resource cleanup res_nova_eth0_vip')
+        commit.assert_any_call('crm -w -F resource stop res_nova_eth0_vip')
+        commit.assert_any_call('crm -w -F configure delete res_nova_eth0_vip')
+
+        # all the new objects are created in a single CIB commit.
+        cmds = [call[0][0] for call in commit.call_args_list]
+        self.assertEqual(
+            len([cmd for cmd in cmds
+                 if cmd.startswith('crm -w -F configure load update ')]), 1)
+        for cmd in cmds:
+            self.assertNotRegex(
+                cmd,
+                r'^crm -w -F configure (primitive|group|clone|colocation|'
+                r'location|ms|order) ')
+
+        self.assertEqual(self.cib.properties['stonith-enabled'], 'false')
+        self.assertIn('name="res_foo"', self.cib.applied)
+
+        # nothing changed, the objects are compared to the CIB but nothing
+        # is applied again.
+        commit.reset_mock()
+        crm_opt_exists.reset_mock()
+        crm_opt_exists.side_effect = lambda name: name in [
+            'res_foo', 'res_bar', 'res_ubuntu', 'grp_foo', 'ms_foo',
+            'foo_after', 'cl_foo', 'co_foo', 'loc_foo']
+        with mock.patch.object(pcmk, 'crm_res_running') as crm_res_running:
+            crm_res_running.return_value = True
+            hooks.ha_relation_changed()
+        crm_opt_exists.assert_any_call('res_nova_eth0_vip')
+        crm_opt_exists.assert_any_call('res_foo')
+        commit.assert_not_called()
+
+        # a failed clone is cleaned up even though nothing changed.
+        with mock.patch.object(pcmk, 'crm_res_running') as crm_res_running, \
+                mock.patch.object(pcmk, 'failed_resources') as failed:
+            crm_res_running.return_value = True
+            failed.return_value = {'res_foo'}
+            hooks.ha_relation_changed()
+        self.assertEqual([call[0][0] for call in commit.call_args_list],
+                         ['crm resource cleanup cl_foo',
+                          'crm resource cleanup grp_foo'])
+
     @mock.patch.object(hooks, 'remote_unit')
     @mock.patch.object(hooks, 'relation_type')
     @mock.patch.object(hooks, 'trigger_corosync_update_from_leader')
@@ -217,6 +399,7 @@ class TestCorosyncConf(unittest.TestCase):
         is_stonith_configured.return_value = False
         validate_dns_ha.return_value = True
         crm_opt_exists.return_value = False
+        commit.return_value = 0
         is_leader.return_value = True
         related_units.return_value = ['ha/0', 'ha/1', 'ha/2']
         get_cluster_nodes.return_value = ['10.0.3.2', '10.0.3.3', '10.0.3.4']
@@ -22,6 +22,7 @@ import subprocess
 import tempfile
 import unittest
 
+import test_utils
 import utils
 import pcmk
 
@@ -102,6 +103,9 @@ class UtilsTestCaseWriteTmp(unittest.TestCase):
 
 
 class UtilsTestCase(unittest.TestCase):
+    def setUp(self):
+        utils.flush_relation_data()
+
     def _testdata(self, filename):
         return os.path.join(os.path.dirname(__file__),
                             'testdata',
@@ -243,6 +247,9 @@ class UtilsTestCase(unittest.TestCase):
         # Returns OK
         mock_wait_for_pcmk.side_effect = None
         self.assertEqual(None, utils.try_pcmk_wait())
+        mock_wait_for_pcmk.assert_called_with(require_quorum=False)
+        utils.try_pcmk_wait(require_quorum=True)
+        mock_wait_for_pcmk.assert_called_with(require_quorum=True)
 
         # Raises Exception
         mock_wait_for_pcmk.side_effect = pcmk.ServicesNotUp
@@ -429,30 +436,27 @@ class UtilsTestCase(unittest.TestCase):
         _rel_data = {
             'testkey': repr({'test': 1})
         }
-        relation_get.side_effect = lambda key, relid, unit: _rel_data.get(key)
+        relation_get.return_value = _rel_data
         self.assertEqual(utils.parse_data('hacluster:1',
                                           'neutron-api/0',
                                           'testkey'),
                          {'test': 1})
-        relation_get.assert_has_calls([
-            mock.call('json_testkey', 'neutron-api/0', 'hacluster:1'),
-            mock.call('testkey', 'neutron-api/0', 'hacluster:1'),
-        ])
+        relation_get.assert_called_once_with(rid='hacluster:1',
+                                             unit='neutron-api/0')
 
-    @mock.patch('pcmk.commit')
+    @mock.patch('pcmk.set_property')
     @mock.patch.object(utils, 'configure_pacemaker_remote_stonith_resource')
     def test_configure_stonith_no_maas(
             self,
             mock_cfg_pcmkr_rstonith_res,
-            mock_commit):
+            mock_set_property):
         # Without MAAS this function will return no resource:
         mock_cfg_pcmkr_rstonith_res.return_value = []
 
         utils.configure_stonith()
 
-        mock_commit.assert_called_once_with(
-            'crm configure property stonith-enabled=false',
-            failure_is_fatal=False)
+        mock_set_property.assert_called_once_with(
+            'stonith-enabled', 'false', failure_is_fatal=False)
 
     @mock.patch.object(utils, 'relation_get')
     def test_parse_data_json(self, relation_get):
@@ -460,16 +464,34 @@ class UtilsTestCase(unittest.TestCase):
             'json_testkey': json.dumps({'test': 1}),
             'testkey': repr({'test': 1})
         }
-        relation_get.side_effect = lambda key, relid, unit: _rel_data.get(key)
-        self.assertEqual(utils.parse_data('hacluster:1',
-                                          'neutron-api/0',
-                                          'testkey'),
-                         {'test': 1})
-        # NOTE(jamespage): as json is the preferred format, the call for
-        #                  testkey should not occur.
-        relation_get.assert_has_calls([
-            mock.call('json_testkey', 'neutron-api/0', 'hacluster:1'),
-        ])
+        relation_get.return_value = _rel_data
+        with mock.patch.object(utils.ast, 'literal_eval') as literal_eval:
+            self.assertEqual(utils.parse_data('hacluster:1',
+                                              'neutron-api/0',
+                                              'testkey'),
+                             {'test': 1})
+        # NOTE(jamespage): as json is the preferred format, testkey should
+        #                  not be parsed.
+        self.assertFalse(literal_eval.called)
+
+    @mock.patch.object(utils, 'relation_get')
+    def test_parse_data_cached(self, relation_get):
+        relation_get.return_value = {
+            'json_resources': json.dumps({'res_vip': 'ocf:heartbeat:IPaddr2'}),
+            'json_groups': json.dumps({'grp_vips': 'res_vip'})}
+        resources = utils.parse_data('ha:1', 'keystone/0', 'resources')
+        resources['res_other'] = 'ocf:heartbeat:IPaddr2'
+        self.assertEqual(utils.parse_data('ha:1', 'keystone/0', 'resources'),
+                         {'res_vip': 'ocf:heartbeat:IPaddr2'})
+        self.assertEqual(utils.parse_data('ha:1', 'keystone/0', 'groups'),
+                         {'grp_vips': 'res_vip'})
+        self.assertEqual(utils.parse_data('ha:1', 'keystone/0', 'clones'), {})
+        relation_get.assert_called_once_with(rid='ha:1', unit='keystone/0')
+
+        utils.flush_relation_data()
+        relation_get.return_value = {}
+        self.assertEqual(utils.parse_data('ha:1', 'keystone/0', 'resources'),
+                         {})
 
     @mock.patch.object(utils, 'render')
     @mock.patch.object(utils.os.path, 'isdir')
@@ -630,7 +652,7 @@ class UtilsTestCase(unittest.TestCase):
 
         relation_ids.side_effect = lambda x: rdata.keys()
         related_units.side_effect = lambda x: rdata[x].keys()
-        relation_get.side_effect = lambda x, y, z: rdata[z][y].get(x)
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
         self.assertFalse(utils.need_resources_on_remotes())
 
     @mock.patch.object(utils, 'relation_get')
@@ -647,7 +669,7 @@ class UtilsTestCase(unittest.TestCase):
 
         relation_ids.side_effect = lambda x: rdata.keys()
         related_units.side_effect = lambda x: rdata[x].keys()
-        relation_get.side_effect = lambda x, y, z: rdata[z][y].get(x)
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
         self.assertTrue(utils.need_resources_on_remotes())
 
     @mock.patch.object(utils, 'relation_get')
@@ -663,7 +685,7 @@ class UtilsTestCase(unittest.TestCase):
 
         relation_ids.side_effect = lambda x: rdata.keys()
         related_units.side_effect = lambda x: rdata[x].keys()
-        relation_get.side_effect = lambda x, y, z: rdata[z][y].get(x)
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
         with self.assertRaises(ValueError):
             self.assertTrue(utils.need_resources_on_remotes())
 
@@ -681,37 +703,33 @@ class UtilsTestCase(unittest.TestCase):
 
         relation_ids.side_effect = lambda x: rdata.keys()
         related_units.side_effect = lambda x: rdata[x].keys()
-        relation_get.side_effect = lambda x, y, z: rdata[z][y].get(x, None)
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
         with self.assertRaises(ValueError):
             self.assertTrue(utils.need_resources_on_remotes())
 
     @mock.patch.object(utils, 'need_resources_on_remotes')
-    @mock.patch('pcmk.commit')
-    def test_set_cluster_symmetry_true(self, commit,
+    @mock.patch('pcmk.set_property')
+    def test_set_cluster_symmetry_true(self, set_property,
                                        need_resources_on_remotes):
         need_resources_on_remotes.return_value = True
         utils.set_cluster_symmetry()
-        commit.assert_called_once_with(
-            'crm configure property symmetric-cluster=true',
-            failure_is_fatal=True)
+        set_property.assert_called_once_with('symmetric-cluster', 'true')
 
     @mock.patch.object(utils, 'need_resources_on_remotes')
-    @mock.patch('pcmk.commit')
-    def test_set_cluster_symmetry_false(self, commit,
+    @mock.patch('pcmk.set_property')
+    def test_set_cluster_symmetry_false(self, set_property,
                                         need_resources_on_remotes):
         need_resources_on_remotes.return_value = False
         utils.set_cluster_symmetry()
-        commit.assert_called_once_with(
-            'crm configure property symmetric-cluster=false',
-            failure_is_fatal=True)
+        set_property.assert_called_once_with('symmetric-cluster', 'false')
 
     @mock.patch.object(utils, 'need_resources_on_remotes')
-    @mock.patch('pcmk.commit')
-    def test_set_cluster_symmetry_unknown(self, commit,
+    @mock.patch('pcmk.set_property')
+    def test_set_cluster_symmetry_unknown(self, set_property,
                                           need_resources_on_remotes):
         need_resources_on_remotes.side_effect = ValueError()
         utils.set_cluster_symmetry()
-        self.assertFalse(commit.called)
+        self.assertFalse(set_property.called)
 
     @mock.patch('pcmk.crm_update_location')
     def test_add_score_location_rule(self, crm_update_location):
@@ -736,10 +754,38 @@ class UtilsTestCase(unittest.TestCase):
             'crm -w -F configure location loc-res1-node2 res1 0: node2',
             failure_is_fatal=True)
 
+    @mock.patch('pcmk.commit')
+    @mock.patch('pcmk.crm_opt_exists')
+    @mock.patch('pcmk.list_nodes')
+    def test_add_location_rule_for_local_nodes(self, list_nodes,
+                                               crm_opt_exists, commit):
+        existing_resources = ['loc-res1-node1', 'loc-res1-node3']
+        list_nodes.return_value = ['node1', 'node2', 'node3']
+        crm_opt_exists.side_effect = lambda x: x in existing_resources
+        utils.add_location_rule_for_local_nodes('res1')
+        commit.assert_has_calls([
+            mock.call('crm -w -F configure location loc-res1-local res1 '
+                      'rule 0: #kind eq cluster',
+                      failure_is_fatal=True),
+            mock.call('crm -w -F configure delete loc-res1-node1 '
+                      'loc-res1-node3',
+                      failure_is_fatal=True)])
+
+        commit.reset_mock()
+        existing_resources = ['loc-res1-local']
+        utils.add_location_rule_for_local_nodes('res1')
+        self.assertFalse(commit.called)
+
+    @mock.patch('pcmk.configured_locations')
+    @mock.patch.object(utils, 'config')
     @mock.patch.object(utils, 'add_score_location_rule')
     @mock.patch('pcmk.list_nodes')
     def test_add_location_rules_for_pacemaker_remotes(self, list_nodes,
-                                                      add_score_location_rule):
+                                                      add_score_location_rule,
+                                                      config,
+                                                      configured_locations):
+        config.return_value = None
+        configured_locations.return_value = {}
         list_nodes.return_value = ['node1', 'node2', 'node3']
         utils.add_location_rules_for_pacemaker_remotes([
             'res1',
@@ -765,6 +811,74 @@ class UtilsTestCase(unittest.TestCase):
             mock.call('res5', 'node3', 0)]
         add_score_location_rule.assert_has_calls(expect)
 
+    @mock.patch('pcmk.configured_locations')
+    @mock.patch.object(utils, 'config')
+    @mock.patch.object(utils, 'add_score_location_rule')
+    @mock.patch('pcmk.list_nodes')
+    def test_add_location_rules_for_pacemaker_remotes_unchanged(
+            self, list_nodes, add_score_location_rule, config,
+            configured_locations):
+        config.return_value = 'round-robin'
+        list_nodes.return_value = ['node1', 'node2']
+        configured_locations.return_value = {
+            'loc-res1-node1': ('res1', '200', 'node1'),
+            'loc-res1-node2': ('res1', '0', 'node2'),
+            'loc-res2-node1': ('res2', '200', 'node1'),
+            'loc-res2-node2': ('res2', '0', 'node2')}
+        utils.add_location_rules_for_pacemaker_remotes(['res1', 'res2'])
+        add_score_location_rule.assert_has_calls([
+            mock.call('res2', 'node1', 0),
+            mock.call('res2', 'node2', 200)])
+        self.assertEqual(add_score_location_rule.call_count, 2)
+
+    @mock.patch('pcmk.configured_locations')
+    @mock.patch.object(utils, 'config')
+    @mock.patch.object(utils, 'add_score_location_rule')
+    @mock.patch('pcmk.list_nodes')
+    def test_add_location_rules_for_pacemaker_remotes_rendezvous(
+            self, list_nodes, add_score_location_rule, config,
+            configured_locations):
+        config.return_value = 'rendezvous'
+        configured_locations.return_value = {}
+        list_nodes.return_value = ['node1', 'node2', 'node3']
+        utils.add_location_rules_for_pacemaker_remotes(['res1', 'res2'])
+        for res_name in ('res1', 'res2'):
+            preferred = utils.rendezvous_node(res_name, list_nodes())
+            add_score_location_rule.assert_any_call(res_name, preferred, 200)
+        self.assertEqual(add_score_location_rule.call_count, 6)
+
+    def test_rendezvous_node(self):
+        res_names = ['res-remote{}'.format(i) for i in range(50)]
+        nodes = ['node1', 'node2', 'node3']
+        before = {res: utils.rendezvous_node(res, nodes) for res in res_names}
+        self.assertEqual(set(before.values()), set(nodes))
+        self.assertEqual(before['res-remote7'],
+                         utils.rendezvous_node('res-remote7',
+                                               list(reversed(nodes))))
+        # Adding a node only moves resources to that node.
+        after = {res: utils.rendezvous_node(res, nodes + ['node4'])
+                 for res in res_names}
+        moved = [res for res in res_names if before[res] != after[res]]
+        self.assertTrue(moved)
+        self.assertEqual({after[res] for res in moved}, {'node4'})
+        # Removing a node only moves the resources it had.
+        after = {res: utils.rendezvous_node(res, ['node1', 'node3'])
+                 for res in res_names}
+        moved = [res for res in res_names if before[res] != after[res]]
+        self.assertEqual({before[res] for res in moved}, {'node2'})
+
+    @mock.patch.object(utils, 'status_set')
+    @mock.patch.object(utils, 'config')
+    def test_get_remote_placement(self, config, status_set):
+        config.return_value = None
+        self.assertEqual(utils.get_remote_placement(), 'round-robin')
+        config.return_value = 'rendezvous'
+        self.assertEqual(utils.get_remote_placement(), 'rendezvous')
+        config.return_value = 'random'
+        with self.assertRaises(ValueError):
+            utils.get_remote_placement()
+        self.assertEqual(status_set.call_args[0][0], 'blocked')
+
     @mock.patch('pcmk.is_resource_present')
     @mock.patch('pcmk.commit')
     def test_configure_pacemaker_remote(self, commit, is_resource_present):
@@ -823,6 +937,9 @@ class UtilsTestCase(unittest.TestCase):
                 failure_is_fatal=False)]
         commit.assert_has_calls(commit_calls)
 
+    @mock.patch.object(utils.unitdata, 'kv')
+    @mock.patch('pcmk.failed_resources')
+    @mock.patch('pcmk.is_resource_present')
     @mock.patch.object(utils, 'relation_get')
     @mock.patch.object(utils, 'related_units')
     @mock.patch.object(utils, 'relation_ids')
@@ -838,7 +955,13 @@ class UtilsTestCase(unittest.TestCase):
             add_location_rules_for_local_nodes,
             relation_ids,
             related_units,
-            relation_get):
+            relation_get,
+            is_resource_present,
+            failed_resources,
+            kv):
+        kv.return_value = test_utils.FakeKvStore()
+        is_resource_present.return_value = False
+        failed_resources.return_value = {'res-node2', 'res_ks_haproxy'}
         rdata = {
             'pacemaker-remote:49': {
                 'pacemaker-remote/0': {
@@ -852,7 +975,7 @@ class UtilsTestCase(unittest.TestCase):
                     'stonith-hostname': '"st-node3"'}}}
         relation_ids.side_effect = lambda x: rdata.keys()
         related_units.side_effect = lambda x: sorted(rdata[x].keys())
-        relation_get.side_effect = lambda x, y, z: rdata[z][y].get(x, None)
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
         configure_pacemaker_remote.side_effect = \
             lambda x, y: 'res-{}'.format(x)
         utils.configure_pacemaker_remote_resources()
@@ -862,8 +985,87 @@ class UtilsTestCase(unittest.TestCase):
         configure_pacemaker_remote.assert_has_calls(
             remote_calls,
             any_order=True)
-        cleanup_remote_nodes.assert_called_once_with(
-            ['res-node1', 'res-node2'])
+        cleanup_remote_nodes.assert_called_once_with(['res-node2'])
+
+    @mock.patch.object(utils.unitdata, 'kv')
+    @mock.patch('pcmk.failed_resources')
+    @mock.patch('pcmk.is_resource_present')
+    @mock.patch.object(utils, 'relation_get')
+    @mock.patch.object(utils, 'related_units')
+    @mock.patch.object(utils, 'relation_ids')
+    @mock.patch.object(utils, 'update_pacemaker_remote')
+    @mock.patch.object(utils, 'configure_pacemaker_remote')
+    @mock.patch.object(utils, 'cleanup_remote_nodes')
+    def test_configure_pacemaker_remote_resources_incremental(
+            self,
+            cleanup_remote_nodes,
+            configure_pacemaker_remote,
+            update_pacemaker_remote,
+            relation_ids,
+            related_units,
+            relation_get,
+            is_resource_present,
+            failed_resources,
+            kv):
+        kv.return_value = test_utils.FakeKvStore()
+        failed_resources.return_value = set()
+        rdata = {
+            'pacemaker-remote:49': {
+                'pacemaker-remote/0': {
+                    'remote-hostname': '"node1"',
+                    'remote-ip': '"10.0.0.10"'},
+                'pacemaker-remote/1': {
+                    'remote-hostname': '"node2"',
+                    'remote-ip': '"10.0.0.11"'}}}
+        relation_ids.side_effect = lambda x: rdata.keys()
+        related_units.side_effect = lambda x: sorted(rdata[x].keys())
+        relation_get.side_effect = lambda rid, unit: rdata[rid][unit]
+        configure_pacemaker_remote.side_effect = lambda x, y: x
+        update_pacemaker_remote.side_effect = lambda x, y: x
+        is_resource_present.return_value = False
+        self.assertEqual(
+            utils.configure_pacemaker_remote_resources(),
+            {'node1': 'ocf:pacemaker:remote',
+             'node2': 'ocf:pacemaker:remote'})
+        self.assertEqual(configure_pacemaker_remote.call_count, 2)
+
+        # Nothing changed
+        configure_pacemaker_remote.reset_mock()
+        utils.flush_relation_data()
+        is_resource_present.return_value = True
+        self.assertEqual(
+            utils.configure_pacemaker_remote_resources(),
+            {'node1': 'ocf:pacemaker:remote',
+             'node2': 'ocf:pacemaker:remote'})
+        self.assertFalse(configure_pacemaker_remote.called)
+        self.assertFalse(update_pacemaker_remote.called)
+        self.assertFalse(cleanup_remote_nodes.call_args[0][0])
+
+        # node2 changed address and node1 departed
+        utils.flush_relation_data()
+        rdata['pacemaker-remote:49']['pacemaker-remote/1']['remote-ip'] = (
+            '"10.0.0.12"')
+        del rdata['pacemaker-remote:49']['pacemaker-remote/0']
+        self.assertEqual(
+            utils.configure_pacemaker_remote_resources(),
+            {'node2': 'ocf:pacemaker:remote'})
+        self.assertFalse(configure_pacemaker_remote.called)
+        update_pacemaker_remote.assert_called_once_with('node2', '10.0.0.12')
+        self.assertEqual(
+            list(kv.return_value.get(utils.PCMKR_REMOTES_KEY)),
+            ['pacemaker-remote/1'])
+
+    @mock.patch('pcmk.crm_update_resource')
+    def test_update_pacemaker_remote(self, crm_update_resource):
+        self.assertEqual(
+            utils.update_pacemaker_remote('node1', '10.0.0.12'),
+            'node1')
+        crm_update_resource.assert_called_once_with(
+            'node1',
+            'ocf:pacemaker:remote',
+            'params server=10.0.0.12 reconnect_interval=60 '
+            'op monitor interval=30s',
+            force=True)
 
     @mock.patch.object(utils, 'config')
     @mock.patch.object(utils, 'remove_legacy_maas_stonith_resources')
@@ -889,6 +1091,30 @@ class UtilsTestCase(unittest.TestCase):
         ]
         commit.assert_has_calls(commit_calls)
 
+    @mock.patch.object(utils, 'config')
+    @mock.patch('pcmk.commit')
+    @mock.patch('pcmk.is_resource_present')
+    def test_configure_maas_stonith_resource_poll(self, is_resource_present,
+                                                  commit, config):
+        cfg = {
+            'maas_url': 'http://maas/2.0',
+            'maas_credentials': 'apikey',
+            'maas_poll_interval': 0.5,
+            'maas_poll_backoff': 1.5,
+            'maas_poll_deadline': 30}
+        is_resource_present.return_value = False
+        config.side_effect = lambda x: cfg.get(x)
+        utils.configure_maas_stonith_resource(['node1'])
+        commit.assert_called_once_with(
+            "crm configure primitive st-maas "
+            "stonith:external/maas "
+            "params url='http://maas/2.0' apikey='apikey' "
+            "hostnames='node1' poll_interval='0.5' poll_backoff='1.5' "
+            "poll_deadline='30' "
+            "op monitor interval=25 start-delay=25 "
+            "timeout=25",
+            failure_is_fatal=True)
+
     @mock.patch.object(utils, 'remove_legacy_maas_stonith_resources')
     @mock.patch('pcmk.commit')
     @mock.patch('pcmk.is_resource_present')
@@ -990,11 +1216,13 @@ class UtilsTestCase(unittest.TestCase):
 
     @mock.patch('pcmk.commit')
     @mock.patch('pcmk.list_nodes')
+    @mock.patch.object(utils, 'config')
     @mock.patch.object(utils, 'add_location_rules_for_local_nodes')
     @mock.patch.object(utils, 'need_resources_on_remotes')
     def test_configure_resources_on_remotes(self, need_resources_on_remotes,
                                             add_location_rules_for_local_nodes,
-                                            list_nodes, commit):
+                                            config, list_nodes, commit):
+        config.return_value = None
         list_nodes.return_value = ['node1', 'node2', 'node3']
         need_resources_on_remotes.return_value = False
         clones = {
@@ -1022,6 +1250,39 @@ class UtilsTestCase(unittest.TestCase):
             '--meta --parameter-value 3',
             failure_is_fatal=True)
 
+    @mock.patch('pcmk.commit')
+    @mock.patch('pcmk.list_nodes')
+    @mock.patch.object(utils, 'config')
+    @mock.patch.object(utils, 'add_location_rules_for_pacemaker_remotes')
+    @mock.patch.object(utils, 'add_location_rule_for_local_nodes')
+    @mock.patch.object(utils, 'add_location_rules_for_local_nodes')
+    @mock.patch.object(utils, 'need_resources_on_remotes')
+    def test_configure_resources_on_remotes_rule(
+            self,
+            need_resources_on_remotes,
+            add_location_rules_for_local_nodes,
+            add_location_rule_for_local_nodes,
+            add_location_rules_for_pacemaker_remotes,
+            config,
+            list_nodes,
+            commit):
+        config.side_effect = lambda key: key == 'local_node_location_rule'
+        list_nodes.return_value = ['node1', 'node2', 'node3']
+        need_resources_on_remotes.return_value = False
+        utils.configure_resources_on_remotes(
+            resources={
+                'res_masakari_flump': 'ocf:heartbeat:IPaddr2',
+                'res_masakari_haproxy': 'lsb:haproxy',
+                'res_node4': 'ocf:pacemaker:remote'},
+            clones={'cl_res_masakari_haproxy': 'res_masakari_haproxy'},
+            groups={})
+        add_location_rule_for_local_nodes.assert_has_calls([
+            mock.call('res_masakari_flump'),
+            mock.call('cl_res_masakari_haproxy')])
+        self.assertFalse(add_location_rules_for_local_nodes.called)
+        add_location_rules_for_pacemaker_remotes.assert_called_once_with(
+            ['res_node4'])
+
     @mock.patch('pcmk.commit')
     @mock.patch('pcmk.list_nodes')
     @mock.patch.object(utils, 'add_location_rules_for_local_nodes')
@@ -1074,15 +1335,30 @@ class UtilsTestCase(unittest.TestCase):
             groups=groups)
         self.assertFalse(commit.called)
 
+    @mock.patch('pcmk.get_cib_snapshot')
+    @mock.patch('pcmk.set_property')
     @mock.patch('pcmk.commit')
-    def test_configure_global_cluster(self, mock_commit):
+    def test_configure_global_cluster(self, mock_commit, mock_set_property,
+                                      mock_get_cib_snapshot):
+        snapshot = mock_get_cib_snapshot.return_value
+        snapshot.nvpairs.return_value = {'resource-stickiness': '100'}
         utils.configure_cluster_global(240, 120)
-        mock_commit.assert_has_calls([
-            mock.call('crm configure property no-quorum-policy=stop'),
-            mock.call('crm configure rsc_defaults $id="rsc-options" '
-                      'resource-stickiness="100" failure-timeout=240'),
-            mock.call('crm configure property cluster-recheck-interval=120')
+        mock_set_property.assert_has_calls([
+            mock.call('no-quorum-policy', 'stop', failure_is_fatal=False),
+            mock.call('cluster-recheck-interval', 120,
+                      failure_is_fatal=False)
         ])
+        mock_commit.assert_called_once_with(
+            'crm configure rsc_defaults $id="rsc-options" '
+            'resource-stickiness="100" failure-timeout=240')
+        snapshot.nvpairs.assert_called_once_with('rsc-options')
+
+        # the resource defaults are already set
+        mock_commit.reset_mock()
+        snapshot.nvpairs.return_value = {'resource-stickiness': '100',
+                                         'failure-timeout': '240'}
+        utils.configure_cluster_global(240, 120)
+        mock_commit.assert_not_called()
 
     class MockHookData(object):
         class MockDB(object):
@@ -1256,19 +1532,122 @@ class UtilsTestCase(unittest.TestCase):
         self.assertFalse(
             utils.is_stonith_configured())
 
-    @mock.patch('pcmk.commit')
-    def test_enable_stonith(self, commit):
+    @mock.patch('pcmk.set_property')
+    def test_enable_stonith(self, set_property):
         utils.enable_stonith()
-        commit.assert_called_once_with(
-            'crm configure property stonith-enabled=true',
-            failure_is_fatal=True)
+        set_property.assert_called_once_with('stonith-enabled', 'true')
 
-    @mock.patch('pcmk.commit')
-    def test_disable_stonith(self, commit):
+    @mock.patch('pcmk.check_call')
+    @mock.patch.object(utils.unitdata, 'kv')
+    @mock.patch.object(utils, 'charm_dir')
+    @mock.patch.object(utils, 'init_is_systemd')
+    @mock.patch.object(utils, 'config')
+    def test_configure_status_snapshot(self, config, init_is_systemd,
+                                       charm_dir, kv, check_call):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        snapshot = os.path.join(tmpdir, 'cluster-status.json')
+        cfg = {'status_snapshot_ttl': 30}
+        config.side_effect = lambda key: cfg.get(key)
+        kv.return_value = test_utils.FakeKvStore()
+        init_is_systemd.return_value = True
+        charm_dir.return_value = '/var/lib/juju/agents/unit-hacluster-0/charm'
+        with mock.patch.object(utils, 'SYSTEMD_UNIT_DIR', tmpdir), \
+                mock.patch.object(utils.pcmk, 'STATUS_SNAPSHOT', snapshot), \
+                mock.patch.object(utils, 'render') as render, \
+                mock.patch.object(utils, 'write_file', write_file):
+            render.side_effect = lambda source, context: source
+            utils.configure_status_snapshot()
+            render.assert_has_calls([
+                mock.call('hacluster-status-snapshot.service', {
+                    'collector': '/var/lib/juju/agents/unit-hacluster-0/'
+                                 'charm/hooks/collect_status.py',
+                    'snapshot': snapshot,
+                    'state_db': utils.STATUS_SNAPSHOT_STATE_DB,
+                    'ttl': 30,
+                    'textfile': None,
+                    'interval': 15}),
+                mock.call('hacluster-status-snapshot.timer', mock.ANY)])
+            check_call.assert_has_calls([
+                mock.call(['systemctl', 'daemon-reload']),
+                mock.call(['systemctl', 'enable', '--now',
+                           'hacluster-status-snapshot.timer'])])
+            self.assertEqual(
+                sorted(os.listdir(tmpdir)),
+                ['hacluster-status-snapshot.service',
+                 'hacluster-status-snapshot.timer'])
+
+            write_file(snapshot, '{}')
+            write_file(os.path.join(tmpdir, 'cluster-status.xml'), '')
+            check_call.reset_mock()
+            cfg['status_snapshot_ttl'] = 0
+            utils.configure_status_snapshot()
+            check_call.assert_has_calls([
+                mock.call(['systemctl', 'disable', '--now',
+                           'hacluster-status-snapshot.timer']),
+                mock.call(['systemctl', 'daemon-reload'])])
+            self.assertEqual(os.listdir(tmpdir), [])
+
+            # nothing to remove
+            check_call.reset_mock()
+            utils.configure_status_snapshot()
+            self.assertFalse(check_call.called)
+
+    @mock.patch('pcmk.check_call')
+    @mock.patch.object(utils.unitdata, 'kv')
+    @mock.patch.object(utils, 'charm_dir')
+    @mock.patch.object(utils, 'init_is_systemd')
+    @mock.patch.object(utils, 'config')
+    def test_configure_status_snapshot_metrics(self, config, init_is_systemd,
+                                               charm_dir, kv, check_call):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        snapshot = os.path.join(tmpdir, 'cluster-status.json')
+        textfile_dir = os.path.join(tmpdir, 'textfile')
+        os.mkdir(textfile_dir)
+        textfile = os.path.join(textfile_dir, 'hacluster.prom')
+        cfg = {'status_snapshot_ttl': 0,
+               'prometheus_textfile_dir': textfile_dir}
+        config.side_effect = lambda key: cfg.get(key)
+        kv.return_value = test_utils.FakeKvStore()
+        init_is_systemd.return_value = True
+        charm_dir.return_value = '/var/lib/juju/agents/unit-hacluster-0/charm'
+        with mock.patch.object(utils, 'SYSTEMD_UNIT_DIR', tmpdir), \
+                mock.patch.object(utils.pcmk, 'STATUS_SNAPSHOT', snapshot), \
+                mock.patch.object(utils, 'render') as render, \
+                mock.patch.object(utils, 'write_file', write_file):
+            render.side_effect = lambda source, context: source
+            utils.configure_status_snapshot()
+            render.assert_any_call('hacluster-status-snapshot.service', {
+                'collector': '/var/lib/juju/agents/unit-hacluster-0/'
+                             'charm/hooks/collect_status.py',
+                'snapshot': snapshot,
+                'state_db': utils.STATUS_SNAPSHOT_STATE_DB,
+                'ttl': 0,
+                'textfile': textfile,
+                'interval': 15})
+            check_call.assert_any_call(
+                ['systemctl', 'enable', '--now',
+                 'hacluster-status-snapshot.timer'])
+
+            # the metrics are refreshed at least every 15s
+            render.reset_mock()
+            cfg['status_snapshot_ttl'] = 120
+            utils.configure_status_snapshot()
+            self.assertEqual(render.call_args[0][1]['interval'], 15)
+
+            # the textfile is removed with the option
+            write_file(textfile, '')
+            cfg['prometheus_textfile_dir'] = ''
+            utils.configure_status_snapshot()
+            self.assertFalse(os.path.exists(textfile))
+            self.assertEqual(render.call_args[0][1]['interval'], 60)
+
+    @mock.patch('pcmk.set_property')
+    def test_disable_stonith(self, set_property):
         utils.disable_stonith()
-        commit.assert_called_once_with(
-            'crm configure property stonith-enabled=false',
-            failure_is_fatal=True)
+        set_property.assert_called_once_with('stonith-enabled', 'false',
+                                             failure_is_fatal=True)
 
     @mock.patch('subprocess.check_output')
     def test_node_is_dc(self, mock_subprocess):
@@ -1278,6 +1657,25 @@ class UtilsTestCase(unittest.TestCase):
 
         self.assertTrue(utils.node_is_dc('juju-2eebcf-0'))
 
+    @mock.patch('pcmk.check_output')
+    @mock.patch('pcmk.read_status_snapshot')
+    def test_node_status_from_snapshot(self, read_status_snapshot,
+                                       check_output):
+        read_status_snapshot.return_value = {
+            'summary': {'current_dc': {'name': 'juju-2eebcf-0'}},
+            'nodes': {
+                'juju-2eebcf-0': {'standby': 'false',
+                                  'resources_running': '2'},
+                'juju-2eebcf-1': {'standby': 'true',
+                                  'resources_running': '0'}}}
+        self.assertTrue(utils.node_is_dc('juju-2eebcf-0'))
+        self.assertFalse(utils.node_is_dc('juju-2eebcf-1'))
+        self.assertTrue(utils.node_has_resources('juju-2eebcf-0'))
+        self.assertFalse(utils.node_has_resources('juju-2eebcf-1'))
+        self.assertFalse(utils.is_in_standby_mode('juju-2eebcf-0'))
+        self.assertTrue(utils.is_in_standby_mode('juju-2eebcf-1'))
+        self.assertFalse(check_output.called)
+
     @mock.patch.object(utils.unitdata, 'HookData')
     def test_is_update_ring_requested(self, HookData):
         hook_data = self.MockHookData()
@@ -0,0 +1,239 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+_maas = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                     '../files/ocf/maas'))
+if _maas not in sys.path:
+    sys.path.insert(1, _maas)
+
+# The MAAS client and requests_oauthlib are only installed on the units.
+sys.modules.setdefault('apiclient', mock.MagicMock())
+sys.modules.setdefault('requests_oauthlib', mock.MagicMock())
+import maas_dns  # noqa: E402
+from maasclient import apidriver  # noqa: E402
+
+MAAS_SERVER = 'http://maas:5240/MAAS'
+API_URL = MAAS_SERVER + '/api/2.0/'
+DNSRESOURCE = {'fqdn': 'ks.maas', 'id': 7,
+               'ip_addresses': [{'ip': '10.0.0.4'}]}
+
+
+def response(status_code=200, text=''):
+    return mock.Mock(status_code=status_code, text=text,
+                     content=text.encode())
+
+
+class TestMAASDNS(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.cache_file = os.path.join(tmpdir, 'maas_dns', 'cache.json')
+        patcher = mock.patch.object(apidriver.requests_oauthlib,
+                                    'OAuth1Session')
+        self.session = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.session.headers = {}
+        self.options = argparse.Namespace(
+            maas_server=MAAS_SERVER,
+            maas_credentials='consumer:token:secret',
+            maas_driver='session', fqdn='ks.maas', ip_address='10.0.0.5',
+            ttl=30, cache_file=self.cache_file, cache_ttl=300)
+
+    def write_cache(self, cache):
+        maas_dns.save_cache(self.cache_file, cache)
+
+    def read_cache(self):
+        return maas_dns.load_cache(self.cache_file)
+
+    @mock.patch.object(maas_dns.time, 'time')
+    def test_dnsresource_lookup(self, time):
+        time.return_value = 1000.0
+        self.session.request.return_value = response(
+            text=json.dumps([DNSRESOURCE]))
+        dns = maas_dns.MAASDNS(self.options)
+        self.assertFalse(dns.from_cache)
+        self.assertEqual(dns.dnsresource, DNSRESOURCE)
+        # the listing is filtered by the MAAS server
+        self.session.request.assert_called_once_with(
+            'GET', API_URL + 'dnsresources/',
+            timeout=apidriver.REQUEST_TIMEOUT, params={'fqdn': 'ks.maas'})
+        self.assertEqual(self.read_cache(),
+                         {'ks.maas': {'id': 7, 'time': 1000.0}})
+
+    @mock.patch.object(maas_dns.time, 'time')
+    def test_dnsresource_cache_hit(self, time):
+        self.write_cache({'ks.maas': {'id': 7, 'time': 1000.0}})
+        time.return_value = 1299.0
+        dns = maas_dns.MAASDNS(self.options)
+        self.assertTrue(dns.from_cache)
+        self.assertEqual(dns.dnsresource, {'id': 7, 'fqdn': 'ks.maas'})
+        self.assertFalse(self.session.request.called)
+
+        # expired
+        time.return_value = 1300.0
+        self.session.request.return_value = response(
+            text=json.dumps([DNSRESOURCE]))
+        dns = maas_dns.MAASDNS(self.options)
+        self.assertFalse(dns.from_cache)
+        self.assertEqual(self.read_cache(),
+                         {'ks.maas': {'id': 7, 'time': 1300.0}})
+
+        # disabled
+        self.options.cache_ttl = 0
+        self.session.request.reset_mock()
+        self.assertFalse(maas_dns.MAASDNS(self.options).from_cache)
+        self.session.request.assert_called_once()
+
+    @mock.patch.object(maas_dns, 'options', None)
+    @mock.patch.object(maas_dns, 'setup_logging')
+    @mock.patch.object(maas_dns.time, 'time')
+    def test_dnsresource_cache_stale(self, time, setup_logging):
+        self.write_cache({'ks.maas': {'id': 3, 'time': 1000.0},
+                          'glance.maas': {'id': 4, 'time': 1000.0}})
+        time.return_value = 1010.0
+        self.session.request.side_effect = [
+            # update of the cached id
+            response(404, 'Not Found'),
+            # lookup
+            response(text=json.dumps([DNSRESOURCE])),
+            # update of the id found
+            response(text='{"id": 7}'),
+        ]
+        argv = ['maas_dns.py', '--maas_server', MAAS_SERVER,
+                '--maas_credentials', 'consumer:token:secret',
+                '--fqdn', 'ks.maas', '--ip_address', '10.0.0.5',
+                '--cache_file', self.cache_file]
+        with mock.patch.object(maas_dns.sys, 'argv', argv):
+            maas_dns.dns_ha()
+        self.session.request.assert_has_calls([
+            mock.call('PUT', API_URL + 'dnsresources/3/',
+                      timeout=apidriver.REQUEST_TIMEOUT,
+                      data={'fqdn': 'ks.maas', 'ip_addresses': '10.0.0.5'}),
+            mock.call('GET', API_URL + 'dnsresources/',
+                      timeout=apidriver.REQUEST_TIMEOUT,
+                      params={'fqdn': 'ks.maas'}),
+            mock.call('PUT', API_URL + 'dnsresources/7/',
+                      timeout=apidriver.REQUEST_TIMEOUT,
+                      data={'fqdn': 'ks.maas', 'ip_addresses': '10.0.0.5'}),
+        ])
+        self.assertEqual(self.read_cache(),
+                         {'ks.maas': {'id': 7, 'time': 1010.0},
+                          'glance.maas': {'id': 4, 'time': 1000.0}})
+
+
+class TestRetryOnRequestError(unittest.TestCase):
+
+    def setUp(self):
+        for name in ('monotonic', 'sleep'):
+            patcher = mock.patch.object(maas_dns.time, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.monotonic.return_value = 100.0
+        patcher = mock.patch.object(maas_dns.random, 'uniform')
+        self.uniform = patcher.start()
+        self.addCleanup(patcher.stop)
+        # the longest delay
+        self.uniform.side_effect = lambda low, high: high
+
+    def test_full_jitter(self):
+        func = mock.Mock(__name__='func', side_effect=[
+            response(500), response(500), response(500), response(200)])
+        decorated = maas_dns.retry_on_request_error(retries=3, base_delay=2)(
+            func)
+        self.assertEqual(decorated('a', b=1).status_code, 200)
+        func.assert_has_calls([mock.call('a', b=1)] * 4)
+        self.uniform.assert_has_calls([mock.call(0, 2), mock.call(0, 4),
+                                       mock.call(0, 8)])
+        self.sleep.assert_has_calls([mock.call(2), mock.call(4),
+                                     mock.call(8)])
+
+        # no sleep when no delay is drawn
+        self.uniform.side_effect = None
+        self.uniform.return_value = 0
+        self.sleep.reset_mock()
+        func.side_effect = [response(500), response(200)]
+        self.assertEqual(decorated().status_code, 200)
+        self.assertFalse(self.sleep.called)
+
+    def test_max_delay(self):
+        func = mock.Mock(__name__='func', return_value=response(503))
+        decorated = maas_dns.retry_on_request_error(
+            retries=4, base_delay=2, codes=lambda: [503], max_delay=5)(func)
+        self.assertRaises(maas_dns.RetriesException, decorated)
+        self.assertEqual(func.call_count, 5)
+        self.uniform.assert_has_calls([mock.call(0, 2), mock.call(0, 4),
+                                       mock.call(0, 5), mock.call(0, 5)])
+
+    def test_connection_errors(self):
+        func = mock.Mock(__name__='func', side_effect=[
+            ConnectionRefusedError(), maas_dns.urllib.error.URLError('down'),
+            response(200)])
+        decorated = maas_dns.retry_on_request_error(retries=2, base_delay=1)(
+            func)
+        self.assertEqual(decorated().status_code, 200)
+        self.assertEqual(func.call_count, 3)
+
+        func.side_effect = TimeoutError()
+        func.reset_mock()
+        self.assertRaises(maas_dns.RetriesException, decorated)
+        self.assertEqual(func.call_count, 3)
+
+        # HTTP errors and other exceptions are not retried
+        http_error = maas_dns.urllib.error.HTTPError(
+            API_URL, 500, 'Internal error', {}, None)
+        for error in (http_error, KeyError('id')):
+            func.side_effect = error
+            func.reset_mock()
+            self.assertRaises(type(error), decorated)
+            func.assert_called_once_with()
+
+    @mock.patch.object(maas_dns, 'START_TIME', 90.0)
+    @mock.patch.object(maas_dns, 'options', None)
+    def test_deadline(self):
+        func = mock.Mock(__name__='func', return_value=response(500))
+        decorated = maas_dns.retry_on_request_error(
+            retries=10, base_delay=1, deadline=maas_dns.options_deadline)(
+                func)
+
+        # 90% of the 20s operation timeout from the start of the script
+        with mock.patch.dict(os.environ,
+                             {'OCF_RESKEY_CRM_meta_timeout': '20000'}):
+            self.assertEqual(maas_dns.options_deadline(), 108.0)
+            self.monotonic.side_effect = lambda: 90.0 + sum(
+                call[0][0] for call in self.sleep.call_args_list)
+            self.assertRaisesRegex(maas_dns.RetriesException,
+                                   'no time left to retry', decorated)
+        # the delays of 1, 2, 4 and 8s end before the deadline, 16s doesn't
+        self.sleep.assert_has_calls([mock.call(1), mock.call(2),
+                                     mock.call(4), mock.call(8)])
+        self.assertEqual(self.sleep.call_count, 4)
+        self.assertEqual(func.call_count, 5)
+
+        # no deadline without an operation timeout
+        with mock.patch.dict(os.environ):
+            os.environ.pop('OCF_RESKEY_CRM_meta_timeout', None)
+            self.assertIsNone(maas_dns.options_deadline())
+
+        maas_dns.options = argparse.Namespace(maas_deadline=5.0)
+        self.assertEqual(maas_dns.options_deadline(), 95.0)
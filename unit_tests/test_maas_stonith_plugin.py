@@ -0,0 +1,196 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import enum
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+_maas = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                     '../files/ocf/maas'))
+if _maas not in sys.path:
+    sys.path.insert(1, _maas)
+
+
+class PowerState(enum.Enum):
+    ON = 'on'
+    OFF = 'off'
+
+
+class CallError(Exception):
+    pass
+
+
+# python-libmaas and aiohttp are only installed on the units.
+_libmaas = mock.MagicMock()
+_libmaas.client.enum.PowerState = PowerState
+_libmaas.client.bones.CallError = CallError
+sys.modules['aiohttp'] = mock.MagicMock()
+sys.modules['maas'] = _libmaas
+sys.modules['maas.client'] = _libmaas.client
+sys.modules['maas.client.bones'] = _libmaas.client.bones
+import maas_stonith_plugin as plugin  # noqa: E402
+
+MAAS_URL = 'http://maas:5240/MAAS'
+
+
+def machine(hostname, system_id, power_state=PowerState.ON):
+    return mock.Mock(hostname=hostname, fqdn=hostname + '.maas',
+                     system_id=system_id, power_state=power_state)
+
+
+class TestMAASStonithPlugin(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        self.cache = os.path.join(tmpdir, 'hacluster', 'system-ids.json')
+        for patcher in (
+                mock.patch.object(plugin, 'SYSTEM_ID_CACHE', self.cache),
+                mock.patch.object(plugin.subprocess, 'call')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = mock.Mock()
+
+    def read_cache(self):
+        with open(self.cache) as f:
+            return json.load(f)
+
+    def test_get_machine_cache_miss(self):
+        node1 = machine('node1', 'abc123')
+        self.client.machines.list.return_value = [node1]
+        self.assertIs(plugin.get_machine(self.client, 'node1', MAAS_URL),
+                      node1)
+        self.client.machines.list.assert_called_once_with(
+            hostnames=['node1'])
+        self.assertFalse(self.client.machines.get.called)
+        self.assertEqual(self.read_cache(), {MAAS_URL: {'node1': 'abc123'}})
+
+        # no cache without the URL
+        os.remove(self.cache)
+        plugin.get_machine(self.client, 'node1')
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_get_machine_cache_hit(self):
+        plugin.save_system_ids({MAAS_URL: {'node1': 'abc123'}}, self.cache)
+        node1 = machine('node1', 'abc123')
+        self.client.machines.get.return_value = node1
+        self.assertIs(plugin.get_machine(self.client, 'node1', MAAS_URL),
+                      node1)
+        self.client.machines.get.assert_called_once_with(system_id='abc123')
+        self.assertFalse(self.client.machines.list.called)
+
+    def test_get_machine_cache_stale(self):
+        plugin.save_system_ids({MAAS_URL: {'node1': 'abc123',
+                                           'node2': 'def456'}}, self.cache)
+        node1 = machine('node1', 'ghi789')
+        self.client.machines.list.return_value = [node1]
+
+        # the machine was deleted
+        self.client.machines.get.side_effect = CallError('404 Not Found')
+        self.assertIs(plugin.get_machine(self.client, 'node1', MAAS_URL),
+                      node1)
+        self.assertEqual(self.read_cache(),
+                         {MAAS_URL: {'node1': 'ghi789', 'node2': 'def456'}})
+
+        # the system_id belongs to another machine now
+        self.client.machines.get.side_effect = None
+        self.client.machines.get.return_value = machine('node3', 'def456')
+        self.client.machines.list.return_value = [machine('node2', 'jkl012')]
+        plugin.get_machine(self.client, 'node2', MAAS_URL)
+        self.assertEqual(self.read_cache()[MAAS_URL]['node2'], 'jkl012')
+
+    def test_get_machine_cache_corrupt(self):
+        os.makedirs(os.path.dirname(self.cache))
+        for content in ('{"truncated', '["abc123"]'):
+            with open(self.cache, 'w') as f:
+                f.write(content)
+            self.client.machines.list.return_value = [
+                machine('node1', 'abc123')]
+            plugin.get_machine(self.client, 'node1', MAAS_URL)
+            self.assertFalse(self.client.machines.get.called)
+            self.assertEqual(self.read_cache(),
+                             {MAAS_URL: {'node1': 'abc123'}})
+
+    def test_get_machine_not_found(self):
+        self.client.machines.list.return_value = []
+        self.assertRaises(plugin.FindMachineException, plugin.get_machine,
+                          self.client, 'node1', MAAS_URL)
+        self.assertFalse(os.path.exists(self.cache))
+
+    def test_get_poll_config(self):
+        self.assertEqual(plugin.get_poll_config(), (0.5, 1.5, 30.0))
+        self.assertEqual(plugin.get_poll_config({'hostnames': 'node1'}),
+                         (0.5, 1.5, 30.0))
+        self.assertEqual(
+            plugin.get_poll_config({'poll_interval': '0.2',
+                                    'poll_backoff': '2',
+                                    'poll_deadline': '60'}),
+            (0.2, 2.0, 60.0))
+        # invalid values are replaced by the default, low ones raised
+        self.assertEqual(
+            plugin.get_poll_config({'poll_interval': 'fast',
+                                    'poll_backoff': '0.5',
+                                    'poll_deadline': '-1'}),
+            (0.5, 1.0, 0.0))
+
+    @mock.patch.object(plugin.time, 'sleep')
+    @mock.patch.object(plugin.time, 'monotonic')
+    def test_wait_for_power_state(self, monotonic, sleep):
+        node1 = machine('node1', 'abc123')
+        clock = [100.0]
+        monotonic.side_effect = lambda: clock[0]
+        sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+        # powered off between the third and fourth polls
+        states = iter([PowerState.ON] * 3 + [PowerState.OFF])
+        node1.refresh.side_effect = lambda: setattr(
+            node1, 'power_state', next(states))
+
+        self.assertEqual(
+            plugin.wait_for_power_state(node1, PowerState.OFF,
+                                        (0.5, 2.0, 30.0)),
+            3.5)
+        self.assertEqual(node1.refresh.call_count, 4)
+        sleep.assert_has_calls([mock.call(0.5), mock.call(1.0),
+                                mock.call(2.0)])
+
+        # already off, no wait
+        sleep.reset_mock()
+        node1.refresh.side_effect = None
+        self.assertEqual(
+            plugin.wait_for_power_state(node1, PowerState.OFF), 0.0)
+        self.assertFalse(sleep.called)
+
+    @mock.patch.object(plugin.time, 'sleep')
+    @mock.patch.object(plugin.time, 'monotonic')
+    def test_wait_for_power_state_timeout(self, monotonic, sleep):
+        node1 = machine('node1', 'abc123')
+        clock = [100.0]
+        monotonic.side_effect = lambda: clock[0]
+        sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+
+        self.assertRaises(plugin.MachinePowerException,
+                          plugin.wait_for_power_state, node1,
+                          PowerState.OFF, (1.0, 4.0, 10.0))
+        # the interval is capped and the last sleep ends at the deadline
+        sleep.assert_has_calls([mock.call(1.0), mock.call(4.0),
+                                mock.call(plugin.MAX_POLL_INTERVAL)])
+        self.assertEqual(clock[0], 110.0)
+        self.assertEqual(node1.refresh.call_count, 4)
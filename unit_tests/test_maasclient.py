@@ -0,0 +1,171 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+import requests
+
+_maas = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                     '../files/ocf/maas'))
+if _maas not in sys.path:
+    sys.path.insert(1, _maas)
+
+# The MAAS client and requests_oauthlib are only installed on the units.
+sys.modules['apiclient'] = mock.MagicMock()
+sys.modules['requests_oauthlib'] = mock.MagicMock()
+import maasclient  # noqa: E402
+from maasclient import apidriver  # noqa: E402
+
+API_URL = 'http://maas:5240/MAAS/api/2.0/'
+API_KEY = 'consumer:token:secret'
+
+
+def response(status_code=200, text=''):
+    return mock.Mock(status_code=status_code, text=text,
+                     content=text.encode())
+
+
+class TestSessionAPIDriver(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(apidriver.requests_oauthlib,
+                                    'OAuth1Session')
+        self.oauth_session = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.session = self.oauth_session.return_value
+        self.session.headers = {}
+        self.client = maasclient.MAASClient('http://maas:5240/MAAS', API_KEY,
+                                            driver='session')
+
+    def test_get_driver(self):
+        self.assertIsInstance(self.client.driver, apidriver.SessionAPIDriver)
+        self.assertIsInstance(
+            maasclient.MAASClient(API_URL, API_KEY).driver,
+            apidriver.APIDriver)
+        self.assertNotIsInstance(
+            maasclient.MAASClient(API_URL, API_KEY).driver,
+            apidriver.SessionAPIDriver)
+
+    def test_get(self):
+        self.session.request.return_value = response(
+            text='[{"fqdn": "ks.maas", "id": 7}]')
+        self.assertEqual(self.client.get_dnsresources('ks.maas'),
+                         [{'fqdn': 'ks.maas', 'id': 7}])
+        self.session.request.assert_called_once_with(
+            'GET', API_URL + 'dnsresources/',
+            timeout=apidriver.REQUEST_TIMEOUT, params={'fqdn': 'ks.maas'})
+        self.oauth_session.assert_called_once_with(
+            'consumer', signature_method='PLAINTEXT',
+            resource_owner_key='token', resource_owner_secret='secret')
+        self.assertEqual(self.session.headers['Accept'], 'application/json')
+
+        # the session is kept for the next requests
+        self.client.get_ipaddresses('10.0.0.5')
+        self.session.request.assert_called_with(
+            'GET', API_URL + 'ipaddresses/',
+            timeout=apidriver.REQUEST_TIMEOUT, params={'ip': '10.0.0.5'})
+        self.oauth_session.assert_called_once()
+
+    def test_get_not_ok(self):
+        self.session.request.return_value = response(404, 'Not Found')
+        resp = self.client.driver.get_dnsresources()
+        self.assertFalse(resp.ok)
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(self.client.get_dnsresources(), [])
+
+    def test_get_invalid_json(self):
+        self.session.request.return_value = response(text='<html></html>')
+        resp = self.client.driver.get_dnsresources()
+        self.assertFalse(resp.ok)
+        self.assertEqual(resp.data, b'<html></html>')
+        self.assertEqual(self.client.get_dnsresources(), [])
+
+    def test_get_request_error(self):
+        self.session.request.side_effect = requests.TooManyRedirects()
+        resp = self.client.driver.get_dnsresources()
+        self.assertFalse(resp.ok)
+        self.assertIsNone(resp.status_code)
+
+        # connection errors are left to the retries of the caller
+        self.session.request.side_effect = requests.ConnectionError()
+        self.assertRaises(requests.ConnectionError,
+                          self.client.driver.get_dnsresources)
+
+    def test_post(self):
+        self.session.request.return_value = response(text='{"id": 8}')
+        resp = self.client.create_dnsresource('ks.maas', '10.0.0.5', 30)
+        self.assertTrue(resp.ok)
+        self.assertEqual(resp.data, {'id': 8})
+        self.session.request.assert_called_once_with(
+            'POST', API_URL + 'dnsresources/',
+            timeout=apidriver.REQUEST_TIMEOUT, params=None,
+            data={'fqdn': b'ks.maas', 'ip_addresses': b'10.0.0.5',
+                  'address_ttl': 30})
+
+        self.client.create_ipaddress('10.0.0.5')
+        self.session.request.assert_called_with(
+            'POST', API_URL + 'ipaddresses/',
+            timeout=apidriver.REQUEST_TIMEOUT, params={'op': 'reserve'},
+            data={'ip_addresses': '10.0.0.5'})
+
+    def test_post_errors(self):
+        self.session.request.return_value = response(500, 'Internal error')
+        resp = self.client.create_ipaddress('10.0.0.5')
+        self.assertFalse(resp.ok)
+        self.assertEqual(resp.status_code, 500)
+
+        self.session.request.return_value = response(text='not json')
+        self.assertFalse(self.client.create_ipaddress('10.0.0.5').ok)
+
+        self.session.request.side_effect = requests.Timeout()
+        self.assertRaises(requests.Timeout, self.client.create_ipaddress,
+                          '10.0.0.5')
+
+    def test_put(self):
+        self.session.request.return_value = response(text='{"id": 7}')
+        resp = self.client.update_dnsresource(7, 'ks.maas', '10.0.0.5')
+        self.assertTrue(resp.ok)
+        self.assertEqual(resp.data, b'{"id": 7}')
+        self.session.request.assert_called_once_with(
+            'PUT', API_URL + 'dnsresources/7/',
+            timeout=apidriver.REQUEST_TIMEOUT,
+            data={'fqdn': 'ks.maas', 'ip_addresses': '10.0.0.5'})
+
+    def test_put_errors(self):
+        self.session.request.return_value = response(404, 'Not Found')
+        resp = self.client.update_dnsresource(7, 'ks.maas', '10.0.0.5')
+        self.assertFalse(resp.ok)
+        self.assertEqual(resp.status_code, 404)
+
+        self.session.request.side_effect = requests.TooManyRedirects()
+        resp = self.client.update_dnsresource(7, 'ks.maas', '10.0.0.5')
+        self.assertFalse(resp.ok)
+        self.assertIsNone(resp.status_code)
+
+        self.session.request.side_effect = requests.ConnectionError()
+        self.assertRaises(requests.ConnectionError,
+                          self.client.update_dnsresource, 7, 'ks.maas',
+                          '10.0.0.5')
+
+    @mock.patch.object(apidriver.requests, 'Session')
+    def test_no_api_key(self, session):
+        session.return_value.headers = {}
+        session.return_value.request.return_value = response(text='[]')
+        client = maasclient.MAASClient(API_URL, '', driver='session')
+        self.assertEqual(client.get_dnsresources(), [])
+        session.assert_called_once_with()
+        self.oauth_session.assert_not_called()
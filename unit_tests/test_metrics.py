@@ -0,0 +1,117 @@
+# Copyright 2026 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import metrics
+import test_pcmk
+
+COROSYNC_2_CFGTOOL = (
+    "Printing ring status.\n"
+    "Local node ID 1000\n"
+    "RING ID 0\n"
+    "\tid\t= 10.5.0.1\n"
+    "\tstatus\t= ring 0 active with no faults\n"
+    "RING ID 1\n"
+    "\tid\t= 10.6.0.1\n"
+    "\tstatus\t= Marking ringid 1 interface 10.6.0.1 FAULTY\n")
+
+COROSYNC_3_CFGTOOL = (
+    "Local node ID 1000, transport knet\n"
+    "LINK ID 0 udp\n"
+    "\taddr\t= 10.5.0.1\n"
+    "\tstatus:\n"
+    "\t\tnodeid:          1000:\tlocalhost\n"
+    "\t\tnodeid:          1001:\tconnected\n"
+    "\t\tnodeid:          1002:\tdisconnected\n")
+
+
+class TestMetrics(unittest.TestCase):
+
+    def samples(self, samples, metric):
+        return [(labels, value) for name, labels, value in samples
+                if name == metric]
+
+    def test_cluster_metrics(self):
+        samples = metrics.cluster_metrics(test_pcmk.CRM_STATUS_XML.decode())
+        self.assertEqual(self.samples(samples, 'hacluster_quorate'),
+                         [({}, 1)])
+        self.assertEqual(self.samples(samples, 'hacluster_dc_info'),
+                         [({'node': 'juju-424dd5-3'}, 1)])
+        self.assertIn(({'node': 'juju-424dd5-4', 'type': 'member'}, 1),
+                      self.samples(samples, 'hacluster_node_online'))
+        roles = self.samples(samples, 'hacluster_resource_role')
+        self.assertIn(({'resource': 'res_ks_haproxy', 'node': 'juju-424dd5-3',
+                        'role': 'Started'}, 1), roles)
+        # the stopped instances of the clone are counted in a single series
+        self.assertIn(({'resource': 'res_ks_haproxy', 'node': '',
+                        'role': 'Stopped'}, 1), roles)
+        self.assertIn(
+            ({'resource': 'res_ks_haproxy', 'node': 'juju-424dd5-3',
+              'operation': 'monitor'}, 0.043),
+            self.samples(samples, 'hacluster_resource_last_exec_seconds'))
+        self.assertIn(
+            ({'resource': 'res_ks_3cb88eb_vip', 'node': 'juju-424dd5-3'}, 0),
+            self.samples(samples, 'hacluster_resource_failcount'))
+
+    def test_corosync_metrics(self):
+        self.assertEqual(
+            metrics.corosync_metrics(COROSYNC_2_CFGTOOL),
+            [('hacluster_corosync_ring_up', {'ring': '0'}, 1),
+             ('hacluster_corosync_ring_up', {'ring': '1'}, 0)])
+        self.assertEqual(
+            metrics.corosync_metrics(COROSYNC_3_CFGTOOL),
+            [('hacluster_corosync_link_connected',
+              {'ring': '0', 'nodeid': '1000'}, 1),
+             ('hacluster_corosync_link_connected',
+              {'ring': '0', 'nodeid': '1001'}, 1),
+             ('hacluster_corosync_link_connected',
+              {'ring': '0', 'nodeid': '1002'}, 0)])
+
+    def test_format_metrics(self):
+        self.assertEqual(
+            metrics.format_metrics([
+                ('hacluster_resource_failcount',
+                 {'resource': 'res_"ks"', 'node': 'node1'}, float('inf')),
+                ('hacluster_quorate', {}, 1)]),
+            '# HELP hacluster_quorate Whether the cluster partition has '
+            'quorum.\n'
+            '# TYPE hacluster_quorate gauge\n'
+            'hacluster_quorate 1\n'
+            '# HELP hacluster_resource_failcount Fail count of the resource '
+            'on the node.\n'
+            '# TYPE hacluster_resource_failcount gauge\n'
+            'hacluster_resource_failcount{node="node1",'
+            'resource="res_\\"ks\\""} +Inf\n')
+
+    @mock.patch.object(metrics.pcmk, 'check_output')
+    def test_write_textfile(self, check_output):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'hacluster.prom')
+        check_output.side_effect = subprocess.CalledProcessError(
+            1, 'corosync-cfgtool', COROSYNC_2_CFGTOOL)
+        metrics.write_textfile(path, test_pcmk.CRM_STATUS_XML.decode())
+        self.assertEqual(os.listdir(tmpdir), ['hacluster.prom'])
+        with open(path) as f:
+            content = f.read()
+        self.assertIn('hacluster_corosync_ring_up{ring="1"} 0\n', content)
+        self.assertIn('hacluster_collect_timestamp_seconds ', content)
+        check_output.assert_called_once_with(['corosync-cfgtool', '-s'],
+                                             universal_newlines=True)
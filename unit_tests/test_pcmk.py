@@ -13,8 +13,11 @@
 # limitations under the License.
 
 from unittest import mock
+import json
 import pcmk
 import os
+import shutil
+import subprocess
 import tempfile
 import test_utils
 import unittest
@@ -75,6 +78,36 @@ CRM_CONFIGURE_SHOW_XML_MAINT_MODE_TRUE = '''<?xml version="1.0" ?>
 
 '''  # noqa
 
+CRM_CONFIGURE_SHOW_XML_RESOURCES = '''<?xml version="1.0" ?>
+<cib num_updates="1" dc-uuid="1002" update-origin="juju-34fde5-0" crm_feature_set="3.0.7" validate-with="pacemaker-1.2" update-client="cibadmin" epoch="1103" admin_epoch="0" cib-last-written="Fri Aug  4 13:45:06 2017" have-quorum="1">
+  <configuration>
+    <crm_config>
+      <cluster_property_set id="cib-bootstrap-options">
+        <nvpair name="stonith-enabled" value="false" id="cib-bootstrap-options-stonith-enabled"/>
+      </cluster_property_set>
+    </crm_config>
+    <nodes>
+      <node id="1002" uname="node1"/>
+    </nodes>
+    <resources>
+      <group id="grp_ks_vips">
+        <primitive id="res_ks_3cb88eb_vip" class="ocf" provider="heartbeat" type="IPaddr2">
+          <instance_attributes id="res_ks_3cb88eb_vip-instance_attributes">
+            <nvpair name="ip" value="10.5.0.100" id="res_ks_3cb88eb_vip-instance_attributes-ip"/>
+          </instance_attributes>
+        </primitive>
+      </group>
+      <clone id="cl_ks_haproxy">
+        <primitive id="res_ks_haproxy" class="lsb" type="haproxy"/>
+      </clone>
+    </resources>
+    <constraints>
+      <rsc_location id="loc-res_ks_haproxy-node1" rsc="res_ks_haproxy" score="0" node="node1"/>
+    </constraints>
+  </configuration>
+</cib>
+'''  # noqa
+
 CRM_NODE_STATUS_XML = b'''
 <nodes>
   <node id="1000" uname="juju-982848-zaza-ce47c58f6c88-10"/>
@@ -159,85 +192,563 @@ juju-3f6cb6-zaza-4135aa8b2509-8.project.serverstack: member
 class TestPcmk(unittest.TestCase):
     def setUp(self):
         self.tmpfile = tempfile.NamedTemporaryFile(delete=False)
+        pcmk.invalidate_cib_snapshot()
+        backend = mock.patch.object(pcmk, '_backend', pcmk.CrmshBackend())
+        backend.start()
+        self.addCleanup(backend.stop)
+        versions = mock.patch.dict(pcmk._versions, clear=True)
+        versions.start()
+        self.addCleanup(versions.stop)
+        stats = mock.patch.object(pcmk, '_command_stats', [])
+        stats.start()
+        self.addCleanup(stats.stop)
 
     def tearDown(self):
         os.remove(self.tmpfile.name)
+        pcmk.invalidate_cib_snapshot()
 
-    @mock.patch('subprocess.getstatusoutput')
-    def test_crm_res_running_true(self, getstatusoutput):
-        getstatusoutput.return_value = (0, ("resource res_nova_consoleauth is "
-                                            "running on: juju-xxx-machine-6"))
-        self.assertTrue(pcmk.crm_res_running('res_nova_consoleauth'))
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_crm_res_running_true(self, crm_mon_xml):
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
+        self.assertTrue(pcmk.crm_res_running('res_ks_3cb88eb_vip'))
+        self.assertTrue(pcmk.crm_res_running('grp_ks_vips'))
+        self.assertTrue(pcmk.crm_res_running('res_ks_haproxy'))
+        self.assertTrue(pcmk.crm_res_running('cl_ks_haproxy'))
+        crm_mon_xml.assert_called_once_with()
 
-    @mock.patch('subprocess.getstatusoutput')
-    def test_crm_res_running_stopped(self, getstatusoutput):
-        getstatusoutput.return_value = (0, ("resource res_nova_consoleauth is "
-                                            "NOT running"))
-        self.assertFalse(pcmk.crm_res_running('res_nova_consoleauth'))
+    @mock.patch.dict(pcmk._status_snapshots, clear=True)
+    @mock.patch.object(pcmk, '_cluster_changed_at', 0)
+    @mock.patch.object(pcmk, 'crm_mon_version')
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_status_snapshot(self, crm_mon_xml, crm_mon_version):
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
+        crm_mon_version.return_value = StrictVersion('2.0.3')
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'hacluster', 'cluster-status.json')
+        self.assertIsNone(pcmk.read_status_snapshot(path))
 
-    @mock.patch('subprocess.getstatusoutput')
-    def test_crm_res_running_undefined(self, getstatusoutput):
-        getstatusoutput.return_value = (1, "foobar")
+        with mock.patch.object(pcmk.time, 'time', return_value=1000.0):
+            pcmk.collect_status_snapshot(60, path)
+        crm_mon_xml.assert_called_once_with(StrictVersion('2.0.3'))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))),
+                         ['cluster-status.json', 'cluster-status.xml'])
+
+        with mock.patch.object(pcmk.time, 'time', return_value=1030.0), \
+                mock.patch.object(pcmk.json, 'load',
+                                  wraps=pcmk.json.load) as load:
+            status = pcmk.read_status_snapshot(path)
+            # parsed again only once the file has been replaced
+            self.assertIs(pcmk.read_status_snapshot(path), status)
+            load.assert_called_once()
+            xml = pcmk.read_status_xml(path)
+        self.assertEqual(status['timestamp'], 1000.0)
+        self.assertEqual(status['ttl'], 60)
+        self.assertEqual(status['crm_mon_version'], '2.0.3')
+        self.assertEqual(status['summary']['current_dc']['name'],
+                         'juju-424dd5-3')
+        self.assertEqual(status['running']['res_ks_haproxy'],
+                         ['juju-424dd5-3', 'juju-424dd5-5', 'juju-424dd5-4'])
+        self.assertEqual(status['failed'], [])
+        self.assertNotIn('resources', status)
+        self.assertNotIn('history', status)
+        self.assertNotIn('xml', status)
+        self.assertEqual(xml, CRM_STATUS_XML.decode())
+
+        # expired
+        with mock.patch.object(pcmk.time, 'time', return_value=1061.0):
+            self.assertIsNone(pcmk.read_status_snapshot(path))
+            self.assertIsNone(pcmk.read_status_xml(path))
+
+        # outdated by a change made by this process
+        with mock.patch.object(pcmk.time, 'time', return_value=1010.0):
+            pcmk.invalidate_cib_snapshot()
+            self.assertIsNone(pcmk.read_status_snapshot(path))
+
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    @mock.patch.object(pcmk, 'read_status_snapshot')
+    def test_cluster_status_from_snapshot(self, read_status_snapshot,
+                                          crm_mon_xml):
+        read_status_snapshot.return_value = {
+            'crm_mon_version': '2.0.3',
+            'summary': {'current_dc': {'name': 'node1'}},
+            'nodes': {'node1': {'online': 'true'}},
+            'running': {'res_ks_vip': ['node1'],
+                        'res_ks_haproxy': ['node1', 'node2']},
+            'failed': ['res_ks_foo'],
+            'timestamp': 1000.0,
+            'ttl': 60}
+        self.assertEqual(
+            pcmk.cluster_status(resources=False, history=False),
+            {'crm_mon_version': '2.0.3',
+             'summary': {'current_dc': {'name': 'node1'}},
+             'nodes': {'node1': {'online': 'true'}}})
+        self.assertTrue(pcmk.crm_res_running('res_ks_vip'))
+        self.assertEqual(pcmk.failed_resources(), {'res_ks_foo'})
+        self.assertTrue(pcmk.crm_res_running_on_node('res_ks_vip', 'node2'))
+        self.assertTrue(pcmk.crm_res_running_on_node('res_ks_haproxy',
+                                                     'node2'))
+        self.assertFalse(pcmk.crm_res_running_on_node('res_ks_haproxy',
+                                                      'node3'))
+        self.assertFalse(pcmk.crm_res_running_on_node('res_ks_foo', 'node1'))
+        self.assertFalse(crm_mon_xml.called)
+
+    def test_summarize_operation_history(self):
+        summary = pcmk.summarize_operation_history(CRM_STATUS_XML.decode())
+        self.assertEqual(
+            summary['res_ks_haproxy']['monitor_5000ms'],
+            {'count': 3, 'failures': 0, 'last_rc': '0',
+             'exec_time_ms': {'p50': 43, 'p95': 49, 'max': 49},
+             'queue_time_ms': {'p50': 0, 'p95': 0, 'max': 0}})
+        self.assertEqual(summary['res_ks_haproxy']['probe']['count'], 6)
+
+        summary = pcmk.summarize_operation_history("""<pacemaker-result>
+  <node_history>
+    <node name="node1">
+      <resource_history id="res_foo:0" fail-count="1">
+        <operation_history call="5" task="probe" exec-time="20ms"
+                           queue-time="0ms" rc="7"/>
+        <operation_history call="9" task="start" exec-time="1500ms"
+                           queue-time="2ms" rc="1"/>
+      </resource_history>
+    </node>
+    <node name="node2">
+      <resource_history id="res_foo:1">
+        <operation_history call="12" task="start" exec-time="300ms"
+                           queue-time="1ms" rc="0"/>
+      </resource_history>
+    </node>
+    <node name="node3">
+      <resource_history id="res_foo:2">
+        <operation_history call="3" task="monitor" interval="0ms"
+                           exec-time="10ms" queue-time="0ms" rc="7"/>
+        <operation_history call="14" task="start" exec-time="200ms"
+                           queue-time="0ms" rc="7"/>
+      </resource_history>
+    </node>
+  </node_history>
+</pacemaker-result>""")
+        self.assertEqual(summary, {'res_foo': {
+            'probe': {
+                'count': 1, 'failures': 0, 'last_rc': '7',
+                'exec_time_ms': {'p50': 20, 'p95': 20, 'max': 20},
+                'queue_time_ms': {'p50': 0, 'p95': 0, 'max': 0}},
+            'monitor': {
+                'count': 1, 'failures': 0, 'last_rc': '7',
+                'exec_time_ms': {'p50': 10, 'p95': 10, 'max': 10},
+                'queue_time_ms': {'p50': 0, 'p95': 0, 'max': 0}},
+            # "not running" is a failure for a start
+            'start': {
+                'count': 3, 'failures': 2, 'last_rc': '7',
+                'exec_time_ms': {'p50': 300, 'p95': 1500, 'max': 1500},
+                'queue_time_ms': {'p50': 1, 'p95': 2, 'max': 2}}}})
+
+    @mock.patch.object(pcmk, 'crm_mon_version')
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_cluster_status_history_summary(self, crm_mon_xml,
+                                            crm_mon_version):
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
+        crm_mon_version.return_value = StrictVersion('2.0.3')
+        status = pcmk.cluster_status(resources=False, history_summary=True)
+        self.assertNotIn('history', status)
+        self.assertEqual(
+            status['history_summary']['res_ks_3cb88eb_vip']['start']['count'],
+            1)
+        crm_mon_xml.assert_called_once_with(StrictVersion('2.0.3'))
+
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_failed_resources(self, crm_mon_xml):
+        crm_mon_xml.return_value = """<pacemaker-result>
+  <resources>
+    <resource id="juju-3ff82c-1" resource_agent="ocf::pacemaker:remote"
+              role="Stopped" active="false" failed="true"/>
+    <clone id="cl_ks_haproxy">
+      <resource id="res_ks_haproxy:0" active="true" failed="true"
+                role="Started"/>
+      <resource id="res_ks_haproxy:1" active="true" failed="false"
+                role="Started"/>
+    </clone>
+    <resource id="res_ks_vip" active="true" failed="false" role="Started">
+      <node name="node1" id="1000" cached="true"/>
+    </resource>
+  </resources>
+  <failures>
+    <failure op_key="juju-3ff82c-2_monitor_30000" node="node1"
+             exitstatus="error" exitreason="" exitcode="1" call="3"
+             status="Error"/>
+  </failures>
+</pacemaker-result>"""
+        self.assertEqual(
+            pcmk.failed_resources(),
+            {'juju-3ff82c-1', 'juju-3ff82c-2', 'res_ks_haproxy'})
+        self.assertTrue(pcmk.crm_res_running('res_ks_vip'))
+        crm_mon_xml.assert_called_once_with()
+
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_crm_res_running_stopped(self, crm_mon_xml):
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
+        self.assertFalse(pcmk.crm_res_running('res_ks_stopped'))
+
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_crm_res_running_undefined(self, crm_mon_xml):
+        crm_mon_xml.side_effect = subprocess.CalledProcessError(
+            1, 'crm_mon', 'foobar')
+        self.assertFalse(pcmk.crm_res_running('res_nova_consoleauth'))
         self.assertFalse(pcmk.crm_res_running('res_nova_consoleauth'))
+        # failures are not cached.
+        self.assertEqual(crm_mon_xml.call_count, 2)
 
-    @mock.patch('subprocess.getstatusoutput')
-    def test_crm_res_running_on_node(self, getstatusoutput):
-        _resource = "res_nova_consoleauth"
-        _this_node = "node1"
-        _another_node = "node5"
+    @mock.patch('subprocess.check_output')
+    def test_crm_opt_exists(self, check_output):
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML_RESOURCES
+        self.assertTrue(pcmk.crm_opt_exists('res_ks_haproxy'))
+        self.assertTrue(pcmk.crm_opt_exists('loc-res_ks_haproxy-node1'))
+        self.assertFalse(pcmk.crm_opt_exists('res_ks'))
+        self.assertFalse(pcmk.crm_opt_exists('res_ks_haproxy_2'))
+        check_output.assert_called_once_with(
+            ['crm', 'configure', 'show', 'xml'], universal_newlines=True)
+
+    @mock.patch('subprocess.check_output')
+    def test_crm_opt_exists_failure(self, check_output):
+        check_output.side_effect = subprocess.CalledProcessError(
+            1, 'crm', 'ERROR: running cibadmin -Ql: Connection refused')
+        self.assertFalse(pcmk.crm_opt_exists('res_ks_haproxy'))
+
+    @mock.patch('subprocess.check_output')
+    def test_configured_locations(self, check_output):
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML_RESOURCES
+        self.assertEqual(
+            pcmk.configured_locations(),
+            {'loc-res_ks_haproxy-node1': ('res_ks_haproxy', '0', 'node1')})
+
+    @mock.patch('subprocess.check_output')
+    def test_is_resource_present(self, check_output):
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML_RESOURCES
+        self.assertTrue(pcmk.is_resource_present('res_ks_haproxy'))
+        self.assertTrue(pcmk.is_resource_present('cl_ks_haproxy'))
+        self.assertTrue(pcmk.is_resource_present('grp_ks_vips'))
+        self.assertFalse(pcmk.is_resource_present('loc-res_ks_haproxy-node1'))
+        self.assertFalse(pcmk.is_resource_present('res_foo'))
+        self.assertEqual(check_output.call_count, 1)
+
+    @mock.patch('subprocess.call')
+    @mock.patch('subprocess.check_output')
+    def test_cib_snapshot_invalidated_on_commit(self, check_output, call):
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML
+        call.return_value = 0
+        self.assertFalse(pcmk.crm_opt_exists('res_ks_haproxy'))
+        self.assertFalse(pcmk.crm_opt_exists('res_ks_haproxy'))
+        self.assertEqual(check_output.call_count, 1)
+
+        pcmk.commit('crm -w -F configure primitive res_ks_haproxy '
+                    'lsb:haproxy')
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML_RESOURCES
+        self.assertTrue(pcmk.crm_opt_exists('res_ks_haproxy'))
+        self.assertEqual(check_output.call_count, 2)
+
+    @mock.patch.object(pcmk, 'commit')
+    def test_configure_batch(self, commit):
+        commit.return_value = 0
+        batch = pcmk.ConfigureBatch()
+        self.assertEqual(batch.add('primitive res_foo ocf:heartbeat:Dummy'),
+                         0)
+        self.assertEqual(batch.add('location Ping-res_foo res_foo rule '
+                                   '-inf: pingd lte 0', wait=False), 0)
+        commit.assert_not_called()
+
+        with mock.patch.object(pcmk.tempfile, 'NamedTemporaryFile',
+                               side_effect=lambda: self.tmpfile):
+            self.assertEqual(batch.commit(), 0)
+
+        commit.assert_called_once_with(
+            'crm -w -F configure load update {}'.format(self.tmpfile.name))
+        with open(self.tmpfile.name) as f:
+            self.assertEqual(
+                f.read(),
+                'primitive res_foo ocf:heartbeat:Dummy\n'
+                'location Ping-res_foo res_foo rule -inf: pingd lte 0\n')
+        self.assertEqual(batch.directives, [])
+
+        # nothing left to commit
+        commit.reset_mock()
+        self.assertEqual(batch.commit(), 0)
+        commit.assert_not_called()
+
+    @mock.patch.object(pcmk, 'commit')
+    def test_configure_batch_failure(self, commit):
+        commit.return_value = 1
+        batch = pcmk.ConfigureBatch()
+        batch.add('primitive res_foo ocf:heartbeat:Dummy')
+        self.assertEqual(batch.commit(), 1)
+        self.assertEqual(batch.directives,
+                         ['primitive res_foo ocf:heartbeat:Dummy'])
+
+    @mock.patch.object(pcmk, 'commit')
+    def test_configure_batch_disabled(self, commit):
+        commit.return_value = 0
+        batch = pcmk.ConfigureBatch(enabled=False)
+        batch.add('primitive res_foo ocf:heartbeat:Dummy')
+        batch.add('location Ping-res_foo res_foo rule -inf: pingd lte 0',
+                  wait=False)
+        commit.assert_has_calls([
+            mock.call('crm -w -F configure primitive res_foo '
+                      'ocf:heartbeat:Dummy'),
+            mock.call('crm -F configure location Ping-res_foo res_foo rule '
+                      '-inf: pingd lte 0')])
+        self.assertEqual(batch.commit(), 0)
+        self.assertEqual(commit.call_count, 2)
+
+    def test_desired_cib_objects(self):
+        desired = pcmk.desired_cib_objects(
+            resources={'res_foo': 'ocf:heartbeat:IPaddr2',
+                       'res_bar': 'lsb:haproxy'},
+            resource_params={'res_foo': 'params ip=10.0.0.10'},
+            groups={'grp_foo': 'res_foo'},
+            clones={'cl_bar': 'res_bar'},
+            locations={'loc_foo': 'grp_foo 100: node1'},
+            monitor_host=True)
+        self.assertEqual(list(desired.items()), [
+            ('res_foo',
+             'primitive res_foo ocf:heartbeat:IPaddr2 params ip=10.0.0.10'),
+            ('res_bar', 'primitive res_bar lsb:haproxy'),
+            ('Ping-res_foo',
+             'location Ping-res_foo res_foo rule -inf: pingd lte 0'),
+            ('Ping-res_bar',
+             'location Ping-res_bar res_bar rule -inf: pingd lte 0'),
+            ('grp_foo', 'group grp_foo res_foo'),
+            ('cl_bar', 'clone cl_bar res_bar'),
+            ('loc_foo', 'location loc_foo grp_foo 100: node1')])
+
+    @mock.patch.object(pcmk, 'crm_opt_exists')
+    def test_diff_cib_objects(self, crm_opt_exists):
+        crm_opt_exists.side_effect = lambda name: name in [
+            'res_foo', 'res_bar', 'grp_old', 'loc_gone']
+        desired = {'res_foo': 'primitive res_foo ocf:heartbeat:Dummy',
+                   'res_bar': 'primitive res_bar ocf:heartbeat:Dummy',
+                   'res_new': 'primitive res_new ocf:heartbeat:Dummy'}
+        applied = pcmk.cib_objects_digests({
+            'res_foo': 'primitive res_foo ocf:heartbeat:Dummy',
+            'res_bar': 'primitive res_bar ocf:heartbeat:Stateful',
+            'grp_old': 'group grp_old res_foo',
+            'loc_gone_from_cib': 'location loc_gone_from_cib res_foo '
+                                 '100: node1'})
+        self.assertEqual(pcmk.diff_cib_objects(desired, applied),
+                         pcmk.CIBObjectsDiff(add=['res_new'],
+                                             modify=['res_bar'],
+                                             delete=['grp_old']))
+
+    def _cib_with_objects(self, applied):
+        """CIB holding res_foo, grp_old and loc_old, applied as given."""
+        nvpairs = ''.join(
+            '<nvpair id="juju-hacluster-objects-{0}" name="{0}" '
+            'value="{1}"/>'.format(name, digest)
+            for name, digest in pcmk.cib_objects_digests(applied).items())
+        return (
+            '<cib><configuration><crm_config>'
+            '<cluster_property_set id="juju-hacluster-objects">{}'
+            '</cluster_property_set></crm_config><resources>'
+            '<primitive id="res_foo" class="ocf" provider="heartbeat" '
+            'type="Dummy"/>'
+            '<group id="grp_old"><primitive id="res_baz" class="ocf" '
+            'provider="heartbeat" type="Dummy"/></group>'
+            '</resources><constraints>'
+            '<rsc_location id="loc_old" rsc="grp_old" score="100" '
+            'node="node1"/>'
+            '</constraints></configuration></cib>'.format(nvpairs))
+
+    @mock.patch.object(pcmk, 'call')
+    @mock.patch('subprocess.check_output')
+    @mock.patch.object(pcmk, 'commit')
+    def test_apply_cib_objects(self, commit, check_output, call):
+        commit.return_value = 0
+        call.return_value = 0
+        check_output.return_value = self._cib_with_objects({
+            'res_foo': 'primitive res_foo ocf:heartbeat:Dummy',
+            'grp_old': 'group grp_old res_baz',
+            'loc_old': 'location loc_old grp_old 100: node1'})
+        desired = pcmk.desired_cib_objects(
+            resources={'res_foo': 'ocf:heartbeat:Dummy',
+                       'res_bar': 'ocf:heartbeat:Dummy'})
+
+        with mock.patch.object(tempfile, 'NamedTemporaryFile',
+                               side_effect=lambda: self.tmpfile):
+            self.assertEqual(pcmk.apply_cib_objects(desired), 0)
+
+        commit.assert_has_calls([
+            mock.call('crm -w -F configure load update {}'
+                      .format(self.tmpfile.name)),
+            mock.call('crm -w -F configure delete loc_old'),
+            mock.call('crm -w -F resource stop grp_old'),
+            mock.call('crm -w -F configure delete grp_old')])
+        self.assertEqual(commit.call_count, 4)
+        with open(self.tmpfile.name) as f:
+            self.assertEqual(f.read(),
+                             'primitive res_bar ocf:heartbeat:Dummy\n')
+        # the applied objects are recorded in the CIB.
+        cmd = call.call_args[0][0]
+        self.assertEqual(cmd[:4], ['cibadmin', '--replace', '--scope',
+                                   'crm_config'])
+        record = etree.fromstring(cmd[-1])
+        self.assertEqual(record.get('id'), 'juju-hacluster-objects')
+        self.assertEqual(
+            {nvpair.get('name'): nvpair.get('value') for nvpair in record},
+            pcmk.cib_objects_digests(desired))
+
+        # another unit, e.g. a new leader, finds the objects up to date.
+        commit.reset_mock()
+        call.reset_mock()
+        pcmk.invalidate_cib_snapshot()
+        check_output.return_value = self._cib_with_objects(
+            {'res_foo': 'primitive res_foo ocf:heartbeat:Dummy'})
+        self.assertEqual(pcmk.apply_cib_objects(
+            pcmk.desired_cib_objects(
+                resources={'res_foo': 'ocf:heartbeat:Dummy'})), 0)
+        commit.assert_not_called()
+        call.assert_not_called()
+        self.assertEqual(check_output.call_count, 2)
+
+    @mock.patch.object(pcmk, 'call')
+    @mock.patch('subprocess.check_output')
+    @mock.patch.object(pcmk, 'commit')
+    def test_apply_cib_objects_failure(self, commit, check_output, call):
+        call.return_value = 0
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML
+        desired = pcmk.desired_cib_objects(
+            resources={'res_foo': 'ocf:heartbeat:Dummy',
+                       'res_bar': 'ocf:heartbeat:Dummy'})
+
+        # without batch each object is created on its own, the failures
+        # are logged and left out of the record.
+        commit.side_effect = lambda cmd: 1 if 'res_foo' in cmd else 0
+        self.assertEqual(pcmk.apply_cib_objects(desired, batch=False), 0)
+        commit.assert_has_calls([
+            mock.call('crm -w -F configure primitive res_foo '
+                      'ocf:heartbeat:Dummy'),
+            mock.call('crm -w -F configure primitive res_bar '
+                      'ocf:heartbeat:Dummy')])
+        record = etree.fromstring(call.call_args[0][0][-1])
+        self.assertEqual([nvpair.get('name') for nvpair in record],
+                         ['res_bar'])
+
+        # the batch fails as a whole and nothing is recorded.
+        commit.reset_mock()
+        call.reset_mock()
+        commit.side_effect = None
+        commit.return_value = 1
+        pcmk.invalidate_cib_snapshot()
+        with mock.patch.object(tempfile, 'NamedTemporaryFile',
+                               side_effect=lambda: self.tmpfile):
+            self.assertEqual(pcmk.apply_cib_objects(desired), 1)
+        commit.assert_called_once_with(
+            'crm -w -F configure load update {}'.format(self.tmpfile.name))
+        call.assert_not_called()
+
+    @mock.patch('subprocess.check_output')
+    def test_cib_snapshot_nvpairs(self, check_output):
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML
+        snapshot = pcmk.get_cib_snapshot()
+        self.assertEqual(snapshot.nvpairs('rsc-options'),
+                         {'resource-stickiness': '100'})
+        self.assertEqual(
+            snapshot.nvpairs(pcmk.CLUSTER_OPTIONS_SET)['stonith-enabled'],
+            'false')
+        self.assertEqual(snapshot.nvpairs('missing'), {})
+
+    @mock.patch.object(pcmk, 'read_status_snapshot')
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_crm_res_running_on_node(self, crm_mon_xml, read_status_snapshot):
+        read_status_snapshot.return_value = None
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
 
         # Not running
-        getstatusoutput.return_value = (1, "foobar")
         self.assertFalse(
-            pcmk.crm_res_running_on_node(_resource, _this_node))
+            pcmk.crm_res_running_on_node('res_nova_consoleauth',
+                                         'juju-424dd5-3'))
 
-        # Running active/passive on some other node
-        getstatusoutput.return_value = (
-            0, "resource {} is running: {}".format(_resource, _another_node))
+        # Running active/passive on this node or some other node
         self.assertTrue(
-            pcmk.crm_res_running_on_node('res_nova_consoleauth', _this_node))
-
-        # Running active/passive on this node
-        getstatusoutput.return_value = (
-            0, "resource {} is running: {}".format(_resource, _this_node))
+            pcmk.crm_res_running_on_node('res_ks_3cb88eb_vip',
+                                         'juju-424dd5-3'))
         self.assertTrue(
-            pcmk.crm_res_running_on_node('res_nova_consoleauth', _this_node))
+            pcmk.crm_res_running_on_node('res_ks_3cb88eb_vip',
+                                         'juju-424dd5-4'))
 
-        # Running on some but not this node
-        getstatusoutput.return_value = (
-            0, ("resource {} is running: {}\nresource {} is NOT running"
-                .format(_resource, _another_node, _resource)))
+        # Running on more than one node, including this node or not
+        self.assertTrue(
+            pcmk.crm_res_running_on_node('cl_ks_haproxy', 'juju-424dd5-5'))
         self.assertFalse(
-            pcmk.crm_res_running_on_node('res_nova_consoleauth', _this_node))
+            pcmk.crm_res_running_on_node('res_ks_haproxy', 'juju-424dd5-6'))
 
-        # Running on this node and not others
-        getstatusoutput.return_value = (
-            0, ("resource {} is running: {}\nresource {} is NOT running"
-                .format(_resource, _this_node, _resource)))
-        self.assertTrue(
-            pcmk.crm_res_running_on_node('res_nova_consoleauth', _this_node))
+        # crm_mon is run once for all the checks
+        crm_mon_xml.assert_called_once_with()
 
-        # Running on more than one and this node
-        getstatusoutput.return_value = (
-            0, ("resource {} is running: {}\nresource {} is running: {}"
-                .format(_resource, _another_node, _resource, _this_node)))
-        self.assertTrue(
-            pcmk.crm_res_running_on_node('res_nova_consoleauth', _this_node))
+    def test_cluster_readiness(self):
+        xml = CRM_STATUS_XML.decode()
+        self.assertIsNone(pcmk.cluster_readiness(xml, 'juju-424dd5-3'))
+        self.assertIsNone(pcmk.cluster_readiness(xml, 'juju-424dd5-3',
+                                                 require_quorum=True))
+        self.assertEqual(pcmk.cluster_readiness(xml, 'node1'),
+                         'node node1 is not online')
+        self.assertEqual(pcmk.cluster_readiness(xml, 'unknown'),
+                         'node unknown is not online')
+
+        no_dc = xml.replace('<current_dc present="true"',
+                            '<current_dc present="false"')
+        self.assertEqual(pcmk.cluster_readiness(no_dc, 'juju-424dd5-3'),
+                         'no DC elected')
+        no_quorum = xml.replace('with_quorum="true"', 'with_quorum="false"')
+        self.assertIsNone(pcmk.cluster_readiness(no_quorum, 'juju-424dd5-3'))
+        self.assertEqual(pcmk.cluster_readiness(no_quorum, 'juju-424dd5-3',
+                                                require_quorum=True),
+                         'no quorum')
 
+    @mock.patch('time.sleep')
+    @mock.patch('time.monotonic')
     @mock.patch('socket.gethostname')
-    @mock.patch('subprocess.getstatusoutput')
-    def test_wait_for_pcmk(self, getstatusoutput, gethostname):
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_wait_for_pcmk(self, crm_mon_xml, gethostname, monotonic,
+                           sleep):
+        clock = [0]
+
+        def fake_sleep(seconds):
+            clock[0] += seconds
+
+        monotonic.side_effect = lambda: clock[0]
+        sleep.side_effect = fake_sleep
+        gethostname.return_value = 'juju-424dd5-3'
+
         # Pacemaker is down
-        gethostname.return_value = 'hanode-1'
-        getstatusoutput.return_value = (1, 'Not the hostname')
-        with self.assertRaises(pcmk.ServicesNotUp):
-            pcmk.wait_for_pcmk(retries=2, sleep=0)
+        crm_mon_xml.side_effect = subprocess.CalledProcessError(
+            102, 'crm_mon', output=b'Not connected')
+        with self.assertRaises(pcmk.ServicesNotUp) as ctxt:
+            pcmk.wait_for_pcmk(timeout=10)
+        self.assertIn('Last exit code: 102', str(ctxt.exception))
+        sleep.assert_has_calls([mock.call(0.5), mock.call(1), mock.call(2),
+                                mock.call(4)])
+        self.assertEqual(sleep.call_count, 4)
 
-        # Pacemaker is up
-        gethostname.return_value = 'hanode-1'
-        getstatusoutput.return_value = (0, 'Hosname: hanode-1')
-        # Here we are asserting that it doesn't raise anything:
-        pcmk.wait_for_pcmk(retries=2, sleep=0)
+        # Pacemaker is up after a couple of checks
+        sleep.reset_mock()
+        crm_mon_xml.side_effect = [
+            subprocess.CalledProcessError(102, 'crm_mon'),
+            CRM_STATUS_XML.decode().replace('<current_dc present="true"',
+                                            '<current_dc present="false"'),
+            CRM_STATUS_XML.decode()]
+        pcmk.wait_for_pcmk(timeout=10)
+        sleep.assert_has_calls([mock.call(0.5), mock.call(1)])
+        self.assertEqual(sleep.call_count, 2)
+
+    @mock.patch('time.sleep')
+    @mock.patch('socket.gethostname')
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    def test_wait_for_pcmk_lp1874719(self, crm_mon_xml, gethostname, sleep):
+        gethostname.return_value = 'node1'
+        crm_mon_xml.return_value = CRM_STATUS_XML.decode()
+        with self.assertRaises(pcmk.ServicesNotUp) as ctxt:
+            pcmk.wait_for_pcmk(timeout=0)
+        self.assertIn('node node1 is not online', str(ctxt.exception))
+        self.assertIn('lp:1874719', str(ctxt.exception))
+        sleep.assert_not_called()
 
     @mock.patch('subprocess.check_output')
     def test_crm_version(self, mock_check_output):
@@ -304,12 +815,30 @@ class TestPcmk(unittest.TestCase):
                                               'show', 'xml'],
                                              universal_newlines=True)
 
+    @mock.patch.object(pcmk, 'call')
+    @mock.patch('subprocess.check_output')
     @mock.patch('subprocess.check_call')
-    def test_set_property(self, mock_check_output):
+    def test_set_property(self, mock_check_call, mock_check_output,
+                          mock_call):
+        mock_check_output.return_value = CRM_CONFIGURE_SHOW_XML
         pcmk.set_property('maintenance-mode', 'false')
-        mock_check_output.assert_called_with(['crm', 'configure', 'property',
-                                              'maintenance-mode=false'],
-                                             universal_newlines=True)
+        mock_check_call.assert_called_with(['crm', 'configure', 'property',
+                                            'maintenance-mode=false'],
+                                           universal_newlines=True)
+
+        mock_call.return_value = 1
+        pcmk.set_property('stonith-enabled', True, failure_is_fatal=False)
+        mock_call.assert_called_with(['crm', 'configure', 'property',
+                                      'stonith-enabled=True'],
+                                     universal_newlines=True)
+
+        # the properties already set in the CIB are left alone.
+        mock_check_call.reset_mock()
+        mock_call.reset_mock()
+        pcmk.set_property('stonith-enabled', 'false')
+        pcmk.set_property('no-quorum-policy', 'stop', failure_is_fatal=False)
+        mock_check_call.assert_not_called()
+        mock_call.assert_not_called()
 
     @mock.patch.object(pcmk.unitdata, 'kv')
     @mock.patch('subprocess.call')
@@ -391,6 +920,133 @@ class TestPcmk(unittest.TestCase):
         )
         check_output.assert_called_with(['crm', 'node', 'show'])
 
+    @mock.patch('shutil.which')
+    def test_get_backend(self, which):
+        pcmk._backend = None
+        which.return_value = '/usr/sbin/cibadmin'
+        self.assertIsInstance(pcmk.get_backend(), pcmk.PacemakerBackend)
+        # the backend is only looked up once
+        which.return_value = None
+        self.assertIsInstance(pcmk.get_backend(), pcmk.PacemakerBackend)
+
+        pcmk._backend = None
+        self.assertIsInstance(pcmk.get_backend(), pcmk.CrmshBackend)
+        self.assertNotIsInstance(pcmk.get_backend(), pcmk.PacemakerBackend)
+
+    @mock.patch('subprocess.check_output')
+    def test_pacemaker_backend_crm_opt_exists(self, check_output):
+        pcmk._backend = pcmk.PacemakerBackend()
+        check_output.return_value = CRM_CONFIGURE_SHOW_XML_RESOURCES
+        self.assertTrue(pcmk.crm_opt_exists('grp_ks_vips'))
+        check_output.assert_called_once_with(['cibadmin', '--query'],
+                                             universal_newlines=True)
+
+    @mock.patch('subprocess.check_output')
+    def test_pacemaker_backend_list_nodes(self, check_output):
+        pcmk._backend = pcmk.PacemakerBackend()
+        check_output.return_value = CRM_NODE_STATUS_XML.decode()
+        self.assertSequenceEqual(
+            pcmk.list_nodes(),
+            [
+                'juju-982848-zaza-ce47c58f6c88-10',
+                'juju-982848-zaza-ce47c58f6c88-11',
+                'juju-982848-zaza-ce47c58f6c88-9'])
+        check_output.assert_called_once_with(
+            ['cibadmin', '--query', '--scope', 'nodes'],
+            universal_newlines=True)
+
+    @mock.patch('subprocess.check_output')
+    def test_pacemaker_backend_list_nodes_remote(self, check_output):
+        pcmk._backend = pcmk.PacemakerBackend()
+        check_output.return_value = (
+            '<nodes>'
+            '<node id="1000" uname="node1" type="member"/>'
+            '<node id="1001" uname="node2"/>'
+            '<node id="remote1" uname="remote1" type="remote"/>'
+            '</nodes>')
+        self.assertSequenceEqual(pcmk.list_nodes(), ['node1', 'node2'])
+
+    @mock.patch('subprocess.check_output')
+    def test_pacemaker_backend_get_property(self, check_output):
+        pcmk._backend = pcmk.PacemakerBackend()
+        check_output.return_value = 'false\n'
+        self.assertEqual('false\n', pcmk.get_property('maintenance-mode'))
+        check_output.assert_called_once_with(
+            ['crm_attribute', '--type', 'crm_config', '--name',
+             'maintenance-mode', '--query', '--quiet'],
+            universal_newlines=True)
+
+        check_output.side_effect = subprocess.CalledProcessError(6, 'cmd')
+        self.assertRaises(pcmk.PropertyNotFound, pcmk.get_property,
+                          'maintenance-mode')
+        check_output.side_effect = subprocess.CalledProcessError(105, 'cmd')
+        self.assertRaises(pcmk.PropertyNotFound, pcmk.get_property,
+                          'maintenance-mode')
+        check_output.side_effect = subprocess.CalledProcessError(1, 'cmd')
+        self.assertRaises(subprocess.CalledProcessError, pcmk.get_property,
+                          'maintenance-mode')
+
+    def test_command_verb(self):
+        self.assertEqual(pcmk.command_verb('crm -w -F configure delete foo'),
+                         'crm configure')
+        self.assertEqual(pcmk.command_verb(['crm_mon', '--output-as=xml']),
+                         'crm_mon')
+        self.assertEqual(pcmk.command_verb(['/usr/sbin/cibadmin', '-Q']),
+                         'cibadmin')
+        self.assertEqual(pcmk.command_verb([]), '')
+
+    @mock.patch('time.monotonic')
+    @mock.patch('subprocess.call')
+    @mock.patch('subprocess.check_output')
+    def test_command_stats(self, check_output, call, monotonic):
+        monotonic.side_effect = [0.0, 0.5, 1.0, 3.0, 3.0, 3.25]
+        check_output.side_effect = [
+            b'<cib/>', subprocess.CalledProcessError(6, 'crm_attribute')]
+        call.return_value = 1
+
+        self.assertEqual(pcmk.check_output(['cibadmin', '--query']),
+                         b'<cib/>')
+        self.assertEqual(pcmk.call(['crm', '-w', '-F', 'configure', 'delete',
+                                    'res_foo']), 1)
+        with self.assertRaises(subprocess.CalledProcessError):
+            pcmk.check_output(['crm_attribute', '--query'])
+
+        summary = pcmk.command_stats_summary(top=2)
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['time'], 2.75)
+        self.assertEqual(summary['verbs'], {
+            'cibadmin': {'count': 1, 'time': 0.5},
+            'crm configure': {'count': 1, 'time': 2.0},
+            'crm_attribute': {'count': 1, 'time': 0.25}})
+        self.assertEqual(summary['slowest'], [
+            {'cmd': 'crm -w -F configure delete res_foo', 'time': 2.0,
+             'returncode': 1, 'output_size': 0},
+            {'cmd': 'cibadmin --query', 'time': 0.5, 'returncode': 0,
+             'output_size': 6}])
+
+    @mock.patch.object(pcmk, 'local_unit')
+    @mock.patch('subprocess.getstatusoutput')
+    def test_report_command_stats(self, getstatusoutput, local_unit):
+        local_unit.return_value = 'hacluster/0'
+        getstatusoutput.return_value = (0, 'output')
+        pcmk.getstatusoutput('crm resource status res_foo')
+        stats_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, stats_dir)
+
+        pcmk.report_command_stats('update-status', stats_dir=stats_dir)
+        with open(os.path.join(
+                stats_dir,
+                'hacluster-0-update-status-command-stats.json')) as f:
+            stats = json.load(f)
+        self.assertEqual(stats['name'], 'update-status')
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(list(stats['verbs']), ['crm resource'])
+
+        # nothing saved when the directory doesn't exist.
+        pcmk.report_command_stats('update-status',
+                                  stats_dir=os.path.join(stats_dir, 'nope'))
+        self.assertEqual(len(os.listdir(stats_dir)), 1)
+
     def test_get_tag(self):
         """Test get element by tag if exists else empty element."""
         main = etree.Element("test")
@@ -429,6 +1085,34 @@ class TestPcmk(unittest.TestCase):
         mock_check_output.assert_called_with(["crm_mon", "--version"],
                                              universal_newlines=True)
 
+    @mock.patch.object(pcmk.unitdata, 'kv')
+    @mock.patch('os.stat')
+    @mock.patch('shutil.which')
+    @mock.patch('subprocess.check_output')
+    def test_crm_mon_version_cached(self, check_output, which, stat,
+                                    mock_kv):
+        db = test_utils.FakeKvStore()
+        mock_kv.return_value = db
+        which.return_value = '/usr/sbin/crm_mon'
+        stat.return_value.st_mtime = 1000.0
+        check_output.return_value = "Pacemaker 2.0.3\n"
+        self.assertEqual(pcmk.crm_mon_version(), StrictVersion("2.0.3"))
+        self.assertEqual(pcmk.crm_mon_version(), StrictVersion("2.0.3"))
+        self.assertEqual(check_output.call_count, 1)
+        self.assertEqual(db.get('pcmk-version-crm_mon'),
+                         {'mtime': 1000.0, 'version': '2.0.3'})
+
+        # a new hook execution reads the version from unitdata
+        pcmk._versions.clear()
+        self.assertEqual(pcmk.crm_mon_version(), StrictVersion("2.0.3"))
+        self.assertEqual(check_output.call_count, 1)
+
+        # pacemaker was upgraded
+        stat.return_value.st_mtime = 2000.0
+        check_output.return_value = "Pacemaker 2.1.2\n"
+        self.assertEqual(pcmk.crm_mon_version(), StrictVersion("2.1.2"))
+        self.assertEqual(check_output.call_count, 2)
+
     @mock.patch("subprocess.check_output", return_value=CRM_STATUS_XML)
     @mock.patch.object(pcmk, "crm_mon_version")
     def test_cluster_status(self, mock_crm_mon_version, mock_check_output):
@@ -478,6 +1162,65 @@ class TestPcmk(unittest.TestCase):
             "Tue Jan  5 09:04:11 2021"
         )
 
+    def test_parse_cluster_status_filtered(self):
+        """Test parse cluster status of some nodes and resources."""
+        status = pcmk.parse_cluster_status(
+            CRM_STATUS_XML.decode(), StrictVersion("2.0.3"),
+            resources=True, history=True,
+            only_nodes=["juju-424dd5-4"], only_resources=["res_ks_haproxy"])
+        self.assertEqual(list(status["nodes"]), ["juju-424dd5-4"])
+        self.assertEqual(status["resources"]["groups"], {})
+        self.assertEqual(list(status["resources"]["clones"]),
+                         ["cl_ks_haproxy"])
+        self.assertEqual(len(status["resources"]["clones"]["cl_ks_haproxy"]
+                             ["resources"]), 4)
+        self.assertEqual(list(status["history"]), ["juju-424dd5-4"])
+        self.assertEqual(list(status["history"]["juju-424dd5-4"]),
+                         ["res_ks_haproxy"])
+
+        # a group is reported with all its members when one is listed
+        status = pcmk.parse_cluster_status(
+            CRM_STATUS_XML.decode(), StrictVersion("2.0.3"),
+            only_resources=["res_ks_3cb88eb_vip"])
+        self.assertEqual(list(status["resources"]["groups"]), ["grp_ks_vips"])
+        self.assertEqual(status["resources"]["clones"], {})
+        self.assertEqual(len(status["nodes"]), 4)
+
+    def test_parse_cluster_status_streaming(self):
+        xml = CRM_STATUS_XML.decode()
+        for kwargs in ({"history": True},
+                       {"history": True, "only_nodes": ["juju-424dd5-4"],
+                        "only_resources": ["res_ks_haproxy"]},
+                       {"only_resources": ["res_ks_3cb88eb_vip"]}):
+            tree = pcmk.parse_cluster_status(xml, StrictVersion("2.0.3"),
+                                             **kwargs)
+            with mock.patch.object(pcmk, "STREAM_PARSE_THRESHOLD", 0), \
+                    mock.patch.object(pcmk, "iterparse",
+                                      wraps=pcmk.iterparse) as iterparse:
+                stream = pcmk.parse_cluster_status(
+                    xml, StrictVersion("2.0.3"), **kwargs)
+                iterparse.assert_called_once()
+            self.assertEqual(stream, tree)
+
+    @mock.patch.object(pcmk, 'crm_mon_xml')
+    @mock.patch.object(pcmk, 'read_status_xml')
+    @mock.patch.object(pcmk, 'read_status_snapshot')
+    def test_cluster_status_filtered_from_snapshot(self, read_status_snapshot,
+                                                   read_status_xml,
+                                                   crm_mon_xml):
+        read_status_snapshot.return_value = {
+            'crm_mon_version': '2.0.3',
+            'timestamp': 1000.0,
+            'ttl': 60}
+        read_status_xml.return_value = CRM_STATUS_XML.decode()
+        status = pcmk.cluster_status(resources=False,
+                                     only_nodes=['juju-424dd5-5'])
+        self.assertEqual(list(status['nodes']), ['juju-424dd5-5'])
+        status = pcmk.cluster_status(history=True)
+        self.assertIn('grp_ks_vips', status['resources']['groups'])
+        self.assertIn('res_ks_haproxy', status['history']['juju-424dd5-5'])
+        self.assertFalse(crm_mon_xml.called)
+
     def test_parse_version(self):
         """Test parse version from cmd output."""
         for cmd_output, exp_version in [